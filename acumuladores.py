@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+# Acumuladores que podem ser atualizados bloco a bloco e mesclados entre si.
+# Permitem calcular estatísticas de um conjunto de dados sem mantê-lo
+# inteiro em memória.
+
+
+class EstatisticasNumericas:
+    """Contagem, média e variância (Welford/Chan), mínimo e máximo."""
+
+    def __init__(self):
+        self.n = 0
+        self.media = 0.0
+        self.m2 = 0.0
+        self.minimo = np.nan
+        self.maximo = np.nan
+
+    def atualizar(self, valores):
+        valores = np.asarray(valores, dtype='float64')
+        valores = valores[~np.isnan(valores)]
+        if len(valores) == 0:
+            return self
+        media = valores.mean()
+        self._combinar(len(valores), media, ((valores - media) ** 2).sum(), valores.min(), valores.max())
+        return self
+
+    def mesclar(self, outro):
+        if outro.n:
+            self._combinar(outro.n, outro.media, outro.m2, outro.minimo, outro.maximo)
+        return self
+
+    def _combinar(self, n_b, media_b, m2_b, minimo_b, maximo_b):
+        n = self.n + n_b
+        delta = media_b - self.media
+        self.media += delta * n_b / n
+        self.m2 += m2_b + delta ** 2 * self.n * n_b / n
+        self.n = n
+        self.minimo = np.fmin(self.minimo, minimo_b)
+        self.maximo = np.fmax(self.maximo, maximo_b)
+
+    @property
+    def variancia(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else np.nan
+
+    @property
+    def desvio(self):
+        return np.sqrt(self.variancia)
+
+
+class SketchQuantis:
+    """Sketch de quantis aproximados por compactação em níveis (estilo KLL).
+
+    Cada nível guarda no máximo k valores; quando estoura, o nível é
+    ordenado e metade dos valores (alternados) sobe para o nível seguinte
+    com o dobro do peso. A memória fica em O(k log n).
+    """
+
+    def __init__(self, k=2000, seed=0):
+        self.k = k
+        self.n = 0
+        self.niveis = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def atualizar(self, valores):
+        valores = np.asarray(valores, dtype='float64')
+        valores = valores[~np.isnan(valores)]
+        self.n += len(valores)
+        self.niveis[0] = np.concatenate([self.niveis[0], valores])
+        self._compactar()
+        return self
+
+    def mesclar(self, outro):
+        self.n += outro.n
+        for nivel, valores in enumerate(outro.niveis):
+            if nivel == len(self.niveis):
+                self.niveis.append(np.empty(0))
+            self.niveis[nivel] = np.concatenate([self.niveis[nivel], valores])
+        self._compactar()
+        return self
+
+    def _compactar(self):
+        nivel = 0
+        while nivel < len(self.niveis):
+            valores = self.niveis[nivel]
+            if len(valores) > self.k:
+                valores = np.sort(valores)
+                # Com tamanho ímpar, o maior valor permanece no nível atual
+                corte = len(valores) - len(valores) % 2
+                resto, valores = valores[corte:], valores[:corte]
+                promovidos = valores[self.rng.integers(2)::2]
+                self.niveis[nivel] = resto
+                if nivel + 1 == len(self.niveis):
+                    self.niveis.append(np.empty(0))
+                self.niveis[nivel + 1] = np.concatenate([self.niveis[nivel + 1], promovidos])
+            nivel += 1
+
+    def quantis(self, qs):
+        valores = np.concatenate(self.niveis)
+        if len(valores) == 0:
+            return np.full(len(qs), np.nan)
+        pesos = np.concatenate([np.full(len(v), 2.0 ** nivel) for nivel, v in enumerate(self.niveis)])
+        ordem = np.argsort(valores, kind='stable')
+        acumulado = np.cumsum(pesos[ordem])
+        posicoes = np.searchsorted(acumulado, np.asarray(qs) * acumulado[-1], side='left')
+        return valores[ordem][np.minimum(posicoes, len(valores) - 1)]
+
+    def quantil(self, q):
+        return self.quantis([q])[0]
+
+
+class ContagemCategorias:
+    """Contagem por categoria, preservando a ordem da primeira ocorrência."""
+
+    def __init__(self):
+        self.contagens = {}
+
+    def atualizar(self, serie):
+        serie = serie.dropna()
+        for valor in pd.unique(serie):
+            self.contagens.setdefault(valor, 0)
+        for valor, contagem in serie.value_counts(sort=False).items():
+            if contagem:
+                self.contagens[valor] += int(contagem)
+        return self
+
+    def mesclar(self, outro):
+        for valor, contagem in outro.contagens.items():
+            self.contagens[valor] = self.contagens.get(valor, 0) + contagem
+        return self
+
+    def categorias(self):
+        return list(self.contagens)
+
+    # Equivalente a value_counts(): ordem decrescente de contagem
+    def como_serie(self, nome=None):
+        serie = pd.Series(self.contagens, dtype='int64', name='count')
+        serie.index.name = nome
+        return serie.sort_values(ascending=False, kind='stable')
@@ -1,113 +1,273 @@
+import argparse
+
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-# Configuração para exibição de gráficos
-plt.style.use('ggplot')
-sns.set(style="whitegrid")
-
-# Carregar os dados
-df = pd.read_csv('./dados_consumo_simulados.csv')
-
-# Análise exploratória inicial
-print("Primeiras linhas do dataset:")
-print(df.head())
-
-print("\nInformações do dataset:")
-print(df.info())
-
-print("\nEstatísticas descritivas:")
-print(df.describe())
-
-# Verificar valores ausentes
-print("\nValores ausentes por coluna:")
-print(df.isnull().sum())
-
-# Converter a coluna de data para o formato datetime
-df['data'] = pd.to_datetime(df['data'])
-
-# Verificar valores inconsistentes na coluna quantidade
-print("\nVerificar valores inconsistentes na coluna quantidade:")
-print("Registros com quantidade nula:", df['quantidade'].isnull().sum())
-
-# Verificar entradas com valores negativos para entrada e positivos para saída
-inconsistencias_tipo_quantidade = df[
-    ((df['tipo'] == 'entrada') & (df['quantidade'] < 0)) | 
-    ((df['tipo'] == 'saida') & (df['quantidade'] > 0))
-]
-print("\nInconsistências entre tipo e quantidade:")
-print(inconsistencias_tipo_quantidade)
-
-# Verificar registros sem responsável
-sem_responsavel = df[df['responsavel'].isnull()]
-print("\nRegistros sem responsável:")
-print(sem_responsavel)
-
-# Análise por unidade
-print("\nContagem de registros por unidade:")
-print(df['unidade'].value_counts())
-
-# Análise por material
-print("\nContagem de registros por material:")
-print(df['material'].value_counts())
-
-# Análise por tipo de operação
-print("\nContagem de registros por tipo de operação:")
-print(df['tipo'].value_counts())
-
-# Salvar resultados da análise exploratória
-with open('/projeto_anomalias_consumo_2/resultados_analise_exploratoria.txt', 'w') as f:
-    f.write("ANÁLISE EXPLORATÓRIA DOS DADOS DE CONSUMO - NOVO DATASET\n")
-    f.write("==================================================\n\n")
-    
-    f.write("1. VISÃO GERAL DOS DADOS\n")
-    f.write(f"Total de registros: {len(df)}\n")
-    f.write(f"Período dos dados: {df['data'].min().strftime('%d/%m/%Y')} a {df['data'].max().strftime('%d/%m/%Y')}\n")
-    f.write(f"Unidades: {', '.join(df['unidade'].unique())}\n")
-    f.write(f"Materiais: {', '.join(df['material'].unique())}\n\n")
-    
-    f.write("2. INCONSISTÊNCIAS IDENTIFICADAS\n")
-    f.write(f"Registros com quantidade nula: {df['quantidade'].isnull().sum()}\n")
-    f.write(f"Registros sem responsável: {df['responsavel'].isnull().sum()}\n")
-    f.write(f"Inconsistências entre tipo e quantidade: {len(inconsistencias_tipo_quantidade)}\n\n")
-    
-    f.write("3. DISTRIBUIÇÃO POR UNIDADE\n")
-    for unidade, count in df['unidade'].value_counts().items():
-        f.write(f"{unidade}: {count} registros ({count/len(df)*100:.1f}%)\n")
-    
-    f.write("\n4. DISTRIBUIÇÃO POR MATERIAL\n")
-    for material, count in df['material'].value_counts().items():
-        f.write(f"{material}: {count} registros ({count/len(df)*100:.1f}%)\n")
-    
-    f.write("\n5. DISTRIBUIÇÃO POR TIPO DE OPERAÇÃO\n")
-    for tipo, count in df['tipo'].value_counts().items():
-        f.write(f"{tipo}: {count} registros ({count/len(df)*100:.1f}%)\n")
-
-# Criar visualizações
-# Distribuição de registros por unidade
-plt.figure(figsize=(10, 6))
-sns.countplot(x='unidade', data=df)
-plt.title('Distribuição de Registros por Unidade')
-plt.savefig('./projeto_anomalias_consumo_2/dist_por_unidade.png')
-
-# Distribuição de registros por material
-plt.figure(figsize=(12, 6))
-sns.countplot(x='material', data=df)
-plt.title('Distribuição de Registros por Material')
-plt.savefig('./projeto_anomalias_consumo_2/dist_por_material.png')
-
-# Distribuição de quantidades por tipo de operação
-plt.figure(figsize=(10, 6))
-sns.boxplot(x='tipo', y='quantidade', data=df)
-plt.title('Distribuição de Quantidades por Tipo de Operação')
-plt.savefig('./projeto_anomalias_consumo_2/dist_quantidade_por_tipo.png')
-
-# Distribuição temporal dos registros
-plt.figure(figsize=(14, 7))
-df.groupby(df['data'].dt.month)['quantidade'].count().plot(kind='bar')
-plt.title('Distribuição Temporal dos Registros (por mês)')
-plt.xlabel('Mês')
-plt.ylabel('Número de Registros')
-plt.savefig('./projeto_anomalias_consumo_2/dist_temporal.png')
-
-print("\nAnálise exploratória concluída. Resultados salvos em 'resultados_analise_exploratoria.txt'")
+
+from acumuladores import ContagemCategorias, EstatisticasNumericas, SketchQuantis
+from armazenamento import carregar, ler_em_blocos
+from cache_artefatos import CacheArtefatos
+from instrumentacao import adicionar_argumentos, configurar_por_argumentos, finalizar_por_argumentos, medir
+from renderizacao import caixa_de_quartis, estatisticas_caixa, renderizar_graficos, tabela_contagem
+
+CAMINHO_DADOS = './dados_consumo_simulados.csv'
+CAMINHO_RESULTADOS = './projeto_anomalias_consumo_2/resultados_analise_exploratoria.txt'
+COLUNAS_CATEGORIAS = ['unidade', 'material', 'tipo']
+
+
+# Entradas com valores negativos e saídas com valores positivos
+def mascara_inconsistencias(df):
+    # Quantidades nulas (<NA> no Int32) não são inconsistências
+    return (
+        ((df['tipo'] == 'entrada') & (df['quantidade'] < 0)) |
+        ((df['tipo'] == 'saida') & (df['quantidade'] > 0))
+    ).fillna(False).astype(bool)
+
+
+# Resumo usado no relatório em texto, calculado com o DataFrame inteiro em memória
+def resumir(df):
+    return {
+        'total': len(df),
+        'data_min': df['data'].min(),
+        'data_max': df['data'].max(),
+        'unidades': list(df['unidade'].dropna().unique()),
+        'materiais': list(df['material'].dropna().unique()),
+        'quantidade_nula': int(df['quantidade'].isnull().sum()),
+        'sem_responsavel': int(df['responsavel'].isnull().sum()),
+        'inconsistencias': int(mascara_inconsistencias(df).sum()),
+        'contagens': {col: df[col].value_counts() for col in COLUNAS_CATEGORIAS},
+        'por_mes': df.groupby(df['data'].dt.month)['quantidade'].count(),
+        'caixas_por_tipo': estatisticas_caixa(df, 'tipo', 'quantidade'),
+    }
+
+
+# Mesmo resumo, calculado em uma única passada sobre blocos do arquivo.
+# Cada estatística é um acumulador mesclável; nenhum bloco é mantido após processado
+def resumir_em_blocos(caminho, tamanho_bloco=1_000_000):
+    total = 0
+    nulos = None
+    data_min, data_max = pd.NaT, pd.NaT
+    inconsistencias = 0
+    estatisticas = EstatisticasNumericas()
+    sketch = SketchQuantis()
+    contagens = {col: ContagemCategorias() for col in COLUNAS_CATEGORIAS}
+    por_mes = pd.Series(dtype='int64')
+    dtypes = None
+    # Quartis e extremos de quantidade por tipo de operação, para o boxplot
+    sketches_tipo, estatisticas_tipo = {}, {}
+
+    for bloco in ler_em_blocos(caminho, tamanho_bloco):
+        total += len(bloco)
+        nulos_bloco = bloco.isnull().sum()
+        nulos = nulos_bloco if nulos is None else nulos.add(nulos_bloco, fill_value=0)
+        dtypes = bloco.dtypes if dtypes is None else dtypes
+
+        data_min = min(data_min, bloco['data'].min()) if pd.notna(data_min) else bloco['data'].min()
+        data_max = max(data_max, bloco['data'].max()) if pd.notna(data_max) else bloco['data'].max()
+
+        estatisticas.atualizar(bloco['quantidade'].to_numpy(dtype='float64', na_value=float('nan')))
+        sketch.atualizar(bloco['quantidade'].to_numpy(dtype='float64', na_value=float('nan')))
+        inconsistencias += int(mascara_inconsistencias(bloco).sum())
+        for col, contagem in contagens.items():
+            contagem.atualizar(bloco[col])
+        por_mes = por_mes.add(bloco.groupby(bloco['data'].dt.month)['quantidade'].count(), fill_value=0)
+        for tipo, valores in bloco.groupby('tipo', observed=True)['quantidade']:
+            valores = valores.to_numpy(dtype='float64', na_value=float('nan'))
+            sketches_tipo.setdefault(tipo, SketchQuantis()).atualizar(valores)
+            estatisticas_tipo.setdefault(tipo, EstatisticasNumericas()).atualizar(valores)
+
+    q1, mediana, q3 = sketch.quantis([0.25, 0.5, 0.75])
+    descricao = pd.Series({
+        'count': float(estatisticas.n),
+        'mean': estatisticas.media,
+        'std': estatisticas.desvio,
+        'min': estatisticas.minimo,
+        '25%': q1,
+        '50%': mediana,
+        '75%': q3,
+        'max': estatisticas.maximo,
+    }, name='quantidade')
+
+    caixas_por_tipo = [
+        caixa_de_quartis(tipo, *sketches_tipo[tipo].quantis([0.25, 0.5, 0.75]),
+                         estatisticas_tipo[tipo].minimo, estatisticas_tipo[tipo].maximo)
+        for tipo in sorted(sketches_tipo)
+    ]
+
+    return {
+        'total': total,
+        'data_min': data_min,
+        'data_max': data_max,
+        'unidades': contagens['unidade'].categorias(),
+        'materiais': contagens['material'].categorias(),
+        'quantidade_nula': int(nulos['quantidade']),
+        'sem_responsavel': int(nulos['responsavel']),
+        'inconsistencias': inconsistencias,
+        'contagens': {col: contagem.como_serie(col) for col, contagem in contagens.items()},
+        'por_mes': por_mes.astype('int64').sort_index().rename_axis('data'),
+        'nulos': nulos.astype('int64'),
+        'dtypes': dtypes,
+        'descricao': descricao,
+        'caixas_por_tipo': caixas_por_tipo,
+    }
+
+
+def escrever_resultados(resumo, caminho=CAMINHO_RESULTADOS):
+    total = resumo['total']
+    with open(caminho, 'w') as f:
+        f.write("ANÁLISE EXPLORATÓRIA DOS DADOS DE CONSUMO - NOVO DATASET\n")
+        f.write("==================================================\n\n")
+
+        f.write("1. VISÃO GERAL DOS DADOS\n")
+        f.write(f"Total de registros: {total}\n")
+        f.write(f"Período dos dados: {resumo['data_min'].strftime('%d/%m/%Y')} a {resumo['data_max'].strftime('%d/%m/%Y')}\n")
+        f.write(f"Unidades: {', '.join(resumo['unidades'])}\n")
+        f.write(f"Materiais: {', '.join(resumo['materiais'])}\n\n")
+
+        f.write("2. INCONSISTÊNCIAS IDENTIFICADAS\n")
+        f.write(f"Registros com quantidade nula: {resumo['quantidade_nula']}\n")
+        f.write(f"Registros sem responsável: {resumo['sem_responsavel']}\n")
+        f.write(f"Inconsistências entre tipo e quantidade: {resumo['inconsistencias']}\n\n")
+
+        f.write("3. DISTRIBUIÇÃO POR UNIDADE\n")
+        for unidade, count in resumo['contagens']['unidade'].items():
+            f.write(f"{unidade}: {count} registros ({count/total*100:.1f}%)\n")
+
+        f.write("\n4. DISTRIBUIÇÃO POR MATERIAL\n")
+        for material, count in resumo['contagens']['material'].items():
+            f.write(f"{material}: {count} registros ({count/total*100:.1f}%)\n")
+
+        f.write("\n5. DISTRIBUIÇÃO POR TIPO DE OPERAÇÃO\n")
+        for tipo, count in resumo['contagens']['tipo'].items():
+            f.write(f"{tipo}: {count} registros ({count/total*100:.1f}%)\n")
+
+
+# Especificações dos gráficos, montadas apenas a partir do resumo agregado
+def especificacoes_graficos(resumo, diretorio='./projeto_anomalias_consumo_2'):
+    por_mes = resumo['por_mes']
+    especificacoes = [
+        # Distribuição de registros por unidade
+        {'tipo': 'barras', 'caminho': f'{diretorio}/dist_por_unidade.png', 'tamanho': (10, 6), 'ajustar': False,
+         'dados': tabela_contagem(resumo['contagens']['unidade'], 'unidade'),
+         'opcoes': {'x': 'unidade', 'y': 'count', 'titulo': 'Distribuição de Registros por Unidade'}},
+        # Distribuição de registros por material
+        {'tipo': 'barras', 'caminho': f'{diretorio}/dist_por_material.png', 'tamanho': (12, 6), 'ajustar': False,
+         'dados': tabela_contagem(resumo['contagens']['material'], 'material'),
+         'opcoes': {'x': 'material', 'y': 'count', 'titulo': 'Distribuição de Registros por Material'}},
+        # Distribuição de quantidades por tipo de operação
+        {'tipo': 'caixas', 'caminho': f'{diretorio}/dist_quantidade_por_tipo.png', 'tamanho': (10, 6), 'ajustar': False,
+         'dados': resumo.get('caixas_por_tipo'),
+         'opcoes': {'titulo': 'Distribuição de Quantidades por Tipo de Operação', 'rotulo_x': 'tipo', 'rotulo_y': 'quantidade'}},
+        # Distribuição temporal dos registros
+        {'tipo': 'barras', 'caminho': f'{diretorio}/dist_temporal.png', 'tamanho': (14, 7), 'ajustar': False,
+         'dados': pd.DataFrame({'Mês': por_mes.index.astype(str), 'Número de Registros': por_mes.to_numpy()}),
+         'opcoes': {'x': 'Mês', 'y': 'Número de Registros', 'titulo': 'Distribuição Temporal dos Registros (por mês)'}},
+    ]
+    # Resumos sem os quartis (como o do cubo agregado) não geram o boxplot
+    return [e for e in especificacoes if e['dados'] is not None]
+
+
+def analisar_em_memoria(caminho, cache=None):
+    # Carregar os dados (CSV ou dataset Parquet; a coluna data já vem como datetime)
+    with medir('carga') as m:
+        df = carregar(caminho)
+        m['linhas'] = len(df)
+
+    # Análise exploratória inicial
+    print("Primeiras linhas do dataset:")
+    print(df.head())
+
+    print("\nInformações do dataset:")
+    print(df.info())
+
+    print("\nEstatísticas descritivas:")
+    print(df.describe())
+
+    # Verificar valores ausentes
+    print("\nValores ausentes por coluna:")
+    print(df.isnull().sum())
+
+    # Verificar valores inconsistentes na coluna quantidade
+    print("\nVerificar valores inconsistentes na coluna quantidade:")
+    print("Registros com quantidade nula:", df['quantidade'].isnull().sum())
+
+    # Verificar entradas com valores negativos para entrada e positivos para saída
+    print("\nInconsistências entre tipo e quantidade:")
+    print(df[mascara_inconsistencias(df)])
+
+    # Verificar registros sem responsável
+    print("\nRegistros sem responsável:")
+    print(df[df['responsavel'].isnull()])
+
+    with medir('resumo', len(df)):
+        resumo = cache.memoizar('resumo_eda', resumir, df) if cache is not None else resumir(df)
+
+    # Análise por unidade, material e tipo de operação
+    print("\nContagem de registros por unidade:")
+    print(resumo['contagens']['unidade'])
+    print("\nContagem de registros por material:")
+    print(resumo['contagens']['material'])
+    print("\nContagem de registros por tipo de operação:")
+    print(resumo['contagens']['tipo'])
+
+    # Salvar resultados da análise exploratória
+    escrever_resultados(resumo)
+
+    # Criar visualizações
+    with medir('renderizacao'):
+        renderizar_graficos(especificacoes_graficos(resumo), cache=cache)
+
+
+def analisar_em_blocos(caminho, tamanho_bloco, cache=None):
+    with medir('resumo') as m:
+        resumo = resumir_em_blocos(caminho, tamanho_bloco)
+        m['linhas'] = resumo['total']
+
+    print("\nInformações do dataset:")
+    print(f"Total de registros: {resumo['total']}")
+    print(pd.DataFrame({
+        'Non-Null Count': resumo['total'] - resumo['nulos'],
+        'Dtype': resumo['dtypes']
+    }))
+
+    print("\nEstatísticas descritivas (quartis aproximados):")
+    print(resumo['descricao'])
+
+    print("\nValores ausentes por coluna:")
+    print(resumo['nulos'])
+
+    print("\nInconsistências entre tipo e quantidade:", resumo['inconsistencias'])
+    print("Registros sem responsável:", resumo['sem_responsavel'])
+
+    print("\nContagem de registros por unidade:")
+    print(resumo['contagens']['unidade'])
+    print("\nContagem de registros por material:")
+    print(resumo['contagens']['material'])
+    print("\nContagem de registros por tipo de operação:")
+    print(resumo['contagens']['tipo'])
+
+    print("\nRegistros por mês:")
+    print(resumo['por_mes'])
+
+    escrever_resultados(resumo)
+    with medir('renderizacao'):
+        renderizar_graficos(especificacoes_graficos(resumo), cache=cache)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Análise exploratória dos dados de consumo')
+    parser.add_argument('--entrada', default=CAMINHO_DADOS)
+    parser.add_argument('--streaming', action='store_true',
+                        help='Processa o arquivo em blocos, sem carregá-lo inteiro em memória')
+    parser.add_argument('--tamanho-bloco', type=int, default=1_000_000)
+    parser.add_argument('--sem-cache', action='store_true', help='Recalcula tudo, ignorando o cache de artefatos')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    configurar_por_argumentos(args)
+
+    cache = None if args.sem_cache else CacheArtefatos()
+    if args.streaming:
+        analisar_em_blocos(args.entrada, args.tamanho_bloco, cache)
+    else:
+        analisar_em_memoria(args.entrada, cache)
+
+    print("\nAnálise exploratória concluída. Resultados salvos em 'resultados_analise_exploratoria.txt'")
+    finalizar_por_argumentos(args)
@@ -0,0 +1,177 @@
+import operator
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import cache_colunar
+from esquema import TIPOS_CSV, aplicar_esquema
+
+# Camada de armazenamento compartilhada pelos scripts do projeto.
+# Caminhos terminados em .csv continuam sendo lidos/escritos como texto;
+# caminhos .parquet (ou diretórios) usam um dataset Parquet particionado
+# por unidade e mês, com colunas categóricas codificadas em dicionário e
+# a coluna 'data' gravada como date32. Toda leitura devolve os tipos do
+# esquema canônico (ver esquema.py). Leituras completas de CSV passam pelo
+# cache colunar mapeado em memória (ver cache_colunar.py).
+
+COLUNAS_PARTICAO = ['unidade', 'mes']
+USAR_CACHE_COLUNAR = True
+
+# Operadores aceitos nos filtros, no formato (coluna, operador, valor)
+OPERADORES = {
+    '==': operator.eq,
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda serie, valores: serie.isin(valores),
+    'not in': lambda serie, valores: ~serie.isin(valores),
+}
+
+
+def eh_parquet(caminho):
+    return str(caminho).endswith('.parquet') or os.path.isdir(caminho)
+
+
+# Mês no formato AAAAMM, calculado sem formatação de texto
+def coluna_mes(datas):
+    return (datas.dt.year * 100 + datas.dt.month).astype('int32')
+
+
+def _preparar_tabela(df):
+    df = aplicar_esquema(df.copy())
+    df['mes'] = coluna_mes(df['data'])
+
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    indice_data = tabela.schema.get_field_index('data')
+    return tabela.set_column(indice_data, 'data', tabela.column('data').cast(pa.date32()))
+
+
+def salvar_parquet(df, caminho, particoes=COLUNAS_PARTICAO, anexar=False):
+    if not anexar and os.path.exists(caminho):
+        shutil.rmtree(caminho) if os.path.isdir(caminho) else os.remove(caminho)
+
+    pq.write_to_dataset(
+        _preparar_tabela(df),
+        caminho,
+        partition_cols=list(particoes),
+        existing_data_behavior='overwrite_or_ignore'
+    )
+
+
+def salvar(df, caminho, anexar=False):
+    if eh_parquet(caminho):
+        salvar_parquet(df, caminho, anexar=anexar)
+    else:
+        df.to_csv(caminho, mode='a' if anexar else 'w', header=not anexar, index=False)
+
+
+def aplicar_filtros(df, filtros):
+    if not filtros:
+        return df
+    mascara = pd.Series(True, index=df.index)
+    for coluna, op, valor in filtros:
+        # Comparações com valores nulos (<NA>) não selecionam a linha
+        mascara &= OPERADORES[op](df[coluna], valor).fillna(False).astype(bool)
+    return df[mascara]
+
+
+def _colunas_para_leitura(colunas, filtros):
+    # As colunas usadas nos filtros precisam ser lidas, mesmo que não sejam retornadas
+    # ('mes' não existe no CSV: é calculado a partir de 'data')
+    if colunas is None:
+        return None
+    leitura = []
+    for coluna in list(colunas) + [c for c, _, _ in filtros or []]:
+        coluna = 'data' if coluna == 'mes' else coluna
+        if coluna not in leitura:
+            leitura.append(coluna)
+    return leitura
+
+
+def _filtros_arrow(filtros):
+    return [(c, '==' if op == '=' else op, v) for c, op, v in filtros] if filtros else None
+
+
+def carregar_parquet(caminho, colunas=None, filtros=None):
+    # Filtros por unidade/mês descartam partições inteiras; os demais são
+    # avaliados pelo leitor sobre as estatísticas dos row groups
+    tabela = pq.read_table(caminho, columns=colunas, filters=_filtros_arrow(filtros))
+    df = tabela.to_pandas(date_as_object=False)
+
+    if colunas is None and 'mes' in df.columns:
+        df = df.drop(columns='mes')
+    return aplicar_esquema(df)
+
+
+def _ler_csv_tipado(caminho, colunas, usar_cache):
+    if not usar_cache:
+        return aplicar_esquema(pd.read_csv(caminho, usecols=colunas, dtype=TIPOS_CSV))
+
+    df = cache_colunar.ler(caminho, colunas)
+    if df is not None:
+        return df
+    # O cache guarda sempre o arquivo inteiro, para servir qualquer seleção de colunas
+    df = aplicar_esquema(pd.read_csv(caminho, dtype=TIPOS_CSV))
+    try:
+        cache_colunar.gravar(caminho, df)
+    except OSError:
+        pass  # Sem permissão de escrita: segue sem cache
+    return df[colunas] if colunas is not None else df
+
+
+def carregar_csv(caminho, colunas=None, filtros=None, usar_cache_colunar=USAR_CACHE_COLUNAR):
+    colunas_leitura = _colunas_para_leitura(colunas, filtros)
+    df = _ler_csv_tipado(caminho, colunas_leitura, usar_cache_colunar)
+    if filtros and any(c == 'mes' for c, _, _ in filtros):
+        df['mes'] = coluna_mes(df['data'])
+
+    df = aplicar_filtros(df, filtros)
+    return df[colunas] if colunas is not None else df.drop(columns='mes', errors='ignore')
+
+
+# Ponto de entrada único de leitura: escolhe o formato pelo caminho
+def carregar(caminho, colunas=None, filtros=None, usar_cache_colunar=USAR_CACHE_COLUNAR):
+    if eh_parquet(caminho):
+        return carregar_parquet(caminho, colunas, filtros)
+    return carregar_csv(caminho, colunas, filtros, usar_cache_colunar)
+
+
+def _ler_blocos_parquet(caminho, tamanho_bloco, colunas, filtros):
+    dataset = ds.dataset(caminho, format='parquet', partitioning='hive')
+    lotes = dataset.to_batches(
+        columns=colunas,
+        filter=pq.filters_to_expression(_filtros_arrow(filtros)) if filtros else None,
+        batch_size=tamanho_bloco
+    )
+    for lote in lotes:
+        df = lote.to_pandas(date_as_object=False)
+        if colunas is None and 'mes' in df.columns:
+            df = df.drop(columns='mes')
+        yield aplicar_esquema(df)
+
+
+def _ler_blocos_csv(caminho, tamanho_bloco, colunas, filtros):
+    leitor = pd.read_csv(caminho, usecols=_colunas_para_leitura(colunas, filtros), dtype=TIPOS_CSV,
+                         chunksize=tamanho_bloco)
+    for df in leitor:
+        df = aplicar_esquema(df)
+        if filtros:
+            if any(c == 'mes' for c, _, _ in filtros):
+                df['mes'] = coluna_mes(df['data'])
+            df = aplicar_filtros(df, filtros)
+        yield df[colunas] if colunas is not None else df.drop(columns='mes', errors='ignore')
+
+
+# Leitura em blocos de no máximo tamanho_bloco linhas, para processamento
+# fora da memória. Aceita as mesmas colunas/filtros que carregar()
+def ler_em_blocos(caminho, tamanho_bloco=1_000_000, colunas=None, filtros=None):
+    if eh_parquet(caminho):
+        return _ler_blocos_parquet(caminho, tamanho_bloco, colunas, filtros)
+    return _ler_blocos_csv(caminho, tamanho_bloco, colunas, filtros)
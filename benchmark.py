@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import pandas as pd
+
+# Benchmark reprodutível das etapas do projeto. Para cada tamanho, os dados
+# são gerados com o gerador vetorizado (seed e data final fixas) e cada etapa
+# é medida com instrumentacao.medir: latência, vazão (linhas/s) e memória
+# (pico de RSS durante a etapa e quanto ele passou do RSS inicial).
+# Cada tamanho roda em um processo novo, em um diretório temporário, para que
+# o pico de memória de um tamanho não contamine o do seguinte.
+# Os resultados são comparados com uma baseline gravada; etapas mais lentas
+# (ou cujo acréscimo de memória cresceu) além da tolerância são reportadas
+# como regressão.
+
+CAMINHO_BASELINE = './benchmark_baseline.json'
+TAMANHOS_PADRAO = [1_000, 10_000, 100_000, 1_000_000]
+SEED = 42
+DATA_FINAL = date(2025, 1, 1)
+REPETICOES = 3
+TOLERANCIA = 0.20  # Regressão: 20% acima da baseline
+MINIMO_SEGUNDOS = 0.05  # Etapas mais rápidas que isso são dominadas por ruído
+MINIMO_MB = 10  # Acréscimos de memória abaixo disso também
+
+# Acima deste tamanho as etapas que carregam tudo em memória são puladas
+# e só a geração e a análise exploratória em blocos são medidas
+LIMITE_EM_MEMORIA = 10_000_000
+
+# O acréscimo de memória é da própria etapa; o pico de RSS inclui o que as
+# etapas anteriores deixaram alocado e não entra na comparação
+METRICAS_COMPARADAS = ['segundos', 'acrescimo_pico_mb']
+MINIMOS = {'segundos': MINIMO_SEGUNDOS, 'acrescimo_pico_mb': MINIMO_MB}
+
+
+def _medir_etapa(nome, funcao, linhas, repeticoes):
+    from instrumentacao import limpar, medicoes, medir
+
+    # Cada etapa é repetida; a latência reportada é a mediana das repetições
+    limpar()
+    for _ in range(repeticoes):
+        with medir(nome, linhas):
+            resultado = funcao()
+    tempos = medicoes()
+    return resultado, {
+        'etapa': nome,
+        'linhas': linhas,
+        'segundos': float(tempos['segundos'].median()),
+        'cpu_segundos': float(tempos['cpu_segundos'].median()),
+        'linhas_por_segundo': linhas / tempos['segundos'].median() if linhas else None,
+        'pico_rss_mb': float(tempos['pico_rss_mb'].max()),
+        'acrescimo_pico_mb': float(tempos['acrescimo_pico_mb'].max()),
+    }
+
+
+# Executado em um processo próprio por tamanho
+def executar_tamanho(n, repeticoes=REPETICOES, seed=SEED):
+    import analise_exploratoria
+    import simulacao_impacto_financeiro
+    from armazenamento import carregar
+    from criar_apresentacao import gerar_apresentacao, resumir_resultados
+    from criar_dados import gerar_dados_em_blocos
+    from deteccao_duplicatas import marcar_duplicatas
+    from deteccao_outliers import calcular_metricas_variacao
+    from renderizacao import renderizar_graficos
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as diretorio:
+        # Os scripts gravam em caminhos relativos ao diretório atual
+        os.chdir(diretorio)
+        os.makedirs('projeto_anomalias_consumo_2')
+        caminho = os.path.join(diretorio, 'dados.csv')
+
+        total, medicao = _medir_etapa('geracao', lambda: gerar_dados_em_blocos(caminho, n, seed, data_final=DATA_FINAL),
+                                      n, 1)
+        resultados.append(medicao)
+
+        if n > LIMITE_EM_MEMORIA:
+            _, medicao = _medir_etapa('eda_blocos', lambda: analise_exploratoria.resumir_em_blocos(caminho),
+                                      total, repeticoes)
+            return n, resultados + [medicao]
+
+        etapas = [
+            ('carga', lambda: carregar(caminho, usar_cache_colunar=False)),
+            ('carga_cache', lambda: carregar(caminho)),
+            ('eda', lambda: analise_exploratoria.resumir(df)),
+            ('deteccao', lambda: calcular_metricas_variacao(df)),
+            ('impacto', lambda: simulacao_impacto_financeiro.calcular_impacto_financeiro(marcar_duplicatas(metricas))),
+            ('renderizacao', lambda: renderizar_graficos(
+                analise_exploratoria.especificacoes_graficos(resumo)
+                + simulacao_impacto_financeiro.especificacoes_graficos(impacto), processos=1
+            )),
+            ('pdf', lambda: gerar_apresentacao(resumo=resumir_resultados(metricas, impacto, por_unidade=False)[None],
+                                               forcar=True)),
+        ]
+        for nome, funcao in etapas:
+            resultado, medicao = _medir_etapa(nome, funcao, total, repeticoes)
+            resultados.append(medicao)
+            if nome == 'carga_cache':
+                df = resultado
+            elif nome == 'eda':
+                resumo = resultado
+            elif nome == 'deteccao':
+                metricas = resultado
+            elif nome == 'impacto':
+                impacto = resultado
+    return n, resultados
+
+
+def executar(tamanhos, repeticoes=REPETICOES, seed=SEED):
+    linhas = []
+    for n in tamanhos:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            _, resultados = executor.submit(executar_tamanho, n, repeticoes, seed).result()
+        for r in resultados:
+            linhas.append({'tamanho': n, **r})
+            print(f"[{n:>11,}] {r['etapa']:<12} {r['segundos']:9.3f}s {r['pico_rss_mb']:9.1f} MB"
+                  f" (+{r['acrescimo_pico_mb']:.1f} MB)")
+    return pd.DataFrame(linhas)
+
+
+def _chave(linha):
+    return f"{linha['tamanho']}:{linha['etapa']}"
+
+
+def salvar_baseline(resultados, caminho=CAMINHO_BASELINE):
+    baseline = {_chave(linha): {m: linha[m] for m in METRICAS_COMPARADAS} for _, linha in resultados.iterrows()}
+    with open(caminho, 'w') as f:
+        json.dump(baseline, f, indent=2)
+
+
+# Devolve as medições que pioraram mais que a tolerância em relação à baseline
+def comparar(resultados, baseline, tolerancia=TOLERANCIA):
+    regressoes = []
+    for _, linha in resultados.iterrows():
+        referencia = baseline.get(_chave(linha))
+        if referencia is None:
+            continue
+        for metrica in METRICAS_COMPARADAS:
+            # Baselines antigas não têm o acréscimo de memória
+            if metrica not in referencia or linha[metrica] < MINIMOS[metrica]:
+                continue
+            if linha[metrica] > referencia[metrica] * (1 + tolerancia):
+                regressoes.append({
+                    'tamanho': linha['tamanho'], 'etapa': linha['etapa'], 'metrica': metrica,
+                    'baseline': referencia[metrica], 'atual': linha[metrica],
+                    'variacao': linha[metrica] / referencia[metrica] - 1,
+                })
+    return pd.DataFrame(regressoes, columns=['tamanho', 'etapa', 'metrica', 'baseline', 'atual', 'variacao'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark das etapas com dados sintéticos de vários tamanhos')
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=TAMANHOS_PADRAO)
+    parser.add_argument('--repeticoes', type=int, default=REPETICOES)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--baseline', default=CAMINHO_BASELINE)
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA)
+    parser.add_argument('--salvar-baseline', action='store_true', help='Grava os resultados como nova baseline')
+    parser.add_argument('--saida', default=None, help='Grava os resultados em CSV')
+    args = parser.parse_args()
+
+    resultados = executar(args.tamanhos, args.repeticoes, args.seed)
+    if args.saida:
+        resultados.to_csv(args.saida, index=False)
+
+    if args.salvar_baseline:
+        salvar_baseline(resultados, args.baseline)
+        print(f"\nBaseline salva em '{args.baseline}'")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressoes = comparar(resultados, json.load(f), args.tolerancia)
+        if len(regressoes) > 0:
+            print(f"\nRegressões acima de {args.tolerancia:.0%}:")
+            print(regressoes.to_string(index=False))
+            sys.exit(1)
+        print(f"\nNenhuma regressão acima de {args.tolerancia:.0%} em relação à baseline")
+    else:
+        print(f"\nBaseline '{args.baseline}' não encontrada; use --salvar-baseline para criá-la")
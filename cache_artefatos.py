@@ -0,0 +1,158 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Cache de artefatos endereçado por conteúdo. A chave de cada artefato é o
+# hash dos dados de entrada (a fatia efetivamente usada) mais os parâmetros
+# da etapa (preços, limites de severidade...) e a versão do código que a
+# calcula (ver versao_codigo). Se nada mudou a montante, o resultado
+# intermediário ou o gráfico renderizado é reaproveitado.
+# O tamanho total é limitado com despejo LRU (pelo horário do último acesso).
+
+DIRETORIO_CACHE = './.cache_artefatos'
+LIMITE_BYTES = 1024 ** 3  # 1 GB
+DIRETORIO_PROJETO = os.path.dirname(os.path.abspath(__file__))
+
+
+def _atualizar_hash(h, obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        colunas = list(obj.columns) if isinstance(obj, pd.DataFrame) else [obj.name]
+        tipos = [str(t) for t in (obj.dtypes if isinstance(obj, pd.DataFrame) else [obj.dtype])]
+        h.update(repr((type(obj).__name__, colunas, tipos)).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes())
+    elif isinstance(obj, pd.Index):
+        h.update(pd.util.hash_pandas_object(obj).to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        h.update(repr((obj.dtype.str, obj.shape)).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        h.update(b'{')
+        for chave in sorted(obj, key=repr):
+            _atualizar_hash(h, chave)
+            _atualizar_hash(h, obj[chave])
+        h.update(b'}')
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'[')
+        for item in obj:
+            _atualizar_hash(h, item)
+        h.update(b']')
+    else:
+        h.update(json.dumps(obj, default=repr).encode())
+
+
+def hash_conteudo(*objetos):
+    h = hashlib.sha256()
+    for obj in objetos:
+        _atualizar_hash(h, obj)
+    return h.hexdigest()
+
+
+def _hash_arquivo(caminho):
+    with open(caminho, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+# Módulos do projeto de que `modulo` depende diretamente (os importados e os
+# que definem as funções e classes importadas)
+def _dependencias_locais(modulo):
+    for valor in vars(modulo).values():
+        dependencia = valor if inspect.ismodule(valor) else sys.modules.get(getattr(valor, '__module__', None) or '')
+        arquivo = getattr(dependencia, '__file__', None)
+        if arquivo and os.path.dirname(os.path.abspath(arquivo)) == DIRETORIO_PROJETO:
+            yield dependencia
+
+
+# Versão do código das funções (ou módulos) informadas: hash dos arquivos
+# do projeto que as definem e de todos os módulos do projeto de que elas
+# dependem, direta ou indiretamente. Qualquer mudança nesse código (uma
+# constante de limiar, a própria função) muda a versão
+def versao_codigo(*objetos):
+    pendentes = [o if inspect.ismodule(o) else inspect.getmodule(o) for o in objetos]
+    arquivos = {}
+    while pendentes:
+        modulo = pendentes.pop()
+        arquivo = getattr(modulo, '__file__', None)
+        if arquivo is None or arquivo in arquivos:
+            continue
+        arquivos[arquivo] = _hash_arquivo(arquivo)
+        pendentes.extend(_dependencias_locais(modulo))
+    return hash_conteudo(sorted(arquivos.values()))
+
+
+class CacheArtefatos:
+    def __init__(self, diretorio=DIRETORIO_CACHE, limite_bytes=LIMITE_BYTES):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_bytes
+        os.makedirs(diretorio, exist_ok=True)
+
+    def chave(self, etapa, *dados, **parametros):
+        return f'{etapa}-{hash_conteudo(dados, parametros)}'
+
+    def _caminho(self, chave, extensao):
+        return os.path.join(self.diretorio, f'{chave}{extensao}')
+
+    def _usar(self, caminho):
+        if not os.path.exists(caminho):
+            return False
+        os.utime(caminho)  # Marca o acesso para o LRU
+        return True
+
+    def obter_objeto(self, chave):
+        caminho = self._caminho(chave, '.pkl')
+        if not self._usar(caminho):
+            return None
+        with open(caminho, 'rb') as f:
+            return pickle.load(f)
+
+    def salvar_objeto(self, chave, objeto):
+        self._gravar(self._caminho(chave, '.pkl'), lambda f: pickle.dump(objeto, f, protocol=pickle.HIGHEST_PROTOCOL))
+
+    # Copia o arquivo em cache para destino; devolve False se não houver
+    def obter_arquivo(self, chave, destino):
+        caminho = self._caminho(chave, os.path.splitext(destino)[1])
+        if not self._usar(caminho):
+            return False
+        shutil.copyfile(caminho, destino)
+        return True
+
+    def salvar_arquivo(self, chave, origem):
+        with open(origem, 'rb') as fonte:
+            self._gravar(self._caminho(chave, os.path.splitext(origem)[1]), lambda f: shutil.copyfileobj(fonte, f))
+
+    def _gravar(self, caminho, escrever):
+        temporario = f'{caminho}.tmp'
+        with open(temporario, 'wb') as f:
+            escrever(f)
+        os.replace(temporario, caminho)
+        self._despejar()
+
+    # Resultado de funcao(*args, **kwargs), reaproveitado se as entradas e o
+    # código de funcao não mudaram
+    def memoizar(self, etapa, funcao, *args, **kwargs):
+        chave = self.chave(etapa, versao_codigo(funcao), *args, **kwargs)
+        resultado = self.obter_objeto(chave)
+        if resultado is None:
+            resultado = funcao(*args, **kwargs)
+            self.salvar_objeto(chave, resultado)
+        return resultado
+
+    def _despejar(self):
+        entradas = []
+        for entrada in os.scandir(self.diretorio):
+            if entrada.is_file() and not entrada.name.endswith('.tmp'):
+                info = entrada.stat()
+                entradas.append((info.st_mtime, info.st_size, entrada.path))
+
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        for _, tamanho, caminho in sorted(entradas):
+            if total <= self.limite_bytes:
+                break
+            os.remove(caminho)
+            total -= tamanho
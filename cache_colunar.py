@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Cache colunar em disco para as leituras de CSV. Na primeira leitura, cada
+# coluna já tipada (esquema.py) é gravada como um arquivo .npy; nas
+# seguintes, os arquivos são abertos com memory-map, sem reprocessar o texto.
+# Vários processos que abrem o mesmo cache compartilham as páginas pelo
+# cache do sistema operacional em vez de manter cópias privadas. O mapeamento
+# é copy-on-write: alterar o DataFrame copia só as páginas tocadas, e o
+# arquivo em cache nunca é modificado.
+#
+# Cada cache guarda o mtime e o tamanho do CSV de origem e é descartado
+# quando o arquivo muda.
+#
+# Representação por tipo de coluna:
+#   categórica       códigos (.npy) + categorias e ordem no manifesto
+#   inteiro anulável valores (.npy) + máscara de nulos (.mascara.npy)
+#   demais           o próprio array NumPy (float, bool, datetime64)
+
+DIRETORIO_CACHE_COLUNAR = './.cache_colunar'
+VERSAO = 1  # Incrementar ao mudar o formato dos arquivos
+
+
+def _diretorio(caminho, diretorio_cache):
+    origem = os.path.abspath(caminho)
+    sufixo = hashlib.sha256(origem.encode()).hexdigest()[:16]
+    return os.path.join(diretorio_cache, f'{os.path.basename(origem)}-{sufixo}')
+
+
+def _assinatura(caminho):
+    info = os.stat(caminho)
+    return {'versao': VERSAO, 'mtime_ns': info.st_mtime_ns, 'tamanho': info.st_size}
+
+
+def _manifesto_valido(diretorio, caminho):
+    try:
+        with open(os.path.join(diretorio, 'manifesto.json')) as f:
+            manifesto = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifesto if manifesto['origem'] == _assinatura(caminho) else None
+
+
+def _gravar_coluna(diretorio, indice, serie):
+    base = os.path.join(diretorio, f'{indice}')
+    if isinstance(serie.dtype, np.dtype) and serie.dtype != object:
+        np.save(f'{base}.npy', serie.to_numpy())
+        return {'nome': serie.name, 'tipo': 'numpy'}
+
+    if isinstance(serie.array, pd.arrays.IntegerArray):
+        np.save(f'{base}.npy', serie.to_numpy(dtype=serie.dtype.numpy_dtype, na_value=0))
+        np.save(f'{base}.mascara.npy', serie.isna().to_numpy())
+        return {'nome': serie.name, 'tipo': 'inteiro_anulavel'}
+
+    # Texto e demais tipos de extensão são guardados como categóricas
+    if not isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.astype('category')
+    np.save(f'{base}.npy', serie.cat.codes.to_numpy())
+    return {
+        'nome': serie.name, 'tipo': 'categorica',
+        'categorias': serie.cat.categories.tolist(), 'ordenada': bool(serie.cat.ordered),
+    }
+
+
+def _abrir_coluna(diretorio, indice, descricao):
+    base = os.path.join(diretorio, f'{indice}')
+    valores = np.load(f'{base}.npy', mmap_mode='c')
+    if descricao['tipo'] == 'categorica':
+        tipo = pd.CategoricalDtype(descricao['categorias'], ordered=descricao['ordenada'])
+        return pd.Categorical.from_codes(valores, dtype=tipo, validate=False)
+    if descricao['tipo'] == 'inteiro_anulavel':
+        return pd.arrays.IntegerArray(valores, np.load(f'{base}.mascara.npy', mmap_mode='c'))
+    return valores
+
+
+# DataFrame lido do cache (colunas mapeadas em memória) ou None se o cache
+# não existir ou estiver desatualizado em relação ao CSV
+def ler(caminho, colunas=None, diretorio_cache=DIRETORIO_CACHE_COLUNAR):
+    diretorio = _diretorio(caminho, diretorio_cache)
+    manifesto = _manifesto_valido(diretorio, caminho)
+    if manifesto is None:
+        return None
+
+    dados = {}
+    for indice, descricao in enumerate(manifesto['colunas']):
+        if colunas is None or descricao['nome'] in colunas:
+            dados[descricao['nome']] = _abrir_coluna(diretorio, indice, descricao)
+    df = pd.DataFrame(dados, copy=False)
+    return df[list(colunas)] if colunas is not None else df
+
+
+# Grava o DataFrame completo lido de `caminho`. A gravação é feita em um
+# diretório temporário e trocada de uma vez, para que leitores concorrentes
+# nunca vejam um cache pela metade
+def gravar(caminho, df, diretorio_cache=DIRETORIO_CACHE_COLUNAR):
+    diretorio = _diretorio(caminho, diretorio_cache)
+    temporario = f'{diretorio}.tmp{os.getpid()}'
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+
+    assinatura = _assinatura(caminho)
+    colunas = [_gravar_coluna(temporario, i, df[col]) for i, col in enumerate(df.columns)]
+    with open(os.path.join(temporario, 'manifesto.json'), 'w') as f:
+        json.dump({'origem': assinatura, 'linhas': len(df), 'colunas': colunas}, f, ensure_ascii=False)
+
+    shutil.rmtree(diretorio, ignore_errors=True)
+    os.replace(temporario, diretorio)
+
+
+def limpar(diretorio_cache=DIRETORIO_CACHE_COLUNAR):
+    shutil.rmtree(diretorio_cache, ignore_errors=True)
@@ -0,0 +1,235 @@
+import argparse
+
+import pandas as pd
+
+from armazenamento import OPERADORES, eh_parquet, ler_em_blocos
+from deteccao_outliers import CAMINHO_METRICAS
+from esquema import aplicar_esquema
+from instrumentacao import adicionar_argumentos, configurar_por_argumentos, finalizar_por_argumentos, medir
+
+TAMANHO_BLOCO = 1_000_000
+
+# Consultas preguiçosas sobre os registros e as métricas. Cada chamada
+# (filtrar, selecionar, agrupar, agregar, limitar) devolve uma nova
+# Consulta com o plano acrescido; nada é lido até coletar(). Na execução:
+#   - os filtros e as colunas necessárias são repassados ao leitor
+#     (armazenamento.ler_em_blocos): no Parquet, filtros por unidade/mês
+#     descartam partições e os demais usam as estatísticas dos row groups;
+#     no CSV, só as colunas usadas são convertidas
+#   - os dados passam em blocos; agregações são acumuladas bloco a bloco
+#     com parciais mescláveis (soma, contagem, mínimo, máximo), então a
+#     memória depende do número de grupos e não do tamanho do arquivo
+#   - com limitar() e sem agregação, a leitura para assim que há linhas
+#     suficientes
+#
+# Exemplo: alertas Crítico de Medicamentos no Morumbi em setembro/2026
+#   Consulta('metricas.parquet').filtrar(('severidade', '==', 'Crítico'),
+#       ('material', '==', 'Medicamentos'), ('unidade', '==', 'Morumbi'),
+#       ('mes', '==', 202609)).coletar()
+
+# Parciais de cada função de agregação e como mesclá-las entre blocos
+PARCIAIS = {
+    'sum': ['sum'],
+    'count': ['count'],
+    'size': ['size'],
+    'min': ['min'],
+    'max': ['max'],
+    'mean': ['sum', 'count'],
+}
+MESCLA = {'sum': 'sum', 'count': 'sum', 'size': 'sum', 'min': 'min', 'max': 'max'}
+
+
+# Datas nos filtros viram Timestamp, que funciona tanto contra a coluna
+# datetime do CSV quanto contra o date32 do Parquet
+def _normalizar_filtro(filtro):
+    coluna, op, valor = filtro
+    if op not in OPERADORES:
+        raise ValueError(f"Operador desconhecido: {op}")
+    if coluna == 'data':
+        valor = [pd.Timestamp(v) for v in valor] if op in ('in', 'not in') else pd.Timestamp(valor)
+    return coluna, op, valor
+
+
+class Consulta:
+    """Plano de consulta sobre um arquivo CSV ou dataset Parquet."""
+
+    def __init__(self, caminho=CAMINHO_METRICAS, filtros=(), colunas=None, chaves=None, agregacoes=None,
+                 limite=None, tamanho_bloco=TAMANHO_BLOCO):
+        self.caminho = caminho
+        self.filtros = tuple(filtros)
+        self.colunas = colunas
+        self.chaves = chaves
+        self.agregacoes = agregacoes
+        self.limite = limite
+        self.tamanho_bloco = tamanho_bloco
+
+    def _com(self, **mudancas):
+        atual = dict(caminho=self.caminho, filtros=self.filtros, colunas=self.colunas, chaves=self.chaves,
+                     agregacoes=self.agregacoes, limite=self.limite, tamanho_bloco=self.tamanho_bloco)
+        return Consulta(**{**atual, **mudancas})
+
+    # Filtros no formato de armazenamento: (coluna, operador, valor)
+    def filtrar(self, *filtros):
+        return self._com(filtros=self.filtros + tuple(_normalizar_filtro(f) for f in filtros))
+
+    def selecionar(self, *colunas):
+        return self._com(colunas=tuple(colunas))
+
+    def agrupar(self, *chaves):
+        return self._com(chaves=tuple(chaves))
+
+    # Agregações nomeadas: agregar(total=('quantidade', 'sum'), n=('quantidade', 'size'))
+    def agregar(self, **agregacoes):
+        for nome, (_, funcao) in agregacoes.items():
+            if funcao not in PARCIAIS:
+                raise ValueError(f"Agregação não suportada em blocos: {funcao} ({nome})")
+        return self._com(agregacoes=dict(agregacoes))
+
+    def limitar(self, n):
+        return self._com(limite=n)
+
+    # Colunas que o leitor precisa entregar (as dos filtros ele já inclui)
+    def colunas_lidas(self):
+        if self.agregacoes is not None:
+            colunas = list(self.chaves or [])
+            for coluna, _ in self.agregacoes.values():
+                if coluna not in colunas:
+                    colunas.append(coluna)
+            return colunas
+        return list(self.colunas) if self.colunas is not None else None
+
+    def explicar(self):
+        formato = 'Parquet' if eh_parquet(self.caminho) else 'CSV'
+        linhas = [f"Origem: {self.caminho} ({formato}, blocos de {self.tamanho_bloco} linhas)"]
+        colunas = self.colunas_lidas()
+        linhas.append(f"Colunas lidas: {', '.join(colunas) if colunas is not None else 'todas'}")
+        for coluna, op, valor in self.filtros:
+            if formato == 'CSV':
+                onde = 'máscara por bloco'
+            elif coluna in ('unidade', 'mes'):
+                onde = 'poda de partições'
+            else:
+                onde = 'estatísticas dos row groups'
+            linhas.append(f"Filtro: {coluna} {op} {valor!r} ({onde})")
+        if self.agregacoes is not None:
+            descricao = ', '.join(f"{nome}={funcao}({coluna})" for nome, (coluna, funcao) in self.agregacoes.items())
+            linhas.append(f"Agregação por {', '.join(self.chaves or []) or '(tudo)'}: {descricao}")
+        if self.limite is not None:
+            linhas.append(f"Limite: {self.limite} linhas")
+        return '\n'.join(linhas)
+
+    def _blocos(self):
+        return ler_em_blocos(self.caminho, self.tamanho_bloco, self.colunas_lidas(), list(self.filtros) or None)
+
+    # Parciais de um bloco, indexadas pelas chaves de agrupamento
+    def _parciais(self, bloco):
+        especificacao = {}
+        for nome, (coluna, funcao) in self.agregacoes.items():
+            serie = bloco[coluna]
+            if pd.api.types.is_integer_dtype(serie.dtype):
+                bloco[coluna] = serie.astype('Int64')  # Somas de Int32 podem estourar
+            for parcial in PARCIAIS[funcao]:
+                especificacao[f'{nome}__{parcial}'] = (coluna, parcial)
+        chaves = list(self.chaves) if self.chaves else pd.Series(0, index=bloco.index, name='_todos')
+        return bloco.groupby(chaves, observed=True, dropna=False, sort=False).agg(**especificacao)
+
+    def _agregar(self):
+        acumulado = None
+        for bloco in self._blocos():
+            parciais = self._parciais(bloco)
+            if acumulado is not None:
+                parciais = pd.concat([acumulado, parciais])
+                mescla = {c: MESCLA[c.rsplit('__', 1)[1]] for c in parciais.columns}
+                parciais = parciais.groupby(level=list(range(parciais.index.nlevels)), observed=True,
+                                            dropna=False, sort=False).agg(mescla)
+            acumulado = parciais
+        if acumulado is None:
+            return pd.DataFrame(columns=list(self.chaves or []) + list(self.agregacoes))
+
+        resultado = pd.DataFrame(index=acumulado.index)
+        for nome, (_, funcao) in self.agregacoes.items():
+            if funcao == 'mean':
+                resultado[nome] = acumulado[f'{nome}__sum'].astype('float64') / acumulado[f'{nome}__count']
+            else:
+                resultado[nome] = acumulado[f'{nome}__{funcao}']
+        if not self.chaves:
+            return resultado.reset_index(drop=True)
+        return aplicar_esquema(resultado.reset_index()).sort_values(list(self.chaves), ignore_index=True)
+
+    def coletar(self):
+        if self.agregacoes is not None:
+            return self._agregar()
+
+        partes, total = [], 0
+        for bloco in self._blocos():
+            if self.limite is not None:
+                bloco = bloco.iloc[:self.limite - total]
+            partes.append(bloco)
+            total += len(bloco)
+            if self.limite is not None and total >= self.limite:
+                break
+        if not partes:
+            return pd.DataFrame(columns=self.colunas_lidas())
+        return aplicar_esquema(pd.concat(partes, ignore_index=True))
+
+    # Executa sem materializar o resultado: um DataFrame por bloco
+    def iterar(self):
+        if self.agregacoes is not None:
+            raise ValueError("Consultas com agregação só podem ser coletadas")
+        return self._blocos()
+
+
+def _valor(texto):
+    for tipo in (int, float):
+        try:
+            return tipo(texto)
+        except ValueError:
+            pass
+    return texto
+
+
+def _filtro_argumento(argumento):
+    coluna, op, valor = argumento
+    if op in ('in', 'not in'):
+        return coluna, op, [_valor(v) for v in valor.split(',')]
+    return coluna, op, _valor(valor)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Consulta aos registros ou métricas com leitura em blocos')
+    parser.add_argument('entrada', nargs='?', default=CAMINHO_METRICAS)
+    parser.add_argument('--filtro', nargs=3, action='append', default=[], metavar=('COLUNA', 'OPERADOR', 'VALOR'),
+                        help="Ex.: --filtro severidade == Crítico; para 'in', valores separados por vírgula")
+    parser.add_argument('--colunas', nargs='+', default=None)
+    parser.add_argument('--agrupar', nargs='+', default=None)
+    parser.add_argument('--agregar', nargs='+', default=None, metavar='COLUNA:FUNCAO',
+                        help='Ex.: quantidade:sum quantidade:mean z_score:max')
+    parser.add_argument('--limite', type=int, default=None)
+    parser.add_argument('--explicar', action='store_true', help='Mostra o plano antes do resultado')
+    parser.add_argument('--tamanho-bloco', type=int, default=TAMANHO_BLOCO)
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    configurar_por_argumentos(args)
+
+    consulta = Consulta(args.entrada, tamanho_bloco=args.tamanho_bloco)
+    consulta = consulta.filtrar(*[_filtro_argumento(f) for f in args.filtro])
+    if args.colunas:
+        consulta = consulta.selecionar(*args.colunas)
+    if args.agrupar:
+        consulta = consulta.agrupar(*args.agrupar)
+    if args.agregar:
+        agregacoes = {}
+        for item in args.agregar:
+            coluna, funcao = item.split(':')
+            agregacoes[f'{coluna}_{funcao}'] = (coluna, funcao)
+        consulta = consulta.agregar(**agregacoes)
+    if args.limite is not None:
+        consulta = consulta.limitar(args.limite)
+
+    if args.explicar:
+        print(consulta.explicar() + '\n')
+    with medir('consulta') as m:
+        resultado = consulta.coletar()
+        m['linhas'] = len(resultado)
+    print(resultado.to_string(index=False, max_rows=50))
+    finalizar_por_argumentos(args)
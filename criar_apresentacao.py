@@ -1,9 +1,29 @@
 from fpdf import FPDF
+import argparse
+import hashlib
+import io
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+from PIL import Image
+
+from analise_exploratoria import mascara_inconsistencias
+from armazenamento import carregar
+from cache_artefatos import CacheArtefatos, hash_conteudo
+from deteccao_duplicatas import COLUNAS_REGISTRO, marcar_duplicatas
+from deteccao_outliers import CAMINHO_METRICAS, especificacoes_graficos
+from esquema import NIVEIS_SEVERIDADE
+from instrumentacao import adicionar_argumentos, configurar_por_argumentos, finalizar_por_argumentos, medir
+from renderizacao import renderizar_graficos
+from simulacao_impacto_financeiro import calcular_impacto_financeiro
+
 # Configuração da apresentação em PDF
 class PDF(FPDF):
+    def __init__(self, unidade=None):
+        super().__init__()
+        self.unidade = unidade
+
     def header(self):
         # Fonte Arial negrito 15
         self.set_font('Arial', 'B', 15)
@@ -19,217 +39,194 @@ class PDF(FPDF):
         self.set_y(-15)
         # Arial itálico 8
         self.set_font('Arial', 'I', 8)
-        # Número da página
-        self.cell(0, 10, f'Página {self.page_no()}', 0, 0, 'C')
-
-# Criar o PDF
-pdf = PDF()
-pdf.add_page()
-
-# Capa
-pdf.set_font('Arial', 'B', 20)
-pdf.cell(0, 20, 'Projeto: Identificação de Anomalias', 0, 1, 'C')
-pdf.cell(0, 20, 'nos Registros de Consumo de Materiais Hospitalares', 0, 1, 'C')
-pdf.ln(20)
-
-pdf.set_font('Arial', '', 12)
-pdf.cell(0, 10, 'Desafio Escolhido: 1', 0, 1, 'C')
-pdf.ln(10)
-
-pdf.set_font('Arial', 'B', 14)
-pdf.cell(0, 10, 'Integrantes:', 0, 1, 'C')
-pdf.set_font('Arial', '', 12)
-pdf.cell(0, 10, 'Nome do Aluno - Matrícula', 0, 1, 'C')
-pdf.ln(20)
-
-pdf.set_font('Arial', 'I', 10)
-data_atual = datetime.now().strftime('%d/%m/%Y')
-pdf.cell(0, 10, f'Data de Entrega: {data_atual}', 0, 1, 'C')
-
-# Nova página - Introdução
-pdf.add_page()
-pdf.set_font('Arial', 'B', 16)
-pdf.cell(0, 10, '1. Introdução', 0, 1, 'L')
-pdf.ln(5)
-
-pdf.set_font('Arial', '', 12)
-texto_intro = """O projeto propõe a identificação de anomalias nos registros de consumo de materiais hospitalares em unidades operacionais, com o objetivo de detectar inconsistências que possam impactar a eficiência do estoque.
+        # Número da página (e unidade, nos relatórios por unidade)
+        rodape = f'Página {self.page_no()}'
+        if self.unidade:
+            rodape = f'{self.unidade} - {rodape}'
+        self.cell(0, 10, rodape, 0, 0, 'C')
+
+CAMINHO_PDF = './projeto_anomalias_consumo_2/apresentacao_anomalias_consumo.pdf'
+DIRETORIO_FIGURAS = './projeto_anomalias_consumo_2'
+DIRETORIO_RELATORIOS_UNIDADES = './projeto_anomalias_consumo_2/unidades'
+
+# As figuras são reduzidas para a largura em que aparecem no PDF e
+# recomprimidas em JPEG uma única vez. O cache é indexado pelo hash do PNG
+# de origem e pelos parâmetros abaixo, então todos os relatórios (geral e
+# por unidade) embutem o mesmo arquivo já pronto
+DIRETORIO_IMAGENS = './.cache_imagens'
+DPI_IMAGENS = 150
+QUALIDADE_JPEG = 85
+
+# Incrementar ao mudar o layout, para invalidar os PDFs já gerados
+VERSAO_LAYOUT = 3
+
+# Figuras de cada seção: (legenda, arquivo, x, largura em mm, nova página
+# antes, tem versão por unidade). Os gráficos das métricas têm uma versão
+# por unidade, desenhada a partir dos registros da unidade (ver
+# deteccao_outliers.especificacoes_graficos). Os demais comparam as unidades
+# ou vêm dos relatórios gerais: os relatórios por unidade os embutem com a
+# legenda '(todas as unidades)', todos com a mesma imagem reduzida
+FIGURAS = {
+    'eda': [
+        ('Distribuição de Registros por Unidade:', 'dist_por_unidade.png', 30, 150, False, False),
+        ('Distribuição de Registros por Material:', 'dist_por_material.png', 30, 150, True, False),
+        ('Distribuição de Quantidades por Tipo de Operação:', 'dist_quantidade_por_tipo.png', 30, 150, False, False),
+    ],
+    'outliers': [
+        ('Outliers Detectados por Z-score:', 'outliers_zscore.png', 20, 170, False, True),
+        ('Outliers Detectados por IQR:', 'outliers_iqr.png', 20, 170, True, True),
+    ],
+    'metricas': [
+        ('Distribuição de Severidade por Material e Unidade:', 'painel_severidade.png', 20, 170, False, True),
+        ('Heatmap de Anomalias por Material e Unidade:', 'heatmap_anomalias.png', 30, 150, True, False),
+        ('Dashboard de Alertas Críticos:', 'dashboard_alertas_criticos.png', 20, 170, False, True),
+    ],
+    'impacto': [
+        ('Dashboard de Impacto Financeiro:', 'dashboard_impacto_financeiro.png', 20, 170, False, False),
+        ('Percentual do Impacto Financeiro em Relação ao Valor Total:', 'percentual_impacto.png', 30, 150, True, False),
+    ],
+}
+
+
+def _reais(valor):
+    return 'R$ ' + f"{valor:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def _lista(itens):
+    itens = [str(i) for i in itens]
+    return itens[0] if len(itens) == 1 else ', '.join(itens[:-1]) + ' e ' + itens[-1]
+
+
+COLUNAS_IMPACTO = ['impacto_registro_incorreto', 'impacto_ausente', 'impacto_duplicacao']
+
+
+# Números citados no texto da apresentação, calculados a partir das métricas
+# de variação (saída de deteccao_outliers.py) e do impacto já valorado por
+# (material, unidade) (o 'por_grupo' de calcular_impacto_financeiro)
+def _resumo(df_metrics, por_grupo):
+    valor_total = float(por_grupo['valor_total'].sum())
+    impacto_total = float(por_grupo[COLUNAS_IMPACTO].to_numpy().sum())
+    severidade = df_metrics['severidade'].value_counts().reindex(NIVEIS_SEVERIDADE, fill_value=0)
+    return {
+        'total': len(df_metrics),
+        'data_min': df_metrics['data'].min().strftime('%d/%m/%Y'),
+        'data_max': df_metrics['data'].max().strftime('%d/%m/%Y'),
+        'unidades': sorted(df_metrics['unidade'].dropna().unique()),
+        'materiais': sorted(df_metrics['material'].dropna().unique()),
+        'entradas': int((df_metrics['tipo'] == 'entrada').sum()),
+        'saidas': int((df_metrics['tipo'] == 'saida').sum()),
+        'quantidade_nula': int(df_metrics['quantidade'].isna().sum()),
+        'sem_responsavel': int(df_metrics['responsavel'].isna().sum()),
+        'inconsistencias': int(mascara_inconsistencias(df_metrics).sum()),
+        'outliers_zscore': int(df_metrics['outlier_zscore'].sum()),
+        'outliers_iqr': int(df_metrics['outlier_iqr'].sum()),
+        'severidade': {nivel: int(n) for nivel, n in severidade.items()},
+        'valor_total': valor_total,
+        'impacto_total': impacto_total,
+        'percentual_impacto': impacto_total / valor_total * 100 if valor_total else 0.0,
+    }
+
+
+# Resumo geral (chave None) e, com `por_unidade`, o de cada unidade. O
+# impacto já calculado (ex.: pela etapa 'impacto' do pipeline) é
+# reaproveitado; sem ele, as duplicatas são detectadas e o impacto é
+# calculado uma única vez para todos os resumos
+def resumir_resultados(df_metrics, impacto=None, por_unidade=True):
+    if impacto is None:
+        marcado = marcar_duplicatas(df_metrics) if set(COLUNAS_REGISTRO) <= set(df_metrics.columns) else df_metrics
+        impacto = calcular_impacto_financeiro(marcado)
+    por_grupo = impacto['por_grupo']
+
+    resumos = {None: _resumo(df_metrics, por_grupo)}
+    if por_unidade:
+        unidade_grupo = por_grupo.index.get_level_values('unidade')
+        for unidade, df_unidade in df_metrics.groupby('unidade', observed=True):
+            resumos[unidade] = _resumo(df_unidade, por_grupo[unidade_grupo == unidade])
+    return resumos
+
+
+def textos_secoes(resumo):
+    total = resumo['total']
+    n_unidades, n_materiais = len(resumo['unidades']), len(resumo['materiais'])
+    pct_saidas = resumo['saidas'] / total * 100 if total else 0.0
+    pct_entradas = resumo['entradas'] / total * 100 if total else 0.0
+    iqr, z = resumo['outliers_iqr'], resumo['outliers_zscore']
+
+    if iqr > z:
+        comparacao = ("O método IQR mostrou-se mais sensível, o que sugere que as anomalias presentes estão mais "
+                      "relacionadas à distribuição dos dados do que a valores extremamente discrepantes.")
+    elif z > iqr:
+        comparacao = ("O método Z-score mostrou-se mais sensível, o que indica valores muito distantes da média "
+                      "do grupo mesmo dentro da faixa interquartil esperada.")
+    else:
+        comparacao = "Os dois métodos detectaram a mesma quantidade de registros."
+
+    if resumo['saidas'] > 2 * resumo['entradas']:
+        balanco = (f"Uma característica importante observada foi o desequilíbrio entre operações de entrada e saída: "
+                   f"{pct_saidas:.1f}% dos registros são de saída e apenas {pct_entradas:.1f}% de entrada, o que pode "
+                   f"indicar falhas no processo de registro de entradas de materiais.")
+    else:
+        balanco = (f"As operações de saída representam {pct_saidas:.1f}% dos registros e as de entrada, "
+                   f"{pct_entradas:.1f}%.")
+
+    severidade = '; '.join(f"{nivel}: {n}" for nivel, n in resumo['severidade'].items())
+    abrangencia = 'a unidade' if n_unidades == 1 else f'{n_unidades} unidades hospitalares'
+
+    return {
+        'introducao': """O projeto propõe a identificação de anomalias nos registros de consumo de materiais hospitalares em unidades operacionais, com o objetivo de detectar inconsistências que possam impactar a eficiência do estoque.
 
 A primeira etapa consistiu na análise de um conjunto de dados simulando registros manuais de entrada e saída de materiais hospitalares. Em seguida, foram aplicadas análises estatísticas para calcular desvios relevantes e criar métricas de variação.
 
 Técnicas como Z-score e intervalo interquartil (IQR) foram utilizadas para detectar outliers e padrões fora do comportamento esperado. Com base nesses dados, foi desenvolvido um painel de alertas que destaca os casos de consumo fora do padrão.
 
-Por fim, foi realizada uma simulação do impacto financeiro causado por falhas de registro, demonstrando como a baixa visibilidade pode afetar os custos da operação hospitalar."""
-
-pdf.multi_cell(0, 10, texto_intro)
-
-# Nova página - Análise Exploratória
-pdf.add_page()
-pdf.set_font('Arial', 'B', 16)
-pdf.cell(0, 10, '2. Análise Exploratória dos Dados', 0, 1, 'L')
-pdf.ln(5)
-
-pdf.set_font('Arial', '', 12)
-texto_analise = """A análise exploratória dos dados revelou informações importantes sobre a estrutura e qualidade dos registros de consumo. Foram identificados valores ausentes, inconsistências entre tipo de operação e quantidade, além de registros sem responsável.
-
-Os dados abrangem três unidades hospitalares (Santo Amaro, Moema e Morumbi) e cinco tipos de materiais (Seringa, Medicamentos, Tubo, Esparadrapo e Gaze), com operações de entrada e saída registradas ao longo de um período de aproximadamente seis meses.
-
-Uma característica importante observada foi o desequilíbrio entre operações de entrada e saída, com predominância significativa de registros de saída, o que pode indicar falhas no processo de registro de entradas de materiais."""
-
-pdf.multi_cell(0, 10, texto_analise)
-pdf.ln(5)
+Por fim, foi realizada uma simulação do impacto financeiro causado por falhas de registro, demonstrando como a baixa visibilidade pode afetar os custos da operação hospitalar.""",
 
-# Adicionar imagem da distribuição por unidade
-pdf.set_font('Arial', 'B', 12)
-pdf.cell(0, 10, 'Distribuição de Registros por Unidade:', 0, 1, 'L')
-if os.path.exists('./projeto_anomalias_consumo_2/dist_por_unidade.png'):
-    pdf.image('./projeto_anomalias_consumo_2/dist_por_unidade.png', x=30, y=None, w=150)
-    pdf.ln(5)
+        'eda': f"""A análise exploratória dos {total} registros de consumo revelou informações importantes sobre a estrutura e qualidade dos dados. Foram identificados {resumo['quantidade_nula']} registros com quantidade ausente, {resumo['inconsistencias']} inconsistências entre tipo de operação e quantidade e {resumo['sem_responsavel']} registros sem responsável.
 
-# Adicionar imagem da distribuição por material
-pdf.add_page()
-pdf.set_font('Arial', 'B', 12)
-pdf.cell(0, 10, 'Distribuição de Registros por Material:', 0, 1, 'L')
-if os.path.exists('./projeto_anomalias_consumo_2/dist_por_material.png'):
-    pdf.image('./projeto_anomalias_consumo_2/dist_por_material.png', x=30, y=None, w=150)
-    pdf.ln(5)
+Os dados abrangem {abrangencia} ({_lista(resumo['unidades'])}) e {n_materiais} tipos de materiais ({_lista(resumo['materiais'])}), com operações de entrada e saída registradas entre {resumo['data_min']} e {resumo['data_max']}.
 
-# Adicionar imagem da distribuição de quantidade por tipo
-pdf.set_font('Arial', 'B', 12)
-pdf.cell(0, 10, 'Distribuição de Quantidades por Tipo de Operação:', 0, 1, 'L')
-if os.path.exists('./projeto_anomalias_consumo_2/dist_quantidade_por_tipo.png'):
-    pdf.image('./projeto_anomalias_consumo_2/dist_quantidade_por_tipo.png', x=30, y=None, w=150)
-    pdf.ln(5)
+{balanco}""",
 
-# Nova página - Detecção de Outliers
-pdf.add_page()
-pdf.set_font('Arial', 'B', 16)
-pdf.cell(0, 10, '3. Detecção de Outliers', 0, 1, 'L')
-pdf.ln(5)
-
-pdf.set_font('Arial', '', 12)
-texto_outliers = """Para identificar anomalias nos registros de consumo, foram aplicadas duas técnicas estatísticas complementares:
+        'outliers': f"""Para identificar anomalias nos registros de consumo, foram aplicadas duas técnicas estatísticas complementares:
 
 1. Z-score: Identifica valores que estão a mais de 3 desvios padrão da média.
 2. Intervalo Interquartil (IQR): Identifica valores abaixo de Q1-1.5*IQR ou acima de Q3+1.5*IQR.
 
 A análise foi realizada separadamente para cada material e unidade, permitindo identificar padrões específicos de consumo anômalo em diferentes contextos operacionais.
 
-Interessantemente, neste conjunto de dados, o método IQR mostrou-se mais eficaz na detecção de outliers, identificando 7 registros anômalos, enquanto o método Z-score não detectou outliers significativos. Isso sugere que as anomalias presentes estão mais relacionadas à distribuição dos dados do que a valores extremamente discrepantes."""
-
-pdf.multi_cell(0, 10, texto_outliers)
-pdf.ln(5)
-
-# Adicionar imagem de outliers por Z-score
-pdf.set_font('Arial', 'B', 12)
-pdf.cell(0, 10, 'Outliers Detectados por Z-score:', 0, 1, 'L')
-if os.path.exists('./projeto_anomalias_consumo_2/outliers_zscore.png'):
-    pdf.image('./projeto_anomalias_consumo_2/outliers_zscore.png', x=20, y=None, w=170)
-    pdf.ln(5)
-
-# Adicionar imagem de outliers por IQR
-pdf.add_page()
-pdf.set_font('Arial', 'B', 12)
-pdf.cell(0, 10, 'Outliers Detectados por IQR:', 0, 1, 'L')
-if os.path.exists('./projeto_anomalias_consumo_2/outliers_iqr.png'):
-    pdf.image('./projeto_anomalias_consumo_2/outliers_iqr.png', x=20, y=None, w=170)
-    pdf.ln(5)
-
-# Nova página - Métricas de Variação e Painel de Alertas
-pdf.add_page()
-pdf.set_font('Arial', 'B', 16)
-pdf.cell(0, 10, '4. Métricas de Variação e Painel de Alertas', 0, 1, 'L')
-pdf.ln(5)
+Neste conjunto de dados, o método IQR identificou {iqr} registros anômalos e o método Z-score, {z}. {comparacao}""",
 
-pdf.set_font('Arial', '', 12)
-texto_metricas = """Com base nos resultados da detecção de outliers, foram criadas métricas de variação para quantificar o desvio de cada registro em relação ao comportamento esperado. Essas métricas incluem:
+        'metricas': f"""Com base nos resultados da detecção de outliers, foram criadas métricas de variação para quantificar o desvio de cada registro em relação ao comportamento esperado. Essas métricas incluem:
 
 1. Z-score: Medida de quantos desvios padrão um valor está da média.
 2. Variação percentual: Diferença percentual em relação à média.
 3. Classificação de severidade: Categorização em Normal, Atenção, Alerta e Crítico.
 
-Essas métricas foram utilizadas para desenvolver um painel de alertas que destaca os casos mais críticos de consumo fora do padrão, permitindo uma rápida identificação e priorização de ações corretivas.
-
-No contexto hospitalar, a detecção precoce de anomalias no consumo de materiais é especialmente importante, pois pode indicar desde erros de registro até possíveis desvios ou uso inadequado de recursos essenciais para o atendimento aos pacientes."""
-
-pdf.multi_cell(0, 10, texto_metricas)
-pdf.ln(5)
-
-# Adicionar imagem do painel de severidade
-pdf.set_font('Arial', 'B', 12)
-pdf.cell(0, 10, 'Distribuição de Severidade por Material e Unidade:', 0, 1, 'L')
-if os.path.exists('./projeto_anomalias_consumo_2/painel_severidade.png'):
-    pdf.image('./projeto_anomalias_consumo_2/painel_severidade.png', x=20, y=None, w=170)
-    pdf.ln(5)
-
-# Adicionar imagem do heatmap de anomalias
-pdf.add_page()
-pdf.set_font('Arial', 'B', 12)
-pdf.cell(0, 10, 'Heatmap de Anomalias por Material e Unidade:', 0, 1, 'L')
-if os.path.exists('./projeto_anomalias_consumo_2/heatmap_anomalias.png'):
-    pdf.image('./projeto_anomalias_consumo_2/heatmap_anomalias.png', x=30, y=None, w=150)
-    pdf.ln(5)
-
-# Adicionar imagem do dashboard de alertas críticos
-pdf.set_font('Arial', 'B', 12)
-pdf.cell(0, 10, 'Dashboard de Alertas Críticos:', 0, 1, 'L')
-if os.path.exists('./projeto_anomalias_consumo_2/dashboard_alertas_criticos.png'):
-    pdf.image('./projeto_anomalias_consumo_2/dashboard_alertas_criticos.png', x=20, y=None, w=170)
-    pdf.ln(5)
+Registros por severidade - {severidade}.
 
-# Nova página - Simulação do Impacto Financeiro
-pdf.add_page()
-pdf.set_font('Arial', 'B', 16)
-pdf.cell(0, 10, '5. Simulação do Impacto Financeiro', 0, 1, 'L')
-pdf.ln(5)
+Essas métricas foram utilizadas para desenvolver um painel de alertas que destaca os casos mais críticos de consumo fora do padrão, permitindo uma rápida identificação e priorização de ações corretivas.""",
 
-pdf.set_font('Arial', '', 12)
-texto_impacto = """Para quantificar o impacto financeiro das falhas de registro, foi realizada uma simulação considerando três tipos principais de falhas:
+        'impacto': f"""Para quantificar o impacto financeiro das falhas de registro, foi realizada uma simulação considerando três tipos principais de falhas:
 
 1. Registros incorretos: Quantidades registradas com valores muito diferentes do esperado.
 2. Registros ausentes: Materiais consumidos mas não registrados no sistema.
 3. Registros duplicados: Mesma operação registrada mais de uma vez.
 
-A simulação utilizou preços estimados para cada material hospitalar e calculou o impacto financeiro total, bem como sua distribuição por tipo de falha, material e unidade operacional.
+A simulação utilizou preços estimados para cada material hospitalar. O impacto financeiro total estimado é de {_reais(resumo['impacto_total'])}, {resumo['percentual_impacto']:.2f}% do valor total movimentado ({_reais(resumo['valor_total'])}).
 
-No contexto hospitalar, o impacto financeiro das falhas de registro vai além do valor direto dos materiais, podendo afetar a qualidade do atendimento aos pacientes, gerar compras emergenciais com preços premium e causar atrasos em procedimentos devido à falta de materiais essenciais."""
+No contexto hospitalar, o impacto financeiro das falhas de registro vai além do valor direto dos materiais, podendo afetar a qualidade do atendimento aos pacientes, gerar compras emergenciais com preços premium e causar atrasos em procedimentos devido à falta de materiais essenciais.""",
 
-pdf.multi_cell(0, 10, texto_impacto)
-pdf.ln(5)
+        'conclusoes': f"""A análise dos registros de consumo de materiais hospitalares revelou a presença de anomalias que impactam a eficiência do estoque e geram custos adicionais para a operação. As principais conclusões são:
 
-# Adicionar imagem do dashboard de impacto financeiro
-pdf.set_font('Arial', 'B', 12)
-pdf.cell(0, 10, 'Dashboard de Impacto Financeiro:', 0, 1, 'L')
-if os.path.exists('./projeto_anomalias_consumo_2/dashboard_impacto_financeiro.png'):
-    pdf.image('./projeto_anomalias_consumo_2/dashboard_impacto_financeiro.png', x=20, y=None, w=170)
-    pdf.ln(5)
-
-# Adicionar imagem do percentual de impacto
-pdf.add_page()
-pdf.set_font('Arial', 'B', 12)
-pdf.cell(0, 10, 'Percentual do Impacto Financeiro em Relação ao Valor Total:', 0, 1, 'L')
-if os.path.exists('./projeto_anomalias_consumo_2/percentual_impacto.png'):
-    pdf.image('./projeto_anomalias_consumo_2/percentual_impacto.png', x=30, y=None, w=150)
-    pdf.ln(5)
-
-# Nova página - Conclusões e Recomendações
-pdf.add_page()
-pdf.set_font('Arial', 'B', 16)
-pdf.cell(0, 10, '6. Conclusões e Recomendações', 0, 1, 'L')
-pdf.ln(5)
-
-pdf.set_font('Arial', '', 12)
-texto_conclusoes = """A análise dos registros de consumo de materiais hospitalares revelou a presença de anomalias significativas que impactam a eficiência do estoque e geram custos adicionais para a operação. As principais conclusões são:
+1. Foram identificados {iqr} registros com valores discrepantes pelo método IQR e {z} pelo Z-score, indicando possíveis erros de digitação ou falhas no processo de registro.
 
-1. Foram identificados registros com valores discrepantes através do método IQR, indicando possíveis erros de digitação ou falhas no processo de registro.
+2. {resumo['inconsistencias']} inconsistências entre tipo de operação (entrada/saída) e sinal da quantidade sugerem problemas no treinamento dos responsáveis ou no sistema de registro.
 
-2. Inconsistências entre tipo de operação (entrada/saída) e sinal da quantidade sugerem problemas no treinamento dos responsáveis ou no sistema de registro.
+3. {resumo['sem_responsavel']} registros sem responsável dificultam a rastreabilidade e a atribuição de responsabilidades.
 
-3. A ausência de responsável em alguns registros dificulta a rastreabilidade e a atribuição de responsabilidades.
+4. As saídas correspondem a {pct_saidas:.1f}% dos registros, o que deve ser conferido com o fluxo real de entradas de materiais.
 
-4. O desequilíbrio entre operações de entrada e saída sugere falhas sistemáticas no registro de entradas de materiais.
-
-5. O impacto financeiro das falhas de registro é significativo, representando uma parcela considerável do valor total movimentado.
+5. O impacto financeiro estimado das falhas de registro representa {resumo['percentual_impacto']:.2f}% do valor total movimentado.
 
 Com base nessas conclusões, recomenda-se:
 
@@ -245,12 +242,200 @@ Com base nessas conclusões, recomenda-se:
 
 6. Desenvolver um painel de monitoramento em tempo real para acompanhar os indicadores de qualidade dos registros.
 
-7. Estabelecer protocolos específicos para o registro de materiais de alto valor, como medicamentos, para reduzir o impacto financeiro de possíveis falhas."""
-
-pdf.multi_cell(0, 10, texto_conclusoes)
+7. Estabelecer protocolos específicos para o registro de materiais de alto valor, como medicamentos, para reduzir o impacto financeiro de possíveis falhas.""",
+    }
+
+
+# Caminho da versão reduzida da figura, gerada só se ainda não estiver no cache
+def preparar_imagem(caminho, largura_mm, diretorio_cache=DIRETORIO_IMAGENS):
+    with open(caminho, 'rb') as f:
+        conteudo = f.read()
+    largura_px = round(largura_mm / 25.4 * DPI_IMAGENS)
+    chave = hashlib.sha256(conteudo + f'{largura_px}-{QUALIDADE_JPEG}'.encode()).hexdigest()[:32]
+    destino = os.path.join(diretorio_cache, f'{chave}.jpg')
+    if os.path.exists(destino):
+        return destino
+
+    os.makedirs(diretorio_cache, exist_ok=True)
+    with Image.open(io.BytesIO(conteudo)) as imagem:
+        if imagem.mode in ('RGBA', 'LA', 'P'):
+            imagem = imagem.convert('RGBA')
+            fundo = Image.new('RGB', imagem.size, 'white')
+            fundo.paste(imagem, mask=imagem.getchannel('A'))
+            imagem = fundo
+        else:
+            imagem = imagem.convert('RGB')
+        if imagem.width > largura_px:
+            altura_px = round(imagem.height * largura_px / imagem.width)
+            imagem = imagem.resize((largura_px, altura_px), Image.Resampling.LANCZOS)
+        temporario = f'{destino}.tmp{os.getpid()}'
+        imagem.save(temporario, 'JPEG', quality=QUALIDADE_JPEG, optimize=True)
+    os.replace(temporario, destino)
+    return destino
+
+
+# Diretório das figuras de uma unidade
+def diretorio_figuras_unidade(unidade, diretorio=DIRETORIO_RELATORIOS_UNIDADES):
+    return os.path.join(diretorio, 'figuras', str(unidade))
+
+
+# Versões reduzidas de todas as figuras existentes, por nome de arquivo. Com
+# `unidade`, as figuras que têm versão por unidade vêm do diretório dela e
+# as demais de `gerais` (as imagens já preparadas do relatório geral), se dado
+def preparar_imagens(diretorio=DIRETORIO_FIGURAS, unidade=None, gerais=None):
+    imagens = {}
+    for figuras in FIGURAS.values():
+        for _, arquivo, _, largura, _, por_unidade in figuras:
+            if unidade is not None and por_unidade:
+                caminho = os.path.join(diretorio_figuras_unidade(unidade), arquivo)
+            elif gerais is not None:
+                if arquivo in gerais:
+                    imagens[arquivo] = gerais[arquivo]
+                continue
+            else:
+                caminho = os.path.join(diretorio, arquivo)
+            if arquivo not in imagens and os.path.exists(caminho):
+                imagens[arquivo] = preparar_imagem(caminho, largura)
+    return imagens
+
+
+def _secao(pdf, titulo, texto, figuras, imagens, unidade=None):
+    pdf.add_page()
+    pdf.set_font('Arial', 'B', 16)
+    pdf.cell(0, 10, titulo, 0, 1, 'L')
+    pdf.ln(5)
 
-# Salvar o PDF
-pdf_path = './projeto_anomalias_consumo_2/apresentacao_anomalias_consumo.pdf'
-pdf.output(pdf_path)
+    pdf.set_font('Arial', '', 12)
+    pdf.multi_cell(0, 10, texto)
+    pdf.ln(5)
 
-print(f"Apresentação em PDF criada com sucesso: {pdf_path}")
+    for legenda, arquivo, x, largura, nova_pagina, por_unidade in figuras:
+        if nova_pagina:
+            pdf.add_page()
+        if unidade is not None and not por_unidade:
+            legenda = legenda.rstrip(':') + ' (todas as unidades):'
+        pdf.set_font('Arial', 'B', 12)
+        pdf.cell(0, 10, legenda, 0, 1, 'L')
+        if arquivo in imagens:
+            pdf.image(imagens[arquivo], x=x, y=None, w=largura)
+            pdf.ln(5)
+
+
+def _montar_pdf(resumo, imagens, unidade=None):
+    textos = textos_secoes(resumo)
+    pdf = PDF(unidade)
+    pdf.add_page()
+
+    # Capa
+    pdf.set_font('Arial', 'B', 20)
+    pdf.cell(0, 20, 'Projeto: Identificação de Anomalias', 0, 1, 'C')
+    pdf.cell(0, 20, 'nos Registros de Consumo de Materiais Hospitalares', 0, 1, 'C')
+    if unidade:
+        pdf.set_font('Arial', 'B', 16)
+        pdf.cell(0, 10, f'Unidade: {unidade}', 0, 1, 'C')
+    pdf.ln(20)
+
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, 'Desafio Escolhido: 1', 0, 1, 'C')
+    pdf.ln(10)
+
+    pdf.set_font('Arial', 'B', 14)
+    pdf.cell(0, 10, 'Integrantes:', 0, 1, 'C')
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, 'Nome do Aluno - Matrícula', 0, 1, 'C')
+    pdf.ln(20)
+
+    pdf.set_font('Arial', 'I', 10)
+    pdf.cell(0, 10, f"Data de Entrega: {resumo['data_entrega']}", 0, 1, 'C')
+
+    _secao(pdf, '1. Introdução', textos['introducao'], [], imagens)
+    _secao(pdf, '2. Análise Exploratória dos Dados', textos['eda'], FIGURAS['eda'], imagens, unidade)
+    _secao(pdf, '3. Detecção de Outliers', textos['outliers'], FIGURAS['outliers'], imagens, unidade)
+    _secao(pdf, '4. Métricas de Variação e Painel de Alertas', textos['metricas'], FIGURAS['metricas'], imagens, unidade)
+    _secao(pdf, '5. Simulação do Impacto Financeiro', textos['impacto'], FIGURAS['impacto'], imagens, unidade)
+    _secao(pdf, '6. Conclusões e Recomendações', textos['conclusoes'], [], imagens)
+    return pdf
+
+
+# Gera o PDF a partir do resumo dos resultados. O PDF só é refeito quando o
+# resumo, as figuras ou o layout mudaram desde a última geração (a
+# assinatura fica em um arquivo ao lado do PDF)
+def gerar_apresentacao(pdf_path=CAMINHO_PDF, resumo=None, imagens=None, unidade=None,
+                       caminho_metricas=CAMINHO_METRICAS, forcar=False):
+    if resumo is None:
+        resumo = resumir_resultados(carregar(caminho_metricas))[unidade]
+    if imagens is None:
+        imagens = preparar_imagens(unidade=unidade)
+    resumo = {**resumo, 'data_entrega': datetime.now().strftime('%d/%m/%Y')}
+
+    assinatura = hash_conteudo(VERSAO_LAYOUT, resumo, imagens, unidade)
+    caminho_assinatura = f'{pdf_path}.assinatura'
+    if not forcar and os.path.exists(pdf_path) and os.path.exists(caminho_assinatura):
+        with open(caminho_assinatura) as f:
+            if f.read() == assinatura:
+                return pdf_path
+
+    # Salvar o PDF
+    _montar_pdf(resumo, imagens, unidade).output(pdf_path)
+    with open(caminho_assinatura, 'w') as f:
+        f.write(assinatura)
+    return pdf_path
+
+
+# Gráficos das métricas de cada unidade, renderizados juntos (em paralelo e,
+# com um CacheArtefatos, só os que mudaram)
+def renderizar_graficos_unidades(df_metrics, cache=None):
+    especificacoes = []
+    for unidade, df_unidade in df_metrics.groupby('unidade', observed=True):
+        destino = diretorio_figuras_unidade(unidade)
+        os.makedirs(destino, exist_ok=True)
+        especificacoes += especificacoes_graficos(df_unidade, destino, unidade)
+    return renderizar_graficos(especificacoes, cache=cache)
+
+
+# Um PDF por unidade, gerados em paralelo. O resumo de cada unidade sai de
+# uma única leitura das métricas. As figuras gerais são preparadas uma vez
+# antes de distribuir o trabalho e compartilhadas por todos os relatórios;
+# cada unidade acrescenta as suas
+def gerar_por_unidade(caminho_metricas=CAMINHO_METRICAS, diretorio=DIRETORIO_RELATORIOS_UNIDADES, processos=None,
+                      resumos=None, forcar=False, df_metrics=None, cache=None):
+    df_metrics = df_metrics if df_metrics is not None else carregar(caminho_metricas)
+    resumos = resumos if resumos is not None else resumir_resultados(df_metrics)
+    os.makedirs(diretorio, exist_ok=True)
+    renderizar_graficos_unidades(df_metrics, cache)
+
+    gerais = preparar_imagens()
+    imagens = {unidade: preparar_imagens(unidade=unidade, gerais=gerais) for unidade in resumos if unidade is not None}
+
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        futuros = [
+            executor.submit(gerar_apresentacao, os.path.join(diretorio, f'apresentacao_{unidade}.pdf'),
+                            resumo, imagens[unidade], unidade, forcar=forcar)
+            for unidade, resumo in resumos.items() if unidade is not None
+        ]
+        return [f.result() for f in futuros]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gera a apresentação em PDF do projeto')
+    parser.add_argument('--metricas', default=CAMINHO_METRICAS, help='Métricas de variação usadas nos textos')
+    parser.add_argument('--por-unidade', action='store_true', help='Gera também um PDF por unidade')
+    parser.add_argument('--processos', type=int, default=None)
+    parser.add_argument('--forcar', action='store_true', help='Refaz os PDFs mesmo sem mudanças nos resultados')
+    parser.add_argument('--sem-cache', action='store_true', help='Redesenha os gráficos, ignorando o cache de artefatos')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    configurar_por_argumentos(args)
+
+    with medir('resumo'):
+        df_metrics = carregar(args.metricas)
+        resumos = resumir_resultados(df_metrics)
+    with medir('pdf'):
+        pdf_path = gerar_apresentacao(resumo=resumos[None], forcar=args.forcar)
+    print(f"Apresentação em PDF criada com sucesso: {pdf_path}")
+    if args.por_unidade:
+        with medir('pdf_unidades'):
+            caminhos = gerar_por_unidade(processos=args.processos, resumos=resumos, forcar=args.forcar,
+                                         df_metrics=df_metrics, cache=None if args.sem_cache else CacheArtefatos())
+        print(f"{len(caminhos)} apresentações por unidade criadas em '{DIRETORIO_RELATORIOS_UNIDADES}'")
+    finalizar_por_argumentos(args)
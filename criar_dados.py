@@ -1,16 +1,34 @@
+import argparse
+from datetime import date, timedelta
+
 import pandas as pd
 import numpy as np
 from faker import Faker
 import random
 
+from armazenamento import salvar
+from esquema import MATERIAIS_CADASTRADOS, TIPOS_OPERACAO, UNIDADES_CADASTRADAS
+
 # Inicializa o gerador de dados fictícios
 fake = Faker()
 
 # Parâmetros da simulação
 num_registros = 100  # Quantidade inicial de registros a serem gerados
-unidades = ['Morumbi', 'Santo Amaro', 'Moema']  # Unidades hospitalares
-materiais = ['Seringa', 'Gaze', 'Tubo', 'Medicamentos', 'Esparadrapo']  # Tipos de materiais
-tipos = ['entrada', 'saida']  # Tipos de movimentação de estoque
+unidades = UNIDADES_CADASTRADAS  # Unidades hospitalares
+materiais = MATERIAIS_CADASTRADOS  # Tipos de materiais
+tipos = TIPOS_OPERACAO  # Tipos de movimentação de estoque
+
+# Parâmetros do gerador vetorizado
+TAMANHO_BLOCO = 1_000_000  # Registros gerados (e gravados) por bloco
+TAMANHO_POOL_NOMES = 1_000  # Nomes de responsáveis pré-sorteados
+DIAS_PERIODO = 182  # Aproximadamente seis meses, como em date_between('-6M')
+
+# Taxas de defeitos injetados (as mesmas do modo original)
+TAXA_AUSENTES = 0.01
+TAXA_SINAL_INVERTIDO = 0.02
+TAXA_DUPLICATAS = 0.05
+TAXA_OUTLIERS = 5 / num_registros  # 5 outliers a cada 100 registros base
+FATOR_OUTLIER = 10
 
 # Função para gerar um DataFrame com dados simulados
 def gerar_dados_simulados(n):
@@ -38,28 +56,132 @@ def gerar_dados_simulados(n):
         })
     return pd.DataFrame(dados)
 
-# Gera os dados simulados
-df = gerar_dados_simulados(num_registros)
+# Introduz os defeitos do modo original (ausentes, sinal invertido, duplicatas e outliers)
+def injetar_defeitos(df):
+    # 1. Introduz valores ausentes (simula falhas no preenchimento de dados)
+    for col in ['quantidade', 'responsavel']:
+        df.loc[df.sample(frac=0.01).index, col] = None  # 1% dos registros com valores ausentes
+
+    # 2. Inverte o sinal da quantidade incorretamente (simula erro de digitação)
+    df.loc[df.sample(frac=0.02).index, 'quantidade'] *= -1  # 2% dos registros com sinal invertido
+
+    # 3. Duplica alguns registros (simula erro humano de entrada duplicada)
+    duplicatas = df.sample(frac=0.05)  # 5% dos registros duplicados
+    df = pd.concat([df, duplicatas], ignore_index=True)
+
+    # 4. Cria registros com quantidades exageradas (simula outliers)
+    outliers = df.sample(5)
+    outliers['quantidade'] = outliers['quantidade'] * 10  # Multiplica por 10 para exagerar
+    df = pd.concat([df, outliers], ignore_index=True)
+    return df
+
+# Sorteia um pool fixo de nomes; cada registro recebe um índice desse pool
+def gerar_pool_nomes(tamanho, seed):
+    gerador_nomes = Faker()
+    gerador_nomes.seed_instance(seed)
+    return np.array([gerador_nomes.first_name() for _ in range(tamanho)], dtype=object)
+
+# Gera n registros de uma vez, com todas as colunas sorteadas como arrays NumPy
+def gerar_dados_vetorizado(n, rng, pool_nomes, data_final=None):
+    data_final = data_final or date.today()
+    data_inicial = np.datetime64(data_final - timedelta(days=DIAS_PERIODO), 'D')
+
+    # Categorias sorteadas como códigos inteiros
+    cod_unidade = rng.integers(0, len(unidades), n)
+    cod_material = rng.integers(0, len(materiais), n)
+    eh_entrada = rng.random(n) < 0.05  # 5% entradas, 95% saídas
+
+    # Entradas têm quantidade positiva; saídas, negativa
+    quantidade = np.where(
+        eh_entrada,
+        rng.integers(1, 500, n),
+        -rng.integers(1, 20, n)
+    ).astype('float64')
+
+    datas = data_inicial + rng.integers(0, DIAS_PERIODO + 1, n).astype('timedelta64[D]')
+    responsaveis = pool_nomes[rng.integers(0, len(pool_nomes), n)]
+
+    return pd.DataFrame({
+        'data': datas,
+        'unidade': pd.Categorical.from_codes(cod_unidade, categories=unidades),
+        'material': pd.Categorical.from_codes(cod_material, categories=materiais),
+        'tipo': pd.Categorical.from_codes(eh_entrada.astype('int8') ^ 1, categories=tipos),
+        'quantidade': quantidade,
+        'responsavel': responsaveis
+    })
+
+# Versão vetorizada de injetar_defeitos, aplicada a cada bloco com o gerador do bloco
+def injetar_defeitos_vetorizado(df, rng):
+    n = len(df)
+
+    # 1. Valores ausentes
+    for col in ['quantidade', 'responsavel']:
+        ausentes = rng.random(n) < TAXA_AUSENTES
+        df.loc[ausentes, col] = None
+
+    # 2. Sinal invertido
+    invertidos = rng.random(n) < TAXA_SINAL_INVERTIDO
+    df.loc[invertidos, 'quantidade'] *= -1
+
+    # 3. Duplicatas
+    n_duplicatas = int(round(n * TAXA_DUPLICATAS))
+    duplicatas = df.iloc[rng.choice(n, n_duplicatas, replace=False)]
+    df = pd.concat([df, duplicatas], ignore_index=True)
+
+    # 4. Outliers
+    n_outliers = max(1, int(round(n * TAXA_OUTLIERS)))
+    outliers = df.iloc[rng.choice(len(df), n_outliers, replace=False)].copy()
+    outliers['quantidade'] = outliers['quantidade'] * FATOR_OUTLIER
+    df = pd.concat([df, outliers], ignore_index=True)
+
+    # Embaralha para que duplicatas e outliers não fiquem no fim do bloco
+    return df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+# Gera os blocos um a um; cada bloco tem um gerador próprio derivado da seed,
+# então o resultado é reprodutível e independente do tamanho da memória
+def gerar_blocos(n_total, seed=42, tamanho_bloco=TAMANHO_BLOCO, data_final=None):
+    n_blocos = -(-n_total // tamanho_bloco)
+    sementes = np.random.SeedSequence(seed).spawn(n_blocos + 1)
+    pool_nomes = gerar_pool_nomes(TAMANHO_POOL_NOMES, int(sementes[-1].generate_state(1)[0]))
+
+    for i in range(n_blocos):
+        rng = np.random.default_rng(sementes[i])
+        n = min(tamanho_bloco, n_total - i * tamanho_bloco)
+        df = gerar_dados_vetorizado(n, rng, pool_nomes, data_final)
+        yield injetar_defeitos_vetorizado(df, rng)
 
-# 1. Introduz valores ausentes (simula falhas no preenchimento de dados)
-for col in ['quantidade', 'responsavel']:
-    df.loc[df.sample(frac=0.01).index, col] = None  # 1% dos registros com valores ausentes
+# Grava os blocos em disco à medida que são gerados (memória limitada a um bloco).
+# O formato segue a extensão do caminho: .csv ou dataset .parquet particionado
+def gerar_dados_em_blocos(caminho, n_total, seed=42, tamanho_bloco=TAMANHO_BLOCO, data_final=None):
+    total = 0
+    for i, bloco in enumerate(gerar_blocos(n_total, seed, tamanho_bloco, data_final)):
+        salvar(bloco, caminho, anexar=(i > 0))
+        total += len(bloco)
+    return total
 
-# 2. Inverte o sinal da quantidade incorretamente (simula erro de digitação)
-df.loc[df.sample(frac=0.02).index, 'quantidade'] *= -1  # 2% dos registros com sinal invertido
 
-# 3. Duplica alguns registros (simula erro humano de entrada duplicada)
-duplicatas = df.sample(frac=0.05)  # 5% dos registros duplicados
-df = pd.concat([df, duplicatas], ignore_index=True)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gera dados simulados de consumo de materiais')
+    parser.add_argument('--registros', type=int, default=num_registros,
+                        help='Quantidade de registros base a gerar')
+    parser.add_argument('--vetorizado', action='store_true',
+                        help='Usa o gerador vetorizado, gravando em blocos')
+    parser.add_argument('--tamanho-bloco', type=int, default=TAMANHO_BLOCO)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--saida', default='dados_consumo_simulados.csv')
+    args = parser.parse_args()
 
-# 4. Cria registros com quantidades exageradas (simula outliers)
-outliers = df.sample(5)
-outliers['quantidade'] = outliers['quantidade'] * 10  # Multiplica por 10 para exagerar
-df = pd.concat([df, outliers], ignore_index=True)
+    if args.vetorizado:
+        total = gerar_dados_em_blocos(args.saida, args.registros, args.seed, args.tamanho_bloco)
+        print(f"{total} registros gravados em {args.saida}")
+    else:
+        # Gera os dados simulados
+        df = gerar_dados_simulados(args.registros)
+        df = injetar_defeitos(df)
 
-# Exibe uma amostra dos dados gerados
-print(df.head(10))
-print(df.describe())
+        # Exibe uma amostra dos dados gerados
+        print(df.head(10))
+        print(df.describe())
 
-# Exporta os dados para um arquivo CSV
-df.to_csv('dados_consumo_simulados.csv', index=False)
+        # Exporta os dados (CSV ou Parquet, conforme a extensão)
+        salvar(df, args.saida)
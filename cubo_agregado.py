@@ -0,0 +1,265 @@
+import argparse
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from analise_exploratoria import COLUNAS_CATEGORIAS, escrever_resultados, mascara_inconsistencias
+from armazenamento import ler_em_blocos
+from deteccao_duplicatas import COLUNAS_REGISTRO, hash_linhas, marcar_duplicatas_exatas
+from esquema import NIVEIS_SEVERIDADE, aplicar_esquema
+from precos import TabelaPrecos, precos_por_linha
+from simulacao_impacto_financeiro import (
+    CAMINHO_METRICAS, consolidar_impacto, escrever_relatorio, media_por_grupo, medidas_impacto, precos_materiais
+)
+
+CAMINHO_CUBO = './cubo_consumo.parquet'
+
+# Cubo agregado unidade x material x tipo x dia. Cada célula guarda somas e
+# contagens (todas aditivas), então o cubo pode ser atualizado lote a lote e
+# reagregado para qualquer subconjunto das dimensões (mês, unidade,
+# material...) sem voltar aos registros. Os relatórios de EDA e de impacto
+# podem ser servidos a partir dele, que tem no máximo
+# unidades x materiais x tipos x dias linhas.
+#
+# Duplicatas exatas são confirmadas como em simulacao_impacto_financeiro.py
+# (toda repetição após a primeira ocorrência), inclusive entre lotes: o cubo
+# guarda, ao lado da tabela, os hashes dos registros já incorporados. Entre
+# lotes a comparação é só pelo hash de 64 bits. Como duplicatas exatas têm a
+# mesma data, os hashes ficam em um arquivo por mês (<cubo>.registros/AAAAMM.npy)
+# e cada lote só carrega e reescreve os meses que contém: o custo de um lote
+# não depende do tamanho do histórico. O total em disco continua sendo 8 bytes
+# por registro incorporado, o preço de confirmar duplicatas sem reler o livro.
+#
+# O valor movimentado não é guardado: ele é a quantidade vezes o preço do
+# material, calculado na reagregação com a tabela de preços (um preço fixo
+# por material ou o vigente em cada dia, ver precos.py).
+
+DIMENSOES = ['unidade', 'material', 'tipo', 'dia']
+
+# Contagem por nível de severidade: Normal -> n_normal, Atenção -> n_atencao...
+COLUNAS_SEVERIDADE = {
+    nivel: 'n_' + nivel.lower().replace('ç', 'c').replace('ã', 'a').replace('í', 'i')
+    for nivel in NIVEIS_SEVERIDADE
+}
+
+
+MES_SEM_DATA = 0  # Partição dos hashes de registros sem data
+
+
+# Diretório dos hashes dos registros incorporados, gravado ao lado do cubo
+def _caminho_registros(caminho):
+    return f'{caminho}.registros'
+
+
+# Mês (AAAAMM) de cada data, MES_SEM_DATA nas nulas
+def _meses(datas):
+    return (datas.dt.year * 100 + datas.dt.month).fillna(MES_SEM_DATA).to_numpy(dtype='int64')
+
+
+# Medidas de cada registro; as de severidade e impacto só existem quando
+# df já traz as métricas de variação (saída de deteccao_outliers.py)
+def _medidas(df):
+    quantidade = df['quantidade'].astype('float64')
+    medidas = pd.DataFrame({
+        'n_linhas': np.ones(len(df), dtype='int64'),
+        'n_registros': quantidade.notna(),
+        'soma_quantidade': quantidade.fillna(0),
+        'qtd_total': quantidade.abs().fillna(0),
+        'sem_responsavel': df['responsavel'].isna() if 'responsavel' in df.columns else False,
+        'inconsistencias': mascara_inconsistencias(df),
+    }, index=df.index)
+
+    if 'severidade' in df.columns:
+        for nivel, coluna in COLUNAS_SEVERIDADE.items():
+            medidas[coluna] = (df['severidade'] == nivel).to_numpy()
+    if {'severidade', 'z_score'} <= set(df.columns):
+        impacto = medidas_impacto(df)
+        medidas = medidas.join(impacto.drop(columns=['n_registros', 'qtd_total']))
+    return medidas
+
+
+class CuboAgregado:
+    """Cubo de agregados por unidade, material, tipo e dia.
+
+    `tabela` tem uma linha por célula não vazia, com as dimensões como
+    colunas e uma coluna por medida. Linhas sem data ou sem categoria
+    entram em células com chave nula, para que os totais fechem com os
+    registros.
+    """
+
+    def __init__(self, tabela=None, origem_registros=None):
+        self.tabela = tabela
+        # Hashes (ordenados) dos registros já incorporados, por mês. Só os
+        # meses usados são lidos de `origem_registros`
+        self.origem_registros = origem_registros
+        self.registros = {}
+        self._alterados = set()
+
+    @classmethod
+    def carregar(cls, caminho=CAMINHO_CUBO):
+        if not os.path.exists(caminho):
+            return cls()
+        return cls(aplicar_esquema(pd.read_parquet(caminho)), _caminho_registros(caminho))
+
+    def _registros_do_mes(self, mes):
+        if mes not in self.registros:
+            arquivo = os.path.join(self.origem_registros or '', f'{mes}.npy')
+            existe = self.origem_registros is not None and os.path.exists(arquivo)
+            self.registros[mes] = np.load(arquivo) if existe else np.empty(0, dtype='uint64')
+        return self.registros[mes]
+
+    def salvar(self, caminho=CAMINHO_CUBO):
+        temporario = f'{caminho}.tmp'
+        self.tabela.to_parquet(temporario, index=False)
+        os.replace(temporario, caminho)
+
+        # Em outro destino, os meses não alterados vêm da origem (cubo novo: nenhum)
+        destino = _caminho_registros(caminho)
+        if self.origem_registros != destino:
+            if os.path.exists(destino):
+                shutil.rmtree(destino)
+            if self.origem_registros is not None and os.path.isdir(self.origem_registros):
+                shutil.copytree(self.origem_registros, destino)
+        os.makedirs(destino, exist_ok=True)
+        for mes in self._alterados:
+            with open(temporario, 'wb') as f:
+                np.save(f, self.registros[mes])
+            os.replace(temporario, os.path.join(destino, f'{mes}.npy'))
+        self.origem_registros = destino
+        self._alterados.clear()
+
+    @property
+    def tem_duplicatas(self):
+        return self.tabela is not None and 'qtd_duplicada' in self.tabela.columns
+
+    # Duplicatas exatas do lote: repetidas dentro dele ou já vistas antes.
+    # Só os meses presentes no lote são consultados e atualizados
+    def _marcar_duplicatas(self, df):
+        hashes = hash_linhas(df, COLUNAS_REGISTRO)
+        meses = _meses(df['data'])
+        ja_visto = np.zeros(len(df), dtype=bool)
+        for mes in np.unique(meses):
+            linhas = np.flatnonzero(meses == mes)
+            vistos = self._registros_do_mes(int(mes))
+            posicao = np.searchsorted(vistos, hashes[linhas])
+            encontrado = posicao < len(vistos)
+            encontrado[encontrado] = vistos[posicao[encontrado]] == hashes[linhas][encontrado]
+            ja_visto[linhas] = encontrado
+            self.registros[int(mes)] = np.union1d(vistos, hashes[linhas])
+            self._alterados.add(int(mes))
+        return df.assign(duplicata=marcar_duplicatas_exatas(df).to_numpy() | ja_visto)
+
+    @property
+    def medidas(self):
+        return [c for c in self.tabela.columns if c not in DIMENSOES]
+
+    # Incorpora um lote de registros (ou de métricas) ao cubo
+    def atualizar(self, df):
+        if 'duplicata' not in df.columns and set(COLUNAS_REGISTRO) <= set(df.columns):
+            df = self._marcar_duplicatas(df)
+        lote = _medidas(df)
+        for dimensao in DIMENSOES[:-1]:
+            lote[dimensao] = df[dimensao]
+        lote['dia'] = df['data'].dt.normalize()
+        lote = lote.groupby(DIMENSOES, observed=True, dropna=False, sort=False).sum().reset_index()
+
+        if self.tabela is not None:
+            lote = pd.concat([self.tabela, lote], ignore_index=True)
+            # Medidas que só um dos lados tem (ex.: severidade) valem 0 no outro
+            medidas = [c for c in lote.columns if c not in DIMENSOES]
+            lote[medidas] = lote[medidas].fillna(0)
+            lote = lote.groupby(DIMENSOES, observed=True, dropna=False, sort=False).sum().reset_index()
+        self.tabela = aplicar_esquema(lote)
+        return self
+
+    # Soma as células do cubo pelos níveis pedidos (dimensões e/ou 'mes').
+    # Com `precos`, inclui o valor movimentado; as médias são recalculadas
+    def agregar(self, niveis, precos=None):
+        tabela = self.tabela
+        if 'mes' in niveis:
+            dia = tabela['dia']
+            tabela = tabela.assign(mes=(dia.dt.year * 100 + dia.dt.month).astype('Int32'))
+        medidas = self.medidas
+        if precos is not None:
+            preco = precos_por_linha(precos, tabela['material'], tabela['unidade'], tabela['dia'])
+            tabela = tabela.assign(valor_total=tabela['qtd_total'] * preco)
+            medidas = medidas + ['valor_total']
+
+        agregado = tabela.groupby(list(niveis), observed=True, dropna=False, sort=True)[medidas].sum()
+        agregado['qtd_media'] = agregado['qtd_total'] / agregado['n_registros']
+        return agregado
+
+
+# Resumo no formato de analise_exploratoria.resumir, a partir do cubo.
+# Os quartis do boxplot não são aditivos e ficam de fora
+def resumir_cubo(cubo):
+    tabela = cubo.tabela
+    contagens = {}
+    for col in COLUNAS_CATEGORIAS:
+        contagem = tabela.groupby(col, observed=True)['n_linhas'].sum()
+        contagens[col] = contagem.sort_values(ascending=False, kind='stable').rename('count')
+
+    por_mes = tabela.groupby(tabela['dia'].dt.month.rename('data'))['n_registros'].sum().rename('quantidade')
+    return {
+        'total': int(tabela['n_linhas'].sum()),
+        'data_min': tabela['dia'].min(),
+        'data_max': tabela['dia'].max(),
+        'unidades': list(tabela['unidade'].dropna().unique()),
+        'materiais': list(tabela['material'].dropna().unique()),
+        'quantidade_nula': int((tabela['n_linhas'] - tabela['n_registros']).sum()),
+        'sem_responsavel': int(tabela['sem_responsavel'].sum()),
+        'inconsistencias': int(tabela['inconsistencias'].sum()),
+        'contagens': contagens,
+        'por_mes': por_mes.astype('int64'),
+        'caixas_por_tipo': None,
+    }
+
+
+# Impacto financeiro (mesmo formato de calcular_impacto_financeiro) a partir do
+# cubo. Exige as duplicatas confirmadas, para fechar com o relatório do script
+def impacto_do_cubo(cubo, precos=precos_materiais, **taxas):
+    colunas = ['n_registros', 'n_anomalias', 'qtd_total', 'qtd_anomalias', 'qtd_incorreta', 'qtd_media']
+    if not cubo.tem_duplicatas:
+        raise ValueError("O cubo não tem duplicatas confirmadas; recrie-o com --inicializar")
+    if isinstance(precos, TabelaPrecos):
+        # Preços com vigência: valora cada dia e mantém a média do grupo todo
+        tabela = cubo.tabela[cubo.tabela['material'].notna() & cubo.tabela['unidade'].notna()]
+        grupos = CuboAgregado(tabela).agregar(['material', 'unidade', 'dia'])
+        grupos['qtd_media'] = media_por_grupo(grupos)
+    else:
+        grupos = cubo.agregar(['material', 'unidade'])
+    grupos = grupos[colunas + ['qtd_duplicada']].astype({'n_anomalias': 'int64'})
+    return consolidar_impacto(grupos, precos, **taxas)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cubo agregado unidade x material x tipo x dia')
+    parser.add_argument('entrada', nargs='?', default=CAMINHO_METRICAS,
+                        help='Registros ou métricas de variação a incorporar ao cubo')
+    parser.add_argument('--cubo', default=CAMINHO_CUBO)
+    parser.add_argument('--inicializar', action='store_true', help='Recria o cubo só com a entrada')
+    parser.add_argument('--niveis', nargs='+', default=['mes', 'unidade'],
+                        help='Níveis da reagregação exibida (dimensões ou mes)')
+    parser.add_argument('--relatorios', action='store_true',
+                        help='Regrava os relatórios de EDA e de impacto a partir do cubo')
+    args = parser.parse_args()
+
+    cubo = CuboAgregado() if args.inicializar else CuboAgregado.carregar(args.cubo)
+    total = 0
+    for bloco in ler_em_blocos(args.entrada):
+        cubo.atualizar(bloco)
+        total += len(bloco)
+    cubo.salvar(args.cubo)
+    print(f"{total} registros incorporados; o cubo tem {len(cubo.tabela)} células")
+
+    print(cubo.agregar(args.niveis, precos_materiais)[['n_linhas', 'qtd_total', 'valor_total']])
+
+    if args.relatorios:
+        escrever_resultados(resumir_cubo(cubo))
+        if 'n_anomalias' in cubo.tabela.columns and cubo.tem_duplicatas:
+            escrever_relatorio(impacto_do_cubo(cubo))
+        elif 'n_anomalias' in cubo.tabela.columns:
+            print("Relatório de impacto não regravado: o cubo não tem duplicatas confirmadas")
+        print("Relatórios regravados a partir do cubo")
@@ -0,0 +1,72 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from armazenamento import carregar
+from deteccao_outliers import CAMINHO_DADOS
+
+# Detecção de registros duplicados por hash das linhas.
+# Duplicata exata: mesma (data, unidade, material, tipo, quantidade, responsavel).
+# Quase duplicata: mesma chave sem a data, repetida dentro de poucos dias.
+
+COLUNAS_REGISTRO = ['data', 'unidade', 'material', 'tipo', 'quantidade', 'responsavel']
+JANELA_QUASE_DUPLICATA_DIAS = 1
+
+
+def hash_linhas(df, colunas):
+    return pd.util.hash_pandas_object(df[colunas], index=False).to_numpy()
+
+
+# Marca como duplicata toda ocorrência após a primeira de um registro idêntico.
+# O hash de 64 bits seleciona os candidatos; a comparação exata só é feita
+# entre as linhas cujo hash se repete
+def marcar_duplicatas_exatas(df, colunas=COLUNAS_REGISTRO):
+    hashes = pd.Series(hash_linhas(df, colunas), index=df.index)
+    candidatos = hashes.duplicated(keep=False)
+
+    duplicata = pd.Series(False, index=df.index)
+    if candidatos.any():
+        duplicata[candidatos] = df.loc[candidatos, colunas].duplicated(keep='first')
+    return duplicata
+
+
+# Marca registros com a mesma chave (sem a data) de um registro anterior a até
+# janela_dias de distância. Ordena uma vez por (hash da chave, data) e compara
+# apenas vizinhos, em vez de comparar todos os pares
+def marcar_quase_duplicatas(df, janela_dias=JANELA_QUASE_DUPLICATA_DIAS, colunas=COLUNAS_REGISTRO):
+    chave = [c for c in colunas if c != 'data']
+    hashes = hash_linhas(df, chave)
+    dias = df['data'].to_numpy(dtype='datetime64[D]').astype('int64')
+
+    ordem = np.lexsort((dias, hashes))
+    hashes_ordenados = hashes[ordem]
+    dias_ordenados = dias[ordem]
+
+    mesma_chave = hashes_ordenados[1:] == hashes_ordenados[:-1]
+    intervalo = dias_ordenados[1:] - dias_ordenados[:-1]
+    proximo = mesma_chave & (intervalo > 0) & (intervalo <= janela_dias) & ~df['data'].isna().to_numpy()[ordem][1:]
+
+    quase = np.zeros(len(df), dtype=bool)
+    quase[ordem[1:][proximo]] = True
+    return pd.Series(quase, index=df.index)
+
+
+def marcar_duplicatas(df, janela_dias=JANELA_QUASE_DUPLICATA_DIAS):
+    marcado = df.copy()
+    marcado['duplicata'] = marcar_duplicatas_exatas(df)
+    marcado['quase_duplicata'] = marcar_quase_duplicatas(df, janela_dias)
+    return marcado
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Detecção de registros duplicados')
+    parser.add_argument('--entrada', default=CAMINHO_DADOS)
+    parser.add_argument('--janela', type=int, default=JANELA_QUASE_DUPLICATA_DIAS,
+                        help='Distância máxima, em dias, para quase duplicatas')
+    args = parser.parse_args()
+
+    df = marcar_duplicatas(carregar(args.entrada), args.janela)
+    print(f"Duplicatas exatas: {int(df['duplicata'].sum())}")
+    print(f"Quase duplicatas (até {args.janela} dia(s)): {int(df['quase_duplicata'].sum())}")
+    print(df[df['duplicata']].head(10))
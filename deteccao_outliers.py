@@ -0,0 +1,251 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from armazenamento import carregar, salvar
+from cache_artefatos import CacheArtefatos
+from esquema import NIVEIS_SEVERIDADE
+from instrumentacao import adicionar_argumentos, configurar_por_argumentos, finalizar_por_argumentos, medir
+from renderizacao import renderizar_graficos, tabela_contagem
+
+CAMINHO_DADOS = './dados_consumo_simulados.csv'
+CAMINHO_METRICAS = './metricas_variacao.csv'
+
+# Detecção é feita separadamente para cada material e unidade
+CHAVES_GRUPO = ['material', 'unidade']
+
+# Classificação de severidade pelo |Z-score|; outliers pelo IQR são no mínimo 'Alerta'
+# (os níveis, em ordem, vêm de esquema.NIVEIS_SEVERIDADE)
+LIMITE_ATENCAO = 1.5
+LIMITE_ALERTA = 2.0
+LIMITE_CRITICO = 3.0  # Z-score acima de 3 desvios padrão é outlier
+FATOR_IQR = 1.5  # Outlier abaixo de Q1-1.5*IQR ou acima de Q3+1.5*IQR
+
+# Gráficos de dispersão: amostra fixa dos registros comuns de cada material
+# (os outliers entram todos, até o limite) para o gráfico não crescer com os dados
+AMOSTRA_DISPERSAO = 2000
+MAX_DESTACADOS = 500
+MAX_ALERTAS_TABELA = 10  # Alertas críticos listados no dashboard
+
+
+def classificar_severidade(z_score, outlier_iqr=None):
+    z = np.nan_to_num(np.abs(np.asarray(z_score, dtype='float64')), nan=0.0)
+    iqr = np.zeros(len(z), dtype=bool) if outlier_iqr is None else np.asarray(outlier_iqr, dtype=bool)
+
+    codigos = np.select(
+        [z >= LIMITE_CRITICO, (z >= LIMITE_ALERTA) | iqr, z >= LIMITE_ATENCAO],
+        [3, 2, 1],
+        default=0
+    )
+    return pd.Categorical.from_codes(codigos, categories=NIVEIS_SEVERIDADE, ordered=True)
+
+
+# Estatísticas de cada grupo, indexadas pelo código do grupo (0..G-1).
+# Linhas com código -1 (chave ausente) não formam um grupo
+def estatisticas_por_grupo(quantidade, codigos):
+    validos = codigos >= 0
+    grupos = quantidade[validos].groupby(codigos[validos])
+    estatisticas = grupos.agg(['mean', 'std'])
+    quartis = grupos.quantile([0.25, 0.75]).unstack()
+    estatisticas['q1'] = quartis[0.25]
+    estatisticas['q3'] = quartis[0.75]
+    return estatisticas
+
+
+# Métricas de cada registro a partir das estatísticas do seu grupo, já
+# alinhadas linha a linha (arrays do mesmo tamanho de df)
+def pontuar_registros(df, media, desvio, q1, q3):
+    valores = df['quantidade'].to_numpy(dtype='float64', na_value=np.nan)
+    iqr = q3 - q1
+
+    desvio_absoluto = np.abs(valores - media)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_score = np.where(desvio > 0, desvio_absoluto / desvio, 0.0)
+        variacao_percentual = np.where(media != 0, (valores - media) / np.abs(media) * 100, 0.0)
+    # Sem quantidade ou sem grupo (chave ausente), o registro não é pontuado
+    sem_pontuacao = np.isnan(valores) | np.isnan(media)
+    z_score[sem_pontuacao] = np.nan
+    variacao_percentual[sem_pontuacao] = np.nan
+
+    limite_inferior = q1 - FATOR_IQR * iqr
+    limite_superior = q3 + FATOR_IQR * iqr
+    outlier_zscore = z_score > LIMITE_CRITICO
+    outlier_iqr = (valores < limite_inferior) | (valores > limite_superior)
+
+    metricas = df.copy()
+    metricas['media_grupo'] = media
+    metricas['desvio_grupo'] = desvio
+    metricas['z_score'] = z_score
+    metricas['variacao_percentual'] = variacao_percentual
+    metricas['limite_inferior'] = limite_inferior
+    metricas['limite_superior'] = limite_superior
+    metricas['outlier_zscore'] = outlier_zscore
+    metricas['outlier_iqr'] = outlier_iqr
+    metricas['severidade'] = classificar_severidade(z_score, outlier_iqr)
+    return metricas
+
+
+# Z-score, variação percentual, limites do IQR e severidade de cada registro.
+# Os grupos são fatorados uma única vez; as estatísticas de cada grupo são
+# calculadas em uma passada agrupada e redistribuídas para as linhas pelo
+# código do grupo, sem laços em Python sobre os grupos
+def calcular_metricas_variacao(df, chaves=CHAVES_GRUPO):
+    quantidade = df['quantidade'].astype('float64')
+    codigos = df.groupby(chaves, observed=True, sort=False).ngroup().to_numpy()
+
+    estatisticas = estatisticas_por_grupo(quantidade, codigos)
+    por_linha = estatisticas.reindex(codigos)  # Código -1 (chave ausente) fica com NaN
+
+    return pontuar_registros(
+        df,
+        por_linha['mean'].to_numpy(),
+        por_linha['std'].to_numpy(),
+        por_linha['q1'].to_numpy(),
+        por_linha['q3'].to_numpy()
+    )
+
+
+# Registros de um material para a dispersão, com a coluna `coluna_outlier`
+# como destaque. A amostra é determinística, para o cache de gráficos
+def _pontos_dispersao(df, coluna_outlier):
+    pontos = pd.DataFrame({
+        'data': df['data'],
+        'quantidade': df['quantidade'].astype('float64'),
+        coluna_outlier: df[coluna_outlier].to_numpy(dtype=bool),
+    }).dropna(subset=['data', 'quantidade'])
+    destacados = pontos[pontos[coluna_outlier]]
+    comuns = pontos[~pontos[coluna_outlier]]
+    if len(destacados) > MAX_DESTACADOS:
+        destacados = destacados.sample(MAX_DESTACADOS, random_state=0)
+    if len(comuns) > AMOSTRA_DISPERSAO:
+        comuns = comuns.sample(AMOSTRA_DISPERSAO, random_state=0)
+    return pd.concat([comuns, destacados]).sort_index()
+
+
+# Um painel por material com os registros no tempo e os outliers em vermelho
+def _dispersao_outliers(df, coluna_outlier, metodo, caminho):
+    paineis = [
+        {'tipo': 'dispersao', 'dados': _pontos_dispersao(df_material, coluna_outlier),
+         'opcoes': {'x': 'data', 'y': 'quantidade', 'destaque': coluna_outlier, 'rotacao_x': 30,
+                    'titulo': f'Outliers por {metodo} - {material}', 'rotulo_x': '', 'rotulo_y': 'Quantidade'}}
+        for material, df_material in df.groupby('material', observed=True)
+    ]
+    if not paineis:
+        return {'tipo': 'texto', 'caminho': caminho, 'dados': 'Sem registros'}
+    return {'tipo': 'painel', 'grade': ((len(paineis) + 1) // 2, 2), 'caminho': caminho, 'tamanho': (15, 10),
+            'paineis': paineis}
+
+
+def _contagem_severidade(df, chaves):
+    contagem = df.groupby(chaves + ['severidade'], observed=False).size().rename('Contagem').reset_index()
+    return contagem[contagem[chaves[0]].isin(df[chaves[0]].dropna().unique())]
+
+
+# Registros por severidade: um painel por material com as unidades no eixo x
+# ou, no relatório de uma unidade, os materiais no eixo x
+def _severidade(df, caminho, unidade):
+    opcoes = {'y': 'Contagem', 'hue': 'severidade', 'ordem_hue': NIVEIS_SEVERIDADE, 'paleta': 'YlOrRd',
+              'titulo_hue': 'Severidade', 'rotulo_y': 'Contagem'}
+    if unidade is not None:
+        return {'tipo': 'barras', 'caminho': caminho, 'tamanho': (12, 6),
+                'dados': _contagem_severidade(df, ['material']),
+                'opcoes': {**opcoes, 'x': 'material', 'titulo': f'Distribuição de Severidade - {unidade}',
+                           'rotulo_x': 'Material'}}
+
+    contagem = _contagem_severidade(df, ['material', 'unidade'])
+    paineis = [
+        {'tipo': 'barras', 'dados': contagem_material.drop(columns='material'),
+         'opcoes': {**opcoes, 'x': 'unidade', 'titulo': f'Distribuição de Severidade - {material}',
+                    'rotulo_x': 'Unidade'}}
+        for material, contagem_material in contagem.groupby('material', observed=True)
+    ]
+    return {'tipo': 'painel', 'grade': ((len(paineis) + 1) // 2, 2), 'caminho': caminho, 'tamanho': (15, 10),
+            'paineis': paineis}
+
+
+# Anomalias (outlier por Z-score ou IQR) por material e unidade
+def _mapa_anomalias(df, caminho):
+    anomalia = df['outlier_zscore'].to_numpy(dtype=bool) | df['outlier_iqr'].to_numpy(dtype=bool)
+    tabela = df.assign(anomalia=anomalia).groupby(['material', 'unidade'], observed=True)['anomalia'].sum().unstack()
+    tabela.index, tabela.columns = tabela.index.astype(str), tabela.columns.astype(str)
+    return {'tipo': 'mapa_calor', 'caminho': caminho, 'tamanho': (12, 8), 'dados': tabela.fillna(0).astype('int64'),
+            'opcoes': {'titulo': 'Heatmap de Anomalias por Material e Unidade', 'formato': 'd'}}
+
+
+# Alertas críticos por material e por mês, no tempo e os de maior Z-score
+def _dashboard_criticos(df, caminho):
+    criticos = df[df['severidade'] == 'Crítico']
+    if criticos.empty:
+        return {'tipo': 'texto', 'caminho': caminho, 'tamanho': (15, 6),
+                'dados': 'Não foram encontrados alertas críticos'}
+
+    materiais = df['material'].dropna().unique()
+    meses = df['data'].dt.to_period('M').astype(str)
+    por_material = criticos['material'].value_counts().reindex(materiais, fill_value=0)
+    por_mes = meses[criticos.index].value_counts().reindex(sorted(meses.dropna().unique()), fill_value=0)
+    maiores = criticos.nlargest(MAX_ALERTAS_TABELA, 'z_score')
+    tabela = pd.DataFrame({
+        'Data': maiores['data'].dt.strftime('%d/%m/%Y').to_numpy(),
+        'Unidade': maiores['unidade'].astype(str).to_numpy(),
+        'Material': maiores['material'].astype(str).to_numpy(),
+        'Quantidade': maiores['quantidade'].to_numpy(),
+        'Z-score': maiores['z_score'].round(2).to_numpy(),
+    })
+    pontos = criticos[['data', 'quantidade']].astype({'quantidade': 'float64'}).dropna()
+    if len(pontos) > MAX_DESTACADOS:
+        pontos = pontos.sample(MAX_DESTACADOS, random_state=0).sort_index()
+
+    return {'tipo': 'painel', 'grade': (2, 2), 'caminho': caminho, 'tamanho': (15, 12), 'paineis': [
+        {'tipo': 'barras', 'dados': tabela_contagem(por_material, 'material'),
+         'opcoes': {'x': 'material', 'y': 'count', 'titulo': 'Alertas Críticos por Material', 'rotacao_x': 45,
+                    'rotulo_x': 'Material', 'rotulo_y': 'Contagem'}},
+        {'tipo': 'barras', 'dados': tabela_contagem(por_mes, 'mes'),
+         'opcoes': {'x': 'mes', 'y': 'count', 'titulo': 'Alertas Críticos por Mês', 'rotacao_x': 45,
+                    'rotulo_x': 'Mês', 'rotulo_y': 'Contagem'}},
+        {'tipo': 'dispersao', 'dados': pontos,
+         'opcoes': {'x': 'data', 'y': 'quantidade', 'titulo': 'Dispersão Temporal de Alertas Críticos',
+                    'rotacao_x': 45, 'rotulo_x': 'Data', 'rotulo_y': 'Quantidade'}},
+        {'tipo': 'tabela', 'dados': tabela, 'opcoes': {'titulo': 'Alertas Críticos de Maior Z-score'}},
+    ]}
+
+
+# Especificações dos gráficos das métricas de variação. Com `unidade`, df_metrics
+# são só os registros da unidade e o mapa por unidade (comparativo) fica de fora
+def especificacoes_graficos(df_metrics, diretorio='./projeto_anomalias_consumo_2', unidade=None):
+    especificacoes = [
+        _dispersao_outliers(df_metrics, 'outlier_zscore', 'Z-score', f'{diretorio}/outliers_zscore.png'),
+        _dispersao_outliers(df_metrics, 'outlier_iqr', 'IQR', f'{diretorio}/outliers_iqr.png'),
+        _severidade(df_metrics, f'{diretorio}/painel_severidade.png', unidade),
+        _dashboard_criticos(df_metrics, f'{diretorio}/dashboard_alertas_criticos.png'),
+    ]
+    if unidade is None:
+        especificacoes.append(_mapa_anomalias(df_metrics, f'{diretorio}/heatmap_anomalias.png'))
+    return especificacoes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Detecção de outliers por Z-score e IQR')
+    parser.add_argument('--entrada', default=CAMINHO_DADOS)
+    parser.add_argument('--saida', default=CAMINHO_METRICAS)
+    parser.add_argument('--sem-cache', action='store_true', help='Redesenha os gráficos, ignorando o cache de artefatos')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    configurar_por_argumentos(args)
+
+    with medir('carga') as m:
+        df = carregar(args.entrada)
+        m['linhas'] = len(df)
+    with medir('deteccao', len(df)):
+        df_metrics = calcular_metricas_variacao(df)
+    with medir('gravacao', len(df_metrics)):
+        salvar(df_metrics, args.saida)
+    with medir('graficos'):
+        renderizar_graficos(especificacoes_graficos(df_metrics), cache=None if args.sem_cache else CacheArtefatos())
+
+    print(f"Outliers detectados por Z-score: {int(df_metrics['outlier_zscore'].sum())}")
+    print(f"Outliers detectados por IQR: {int(df_metrics['outlier_iqr'].sum())}")
+    print("\nRegistros por severidade:")
+    print(df_metrics['severidade'].value_counts(sort=False))
+    print(f"\nMétricas de variação salvas em '{args.saida}'")
+    finalizar_por_argumentos(args)
@@ -0,0 +1,138 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from armazenamento import carregar, salvar
+from deteccao_outliers import CAMINHO_DADOS, CAMINHO_METRICAS, CHAVES_GRUPO, classificar_severidade
+from instrumentacao import adicionar_argumentos, configurar_por_argumentos, finalizar_por_argumentos, medir
+
+# Detecção sensível ao tempo: cada movimentação é comparada apenas com as
+# movimentações anteriores do mesmo (material, unidade) dentro de uma janela
+# de N dias, para que a sazonalidade do consumo não gere falsos alertas.
+# "Anteriores" significa de dias anteriores em todas as estatísticas: a
+# janela é [data - N dias, data) e a EWMA usada é a do fim do dia anterior.
+#
+# Três pontuações são calculadas e gravadas (z_movel, z_ewma, z_robusto);
+# a severidade vem de uma só, escolhida em `pontuacao`:
+#   movel    |x - média| / desvio padrão da janela (padrão)
+#   ewma     o mesmo com média e desvio exponenciais (meia-vida de N/2 dias)
+#   robusto  0,6745 |x - mediana| / MAD da janela. Com quantidades inteiras
+#            e caudas pesadas o MAD é pequeno e essa pontuação marca muito
+#            mais registros que as outras duas
+#
+# O MAD exato (mediana de |x - mediana da janela|) não é uma operação de
+# janela deslizante. Usamos metade do IQR da janela: em distribuições
+# simétricas ele é igual ao MAD, e na normal vale 0,6745 desvio padrão,
+# como o MAD. Em janelas assimétricas ele é a média das distâncias da
+# mediana aos dois quartis, enquanto o MAD acompanha o lado mais concentrado
+
+JANELA_DIAS = 30
+MIN_OBSERVACOES = 5  # Abaixo disso a janela não tem histórico suficiente
+CONSTANTE_MAD = 0.6745  # Torna o MAD comparável ao desvio padrão na normal
+PONTUACOES = ['movel', 'ewma', 'robusto']
+PONTUACAO_PADRAO = 'movel'
+
+
+# Como o DataFrame já está ordenado por grupo e data, os resultados de
+# groupby().rolling() saem na ordem das linhas; a data de cada resultado
+# (último nível do índice) confirma o alinhamento
+def _por_linha(resultado, datas):
+    if not np.array_equal(resultado.index.get_level_values(-1).to_numpy(dtype='datetime64[ns]'), datas):
+        raise RuntimeError("groupby().rolling() não devolveu as linhas na ordem de grupo e data")
+    return resultado.to_numpy()
+
+
+# Valor de `serie` (já ordenada por grupo e data) ao fim do dia anterior do
+# mesmo grupo, para cada linha: a última linha antes da primeira do dia
+def _no_dia_anterior(serie, datas, grupo):
+    nova_data = np.r_[True, (grupo[1:] != grupo[:-1]) | (datas[1:] != datas[:-1])]
+    anterior = np.flatnonzero(nova_data) - 1
+    mesmo_grupo = anterior >= 0
+    mesmo_grupo[mesmo_grupo] = grupo[anterior[mesmo_grupo]] == grupo[anterior[mesmo_grupo] + 1]
+    valores = np.where(mesmo_grupo, serie[np.maximum(anterior, 0)], np.nan)
+    return valores[np.cumsum(nova_data) - 1]
+
+
+def calcular_metricas_temporais(df, janela_dias=JANELA_DIAS, chaves=CHAVES_GRUPO, pontuacao=PONTUACAO_PADRAO):
+    if pontuacao not in PONTUACOES:
+        raise ValueError(f"Pontuação desconhecida: {pontuacao} (use {', '.join(PONTUACOES)})")
+
+    # Ordena uma única vez; dentro de cada grupo as datas ficam crescentes,
+    # o que permite janelas temporais lineares no número de linhas
+    ordenado = df.dropna(subset=chaves + ['data']).sort_values(chaves + ['data'], kind='stable')
+    ordenado['quantidade'] = ordenado['quantidade'].astype('float64')
+    ordenado['_quadrado'] = ordenado['quantidade'] ** 2
+    valores = ordenado['quantidade'].to_numpy()
+    datas = ordenado['data'].to_numpy(dtype='datetime64[ns]')
+    grupos = ordenado.groupby(chaves, observed=True, sort=False)
+    grupo = grupos.ngroup().to_numpy()
+
+    # Janela deslizante anterior ao registro (closed='left' exclui o próprio dia)
+    janela = grupos.rolling(f'{janela_dias}D', on='data', closed='left', min_periods=MIN_OBSERVACOES)['quantidade']
+    media_movel = _por_linha(janela.mean(), datas)
+    desvio_movel = _por_linha(janela.std(), datas)
+    mediana_movel = _por_linha(janela.median(), datas)
+    mad_movel = (_por_linha(janela.quantile(0.75), datas) - _por_linha(janela.quantile(0.25), datas)) / 2
+
+    # EWMA com meia-vida em dias, usando as datas reais; a variância vem de
+    # E[x²] - E[x]². Cada registro usa o estado ao fim do dia anterior
+    ewma = grupos[['quantidade', '_quadrado']].ewm(
+        halflife=pd.Timedelta(days=janela_dias / 2), times=ordenado['data'], min_periods=MIN_OBSERVACOES
+    ).mean()
+    if not ewma.index.get_level_values(-1).equals(ordenado.index):
+        raise RuntimeError("groupby().ewm() não devolveu as linhas na ordem de grupo e data")
+    media_ewma = _no_dia_anterior(ewma['quantidade'].to_numpy(), datas, grupo)
+    quadrado_ewma = _no_dia_anterior(ewma['_quadrado'].to_numpy(), datas, grupo)
+    desvio_ewma = np.sqrt(np.maximum(quadrado_ewma - media_ewma ** 2, 0))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_movel = np.where(desvio_movel > 0, np.abs(valores - media_movel) / desvio_movel, 0.0)
+        z_ewma = np.where(desvio_ewma > 0, np.abs(valores - media_ewma) / desvio_ewma, 0.0)
+        z_robusto = np.where(mad_movel > 0, CONSTANTE_MAD * np.abs(valores - mediana_movel) / mad_movel, 0.0)
+        variacao_percentual = np.where(media_movel != 0, (valores - media_movel) / np.abs(media_movel) * 100, 0.0)
+
+    # Sem histórico suficiente na janela (ou na EWMA), o registro não é pontuado
+    sem_historico = np.isnan(media_movel) | np.isnan(valores)
+    for z in (z_movel, z_robusto, variacao_percentual):
+        z[sem_historico] = np.nan
+    z_ewma[np.isnan(media_ewma) | np.isnan(valores)] = np.nan
+
+    metricas = ordenado.drop(columns=['_quadrado'])
+    metricas['media_movel'] = media_movel
+    metricas['desvio_movel'] = desvio_movel
+    metricas['media_ewma'] = media_ewma
+    metricas['mediana_movel'] = mediana_movel
+    metricas['mad_movel'] = mad_movel
+    metricas['z_movel'] = z_movel
+    metricas['z_ewma'] = z_ewma
+    metricas['z_robusto'] = z_robusto
+    metricas['z_score'] = metricas[f'z_{pontuacao}']
+    metricas['variacao_percentual'] = variacao_percentual
+    metricas['severidade'] = classificar_severidade(metricas['z_score'])
+    return metricas.sort_index()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Detecção de anomalias por janelas temporais')
+    parser.add_argument('--entrada', default=CAMINHO_DADOS)
+    parser.add_argument('--saida', default=CAMINHO_METRICAS)
+    parser.add_argument('--janela', type=int, default=JANELA_DIAS, help='Tamanho da janela em dias')
+    parser.add_argument('--pontuacao', choices=PONTUACOES, default=PONTUACAO_PADRAO,
+                        help='Pontuação que define a severidade')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    configurar_por_argumentos(args)
+
+    with medir('carga') as m:
+        df = carregar(args.entrada)
+        m['linhas'] = len(df)
+    with medir('deteccao', len(df)):
+        df_metrics = calcular_metricas_temporais(df, args.janela, pontuacao=args.pontuacao)
+    with medir('gravacao', len(df_metrics)):
+        salvar(df_metrics, args.saida)
+
+    print(f"Janela de {args.janela} dias por material e unidade, pontuação '{args.pontuacao}'")
+    print(df_metrics['severidade'].value_counts(sort=False))
+    print(f"\nMétricas de variação salvas em '{args.saida}'")
+    finalizar_por_argumentos(args)
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+# Esquema canônico dos registros de consumo, aplicado por armazenamento.carregar
+# (e pela leitura em blocos) a todo dado lido pelos scripts:
+#
+#   data         datetime64 em memória, date32 em disco (Parquet)
+#   unidade,
+#   material,
+#   tipo,
+#   responsavel  categóricas (códigos inteiros + dicionário)
+#   quantidade   inteiro anulável Int32 (os NaN injetados viram <NA>)
+#   severidade   categórica ordenada Normal < Atenção < Alerta < Crítico
+#
+# A data fica como datetime64 em memória porque o pandas não tem um tipo de
+# data nativo de 4 bytes: o date32 do Arrow não é aceito por rolling/resample
+# com janelas em dias nem por groupby com .dt, que os detectores usam. No
+# Parquet ela continua sendo gravada como date32.
+#
+# A quantidade é Int32 e não Int16 porque os outliers (10x) e os dados reais
+# podem passar de 32767. Se a coluna tiver valores fracionários, continua
+# float64 para não perder informação.
+
+TIPOS_OPERACAO = ['entrada', 'saida']
+# Cadastro de unidades e materiais: gerado por criar_dados.py e exigido por validacao.py
+UNIDADES_CADASTRADAS = ['Morumbi', 'Santo Amaro', 'Moema']
+MATERIAIS_CADASTRADOS = ['Seringa', 'Gaze', 'Tubo', 'Medicamentos', 'Esparadrapo']
+NIVEIS_SEVERIDADE = ['Normal', 'Atenção', 'Alerta', 'Crítico']
+
+COLUNAS_CATEGORICAS = ['unidade', 'material', 'tipo', 'responsavel', 'severidade']
+TIPO_QUANTIDADE = 'Int32'
+
+# Categorias conhecidas de antemão: blocos lidos separadamente ficam com o
+# mesmo dicionário e a severidade mantém a ordem entre os níveis
+CATEGORIAS_FIXAS = {
+    'tipo': (TIPOS_OPERACAO, False),
+    'severidade': (NIVEIS_SEVERIDADE, True),
+}
+
+# Tipos usados já na leitura do CSV, para não materializar strings Python
+TIPOS_CSV = {col: 'category' for col in COLUNAS_CATEGORICAS}
+TIPOS_CSV['quantidade'] = 'float64'
+
+
+def _categorica(serie, coluna):
+    if coluna not in CATEGORIAS_FIXAS:
+        return serie if isinstance(serie.dtype, pd.CategoricalDtype) else serie.astype('category')
+
+    conhecidas, ordenada = CATEGORIAS_FIXAS[coluna]
+    eh_categorica = isinstance(serie.dtype, pd.CategoricalDtype)
+    presentes = serie.cat.categories if eh_categorica else serie.dropna().unique()
+    # Valores fora do dicionário conhecido são mantidos (no fim), nunca viram nulos
+    categorias = conhecidas + sorted(set(presentes) - set(conhecidas))
+    if eh_categorica:
+        return serie.cat.set_categories(categorias, ordered=ordenada)
+    return serie.astype(pd.CategoricalDtype(categorias, ordered=ordenada))
+
+
+def tipar_quantidade(serie):
+    if serie.dtype == TIPO_QUANTIDADE:
+        return serie
+    valores = serie.to_numpy(dtype='float64', na_value=np.nan)
+    validos = valores[~np.isnan(valores)]
+    limite = np.iinfo('int32')
+    if np.all(validos == np.round(validos)) and np.all((validos >= limite.min) & (validos <= limite.max)):
+        return serie.astype(TIPO_QUANTIDADE)
+    return serie.astype('float64')
+
+
+def aplicar_esquema(df):
+    for col in COLUNAS_CATEGORICAS:
+        if col in df.columns:
+            df[col] = _categorica(df[col], col)
+    if 'quantidade' in df.columns:
+        df['quantidade'] = tipar_quantidade(df['quantidade'])
+    if 'data' in df.columns:
+        df['data'] = pd.to_datetime(df['data'])
+    return df
+
+
+# Memória ocupada pelo DataFrame, em MB por milhão de linhas
+def memoria_por_milhao(df):
+    return df.memory_usage(deep=True).sum() / 1024 ** 2 / max(len(df), 1) * 1_000_000
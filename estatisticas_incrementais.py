@@ -0,0 +1,129 @@
+import argparse
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from acumuladores import SketchQuantis
+from armazenamento import carregar, salvar
+from deteccao_outliers import CHAVES_GRUPO, CAMINHO_METRICAS, pontuar_registros
+
+CAMINHO_ESTATISTICAS = './estatisticas_grupos.pkl'
+
+
+class EstatisticasPorGrupo:
+    """Estatísticas persistidas de cada (material, unidade).
+
+    Guarda contagem, média e M2 (soma dos quadrados dos desvios) em uma
+    tabela indexada pelo grupo, e um sketch de quantis por grupo para os
+    limites do IQR. Novos lotes atualizam a tabela em O(linhas novas),
+    sem reler o histórico.
+    """
+
+    def __init__(self, chaves=CHAVES_GRUPO):
+        self.chaves = list(chaves)
+        self.tabela = pd.DataFrame(
+            {'n': pd.Series(dtype='int64'), 'media': pd.Series(dtype='float64'),
+             'm2': pd.Series(dtype='float64'), 'q1': pd.Series(dtype='float64'),
+             'q3': pd.Series(dtype='float64')},
+            index=pd.MultiIndex.from_tuples([], names=self.chaves)
+        )
+        self.sketches = {}
+
+    @classmethod
+    def carregar(cls, caminho=CAMINHO_ESTATISTICAS, chaves=CHAVES_GRUPO):
+        if not os.path.exists(caminho):
+            return cls(chaves)
+        with open(caminho, 'rb') as f:
+            estado = pickle.load(f)
+        estatisticas = cls(estado['chaves'])
+        estatisticas.tabela = estado['tabela']
+        estatisticas.sketches = estado['sketches']
+        return estatisticas
+
+    def salvar(self, caminho=CAMINHO_ESTATISTICAS):
+        # Escreve em arquivo temporário e troca, para não corromper o estado em caso de falha
+        temporario = f'{caminho}.tmp'
+        with open(temporario, 'wb') as f:
+            estado = {'chaves': self.chaves, 'tabela': self.tabela, 'sketches': self.sketches}
+            pickle.dump(estado, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporario, caminho)
+
+    def _indice(self, df):
+        return pd.MultiIndex.from_arrays([df[c].astype(object) for c in self.chaves], names=self.chaves)
+
+    def atualizar(self, df):
+        quantidade = df['quantidade'].astype('float64')
+        indice = self._indice(df)
+        lote = quantidade.groupby(indice).agg(['count', 'mean', 'var'])
+        lote = lote[lote['count'] > 0]
+        if lote.empty:
+            return self
+
+        # Combinação de Chan et al. para média e M2, vetorizada sobre os grupos
+        atual = self.tabela.reindex(self.tabela.index.union(lote.index))
+        atual[['n', 'media', 'm2']] = atual[['n', 'media', 'm2']].fillna(0)
+        lote = lote.reindex(atual.index)
+        n_b = lote['count'].fillna(0).to_numpy()
+        media_b = lote['mean'].fillna(0).to_numpy()
+        m2_b = (lote['var'].fillna(0) * np.maximum(n_b - 1, 0)).to_numpy()
+
+        n_a = atual['n'].to_numpy(dtype='float64')
+        n = n_a + n_b
+        delta = media_b - atual['media'].to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            atual['media'] = np.where(n > 0, atual['media'] + delta * n_b / n, 0.0)
+            atual['m2'] = np.where(n > 0, atual['m2'] + m2_b + delta ** 2 * n_a * n_b / n, 0.0)
+        atual['n'] = n.astype('int64')
+
+        # Sketches: um laço por grupo presente no lote (não por linha)
+        chaves_lote, quartis = [], []
+        for chave, valores in quantidade.groupby(indice):
+            if valores.count() == 0:
+                continue
+            sketch = self.sketches.setdefault(chave, SketchQuantis(k=200))
+            sketch.atualizar(valores.to_numpy())
+            chaves_lote.append(chave)
+            quartis.append(sketch.quantis([0.25, 0.75]))
+        atual.loc[chaves_lote, ['q1', 'q3']] = np.array(quartis)
+
+        self.tabela = atual
+        return self
+
+    # Estatísticas de cada linha de df, alinhadas pelo grupo
+    def estatisticas_por_linha(self, df):
+        por_linha = self.tabela.reindex(self._indice(df))
+        n = por_linha['n'].to_numpy(dtype='float64')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            desvio = np.sqrt(por_linha['m2'].to_numpy() / (n - 1))
+        desvio[~(n > 1)] = np.nan
+        return por_linha['media'].to_numpy(), desvio, por_linha['q1'].to_numpy(), por_linha['q3'].to_numpy()
+
+    # Pontua df contra o estado atual (sem incluí-lo) e depois incorpora as linhas
+    def pontuar_e_atualizar(self, df):
+        metricas = pontuar_registros(df, *self.estatisticas_por_linha(df))
+        self.atualizar(df)
+        return metricas
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pontuação incremental de anomalias com estatísticas persistidas')
+    parser.add_argument('entrada', help='Arquivo com as movimentações novas (ou o histórico, com --inicializar)')
+    parser.add_argument('--estatisticas', default=CAMINHO_ESTATISTICAS)
+    parser.add_argument('--saida', default=CAMINHO_METRICAS)
+    parser.add_argument('--inicializar', action='store_true',
+                        help='Recria o estado a partir do histórico completo, sem pontuar')
+    args = parser.parse_args()
+
+    df = carregar(args.entrada)
+    if args.inicializar:
+        estado = EstatisticasPorGrupo().atualizar(df)
+        print(f"Estado inicializado com {len(df)} registros em {len(estado.tabela)} grupos")
+    else:
+        estado = EstatisticasPorGrupo.carregar(args.estatisticas)
+        metricas = estado.pontuar_e_atualizar(df)
+        salvar(metricas, args.saida, anexar=os.path.exists(args.saida))
+        print(f"{len(metricas)} registros pontuados e anexados a '{args.saida}'")
+        print(metricas['severidade'].value_counts(sort=False))
+    estado.salvar(args.estatisticas)
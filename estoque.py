@@ -0,0 +1,199 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from armazenamento import carregar, salvar
+from deteccao_outliers import CAMINHO_DADOS
+from esquema import aplicar_esquema
+from instrumentacao import adicionar_argumentos, configurar_por_argumentos, finalizar_por_argumentos, medir
+
+CAMINHO_SALDOS = './saldos_estoque.parquet'
+
+# Reconstrução do nível de estoque a partir das movimentações. A quantidade
+# já tem sinal (entrada positiva, saída negativa), então o saldo de cada
+# (unidade, material) é a soma acumulada das movimentações em ordem de data.
+# Os registros são ordenados uma única vez por (unidade, material, data) e
+# a soma acumulada é feita por grupo; de cada dia fica só o saldo ao final
+# do dia. Esses pontos formam um índice: cada grupo ocupa uma faixa
+# contígua e ordenada por data, e o saldo em uma data é obtido por busca
+# binária (O(log n)).
+#
+# A quantidade é usada como registrada (inclusive com sinal trocado), pois
+# é o que o sistema de estoque enxerga. Quantidades nulas não movimentam o
+# estoque; linhas sem data, unidade ou material ficam de fora.
+
+CHAVES_ESTOQUE = ['unidade', 'material']
+SALDO_INICIAL = 0  # Saldo antes da primeira movimentação, quando não informado
+
+# Saldo acima de tantos dias do consumo médio diário do grupo é implausível
+# (entradas registradas em dobro, quantidade digitada errada...)
+DIAS_COBERTURA_MAXIMA = 180
+
+
+# Saldo ao final de cada dia com movimentação, por (unidade, material).
+# `saldo_inicial` é um número ou um dicionário {(unidade, material): saldo}
+def reconstruir_saldos(df, saldo_inicial=SALDO_INICIAL):
+    validos = df['data'].notna() & df['unidade'].notna() & df['material'].notna()
+    movimentos = df.loc[validos, CHAVES_ESTOQUE + ['data', 'quantidade']]
+    movimentos = movimentos.assign(
+        dia=movimentos['data'].dt.normalize(),
+        quantidade=movimentos['quantidade'].astype('float64').fillna(0),
+    )
+
+    # Uma ordenação; o saldo de cada linha é a soma acumulada do seu grupo
+    movimentos = movimentos.sort_values(CHAVES_ESTOQUE + ['dia'], kind='stable')
+    grupos = movimentos.groupby(CHAVES_ESTOQUE, observed=True, sort=False)
+    movimentos['saldo'] = grupos['quantidade'].cumsum()
+    movimentos['entradas'] = movimentos['quantidade'].clip(lower=0)
+    movimentos['saidas'] = -movimentos['quantidade'].clip(upper=0)
+
+    # Último saldo de cada dia, mais o total movimentado no dia
+    por_dia = movimentos.groupby(CHAVES_ESTOQUE + ['dia'], observed=True, sort=False)
+    saldos = por_dia.agg(saldo=('saldo', 'last'), entradas=('entradas', 'sum'), saidas=('saidas', 'sum'),
+                         movimentacoes=('saldo', 'size')).reset_index().rename(columns={'dia': 'data'})
+
+    if isinstance(saldo_inicial, dict):
+        chaves = list(zip(saldos['unidade'].astype(object), saldos['material'].astype(object)))
+        saldos['saldo'] += np.array([saldo_inicial.get(c, SALDO_INICIAL) for c in chaves], dtype='float64')
+    else:
+        saldos['saldo'] += saldo_inicial
+    return aplicar_esquema(saldos)
+
+
+# Faixas contíguas em que `marcado` é verdadeiro, dentro de cada grupo.
+# `recuperacao` é a primeira data seguinte sem a marca (NaT se não houve)
+def _periodos(saldos, marcado, tipo):
+    grupo = saldos.groupby(CHAVES_ESTOQUE, observed=True, sort=False).ngroup().to_numpy()
+    novo_grupo = np.r_[True, grupo[1:] != grupo[:-1]]
+    inicio = marcado & (novo_grupo | ~np.r_[False, marcado[:-1]])
+    fim = marcado & (np.r_[novo_grupo[1:], True] | ~np.r_[marcado[1:], False])
+    faixa = np.cumsum(inicio)[marcado]
+
+    pontos = saldos[marcado].assign(faixa=faixa)
+    periodos = pontos.groupby('faixa').agg(
+        unidade=('unidade', 'first'), material=('material', 'first'),
+        inicio=('data', 'first'), fim=('data', 'last'), dias_com_movimento=('data', 'size'),
+        saldo_minimo=('saldo', 'min'), saldo_maximo=('saldo', 'max'),
+    ).reset_index(drop=True)
+
+    # Primeiro dia após a faixa, se ainda for do mesmo grupo
+    posicao_seguinte = np.flatnonzero(fim) + 1
+    mesmo_grupo = posicao_seguinte < len(saldos)
+    mesmo_grupo[mesmo_grupo] &= ~novo_grupo[posicao_seguinte[mesmo_grupo]]
+    recuperacao = np.full(len(periodos), np.datetime64('NaT'), dtype='datetime64[ns]')
+    recuperacao[mesmo_grupo] = saldos['data'].to_numpy(dtype='datetime64[ns]')[posicao_seguinte[mesmo_grupo]]
+    periodos['recuperacao'] = recuperacao
+    periodos.insert(0, 'tipo', tipo)
+    return periodos
+
+
+# Períodos de estoque negativo e de estoque implausível (acima de
+# DIAS_COBERTURA_MAXIMA dias do consumo médio diário do grupo)
+def detectar_periodos(saldos, dias_cobertura=DIAS_COBERTURA_MAXIMA):
+    grupos = saldos.groupby(CHAVES_ESTOQUE, observed=True, sort=False)
+    dias = (grupos['data'].transform('max') - grupos['data'].transform('min')).dt.days + 1
+    consumo_diario = grupos['saidas'].transform('sum') / dias
+
+    negativo = (saldos['saldo'] < 0).to_numpy()
+    implausivel = (saldos['saldo'] > dias_cobertura * consumo_diario).to_numpy() & (consumo_diario > 0).to_numpy()
+    return pd.concat([
+        _periodos(saldos, negativo, 'negativo'),
+        _periodos(saldos, implausivel, 'implausivel'),
+    ], ignore_index=True)
+
+
+class IndiceSaldos:
+    """Saldos ao final do dia, organizados para consulta por data.
+
+    Os pontos ficam em arrays contíguos ordenados por (grupo, data);
+    `faixas` guarda o início e o fim de cada (unidade, material). Uma
+    consulta é uma busca binária dentro da faixa do grupo.
+    """
+
+    def __init__(self, saldos, saldo_inicial=SALDO_INICIAL):
+        self.saldos = saldos
+        self.datas = saldos['data'].to_numpy(dtype='datetime64[ns]')
+        self.valores = saldos['saldo'].to_numpy(dtype='float64')
+        self.saldo_inicial = saldo_inicial
+
+        grupo = saldos.groupby(CHAVES_ESTOQUE, observed=True, sort=False).ngroup().to_numpy()
+        inicios = np.flatnonzero(np.diff(grupo, prepend=-1) != 0)
+        fins = np.r_[inicios[1:], len(grupo)]
+        unidades = saldos['unidade'].to_numpy(dtype=object)[inicios]
+        materiais = saldos['material'].to_numpy(dtype=object)[inicios]
+        self.faixas = {(u, m): (int(i), int(f)) for u, m, i, f in zip(unidades, materiais, inicios, fins)}
+
+    @classmethod
+    def carregar(cls, caminho=CAMINHO_SALDOS, saldo_inicial=SALDO_INICIAL):
+        saldos = carregar(caminho).sort_values(CHAVES_ESTOQUE + ['data'], kind='stable').reset_index(drop=True)
+        return cls(saldos, saldo_inicial)
+
+    def salvar(self, caminho=CAMINHO_SALDOS):
+        salvar(self.saldos, caminho)
+
+    def _inicial(self, unidade, material):
+        if isinstance(self.saldo_inicial, dict):
+            return self.saldo_inicial.get((unidade, material), SALDO_INICIAL)
+        return self.saldo_inicial
+
+    # Saldo de `material` em `unidade` ao final do dia `data`
+    def saldo(self, unidade, material, data):
+        if (unidade, material) not in self.faixas:
+            raise KeyError(f"Sem movimentações de {material} em {unidade}")
+        inicio, fim = self.faixas[(unidade, material)]
+        posicao = np.searchsorted(self.datas[inicio:fim], np.datetime64(pd.Timestamp(data), 'ns'), side='right')
+        return self.valores[inicio + posicao - 1] if posicao else self._inicial(unidade, material)
+
+    # Várias consultas de uma vez: DataFrame com unidade, material e data
+    def saldos_em(self, consultas):
+        resultado = np.full(len(consultas), np.nan)
+        datas = pd.to_datetime(consultas['data']).to_numpy(dtype='datetime64[ns]')
+        chaves = zip(consultas['unidade'].astype(object), consultas['material'].astype(object))
+        por_grupo = {}
+        for i, chave in enumerate(chaves):
+            por_grupo.setdefault(chave, []).append(i)
+        for (unidade, material), linhas in por_grupo.items():
+            if (unidade, material) not in self.faixas:
+                continue
+            inicio, fim = self.faixas[(unidade, material)]
+            posicao = np.searchsorted(self.datas[inicio:fim], datas[linhas], side='right')
+            valores = self.valores[inicio + np.maximum(posicao, 1) - 1]
+            resultado[linhas] = np.where(posicao > 0, valores, self._inicial(unidade, material))
+        return pd.Series(resultado, index=consultas.index, name='saldo')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reconstrução do saldo de estoque por unidade e material')
+    parser.add_argument('--entrada', default=CAMINHO_DADOS)
+    parser.add_argument('--saida', default=CAMINHO_SALDOS, help='Saldos ao final de cada dia (índice de consulta)')
+    parser.add_argument('--saldo-inicial', type=float, default=SALDO_INICIAL)
+    parser.add_argument('--consulta', nargs=3, metavar=('UNIDADE', 'MATERIAL', 'DATA'),
+                        help='Saldo em uma data, a partir do índice já gravado em --saida')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    configurar_por_argumentos(args)
+
+    if args.consulta:
+        unidade, material, data = args.consulta
+        indice = IndiceSaldos.carregar(args.saida, args.saldo_inicial)
+        print(f"Saldo de {material} em {unidade} ao final de {data}: {indice.saldo(unidade, material, data):.0f}")
+        raise SystemExit
+
+    with medir('carga') as m:
+        df = carregar(args.entrada)
+        m['linhas'] = len(df)
+    with medir('saldos', len(df)):
+        saldos = reconstruir_saldos(df, args.saldo_inicial)
+        periodos = detectar_periodos(saldos)
+    IndiceSaldos(saldos, args.saldo_inicial).salvar(args.saida)
+
+    finais = saldos.groupby(CHAVES_ESTOQUE, observed=True)['saldo'].last()
+    print("Saldo final por unidade e material:")
+    print(finais.unstack())
+    print(f"\nPeríodos de estoque negativo: {int((periodos['tipo'] == 'negativo').sum())}")
+    print(f"Períodos de estoque implausível: {int((periodos['tipo'] == 'implausivel').sum())}")
+    if len(periodos):
+        print(periodos.sort_values('saldo_minimo').head(20).to_string(index=False))
+    print(f"\nSaldos diários gravados em '{args.saida}'")
+    finalizar_por_argumentos(args)
@@ -0,0 +1,195 @@
+import cProfile
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Instrumentação das etapas (carga, limpeza, detecção, impacto, renderização,
+# PDF). Cada bloco `with medir('etapa'):` registra tempo de relógio, tempo de
+# CPU, memória e linhas processadas; o conjunto é exportado como trace JSON
+# ou CSV para comparar execuções e atribuir regressões a uma etapa
+# específica. Opcionalmente grava um perfil cProfile e um resumo de
+# alocações (tracemalloc) por etapa.
+#
+# Memória: o RSS é lido no início e no fim da etapa e amostrado por uma
+# thread a cada INTERVALO_AMOSTRAGEM enquanto ela roda; `pico_rss_mb` é o
+# maior valor visto durante a etapa (picos mais curtos que o intervalo
+# podem escapar) e `acrescimo_pico_mb` é quanto ele passou do RSS inicial,
+# o número que identifica a etapa. O RSS é do processo: etapas
+# concorrentes (o pipeline roda etapas em threads) enxergam a memória
+# umas das outras.
+#
+# CPU: `cpu_segundos` é o tempo de CPU da thread que executou a etapa
+# (time.thread_time), então etapas concorrentes não somam a CPU umas das
+# outras; trabalho em outras threads (leitores do pyarrow) ou processos
+# (pools de renderização) fica de fora.
+
+CAMINHO_TRACE = './trace_execucao.json'
+DIRETORIO_PERFIS = './perfis'
+INTERVALO_AMOSTRAGEM = 0.01  # Segundos entre leituras do RSS
+
+_medicoes = []
+_trava = threading.Lock()
+_configuracao = {'perfil_cpu': False, 'perfil_memoria': False, 'diretorio': DIRETORIO_PERFIS}
+_perfil_ativo = False
+_em_andamento = {}  # Medições cujo pico de RSS está sendo amostrado
+_amostrador = None
+
+
+def configurar(perfil_cpu=False, perfil_memoria=False, diretorio=DIRETORIO_PERFIS):
+    _configuracao.update(perfil_cpu=perfil_cpu, perfil_memoria=perfil_memoria, diretorio=diretorio)
+    if perfil_cpu or perfil_memoria:
+        os.makedirs(diretorio, exist_ok=True)
+    if perfil_memoria and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def _rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            paginas = int(f.read().split()[1])
+        return paginas * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except OSError:
+        # Sem /proc (macOS): só há o maior RSS do processo, em bytes
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 ** 2
+
+
+# Thread que atualiza o pico das etapas em andamento; termina sozinha
+# quando não há mais etapas sendo medidas
+def _amostrar():
+    global _amostrador
+    while True:
+        with _trava:
+            if not _em_andamento:
+                _amostrador = None
+                return
+            rss = _rss_mb()
+            for medicao in _em_andamento.values():
+                medicao['pico_rss_mb'] = max(medicao['pico_rss_mb'], rss)
+        time.sleep(INTERVALO_AMOSTRAGEM)
+
+
+def _iniciar_amostragem(medicao):
+    global _amostrador
+    rss = _rss_mb()
+    medicao.update(rss_inicio_mb=rss, pico_rss_mb=rss)
+    with _trava:
+        _em_andamento[id(medicao)] = medicao
+        if _amostrador is None:
+            _amostrador = threading.Thread(target=_amostrar, daemon=True)
+            _amostrador.start()
+
+
+def _encerrar_amostragem(medicao):
+    rss = _rss_mb()
+    with _trava:
+        del _em_andamento[id(medicao)]
+        medicao['pico_rss_mb'] = max(medicao['pico_rss_mb'], rss)
+    medicao.update(rss_fim_mb=rss, acrescimo_pico_mb=medicao['pico_rss_mb'] - medicao['rss_inicio_mb'])
+
+
+def _iniciar_perfil():
+    # Só um cProfile pode estar ativo por vez: etapas aninhadas ou
+    # concorrentes ficam de fora do perfil da etapa que já está sendo medida
+    global _perfil_ativo
+    with _trava:
+        if _perfil_ativo:
+            return None
+        _perfil_ativo = True
+    perfil = cProfile.Profile()
+    perfil.enable()
+    return perfil
+
+
+def _encerrar_perfil(perfil, etapa):
+    global _perfil_ativo
+    perfil.disable()
+    perfil.dump_stats(os.path.join(_configuracao['diretorio'], f'{etapa}.prof'))
+    with _trava:
+        _perfil_ativo = False
+
+
+def _gravar_alocacoes(inicial, etapa, limite=30):
+    diferencas = tracemalloc.take_snapshot().compare_to(inicial, 'lineno')
+    with open(os.path.join(_configuracao['diretorio'], f'{etapa}.memoria.txt'), 'w') as f:
+        for estatistica in diferencas[:limite]:
+            f.write(f"{estatistica}\n")
+
+
+# Mede o bloco como uma etapa. O dict devolvido pode ser alterado dentro do
+# bloco, por exemplo para informar as linhas quando só são conhecidas depois
+# da carga: `with medir('carga') as m: df = carregar(...); m['linhas'] = len(df)`
+@contextmanager
+def medir(etapa, linhas=None):
+    medicao = {'etapa': etapa, 'linhas': linhas}
+    perfil = _iniciar_perfil() if _configuracao['perfil_cpu'] else None
+    alocacoes = tracemalloc.take_snapshot() if _configuracao['perfil_memoria'] else None
+
+    inicio = time.time()
+    _iniciar_amostragem(medicao)
+    relogio, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield medicao
+    finally:
+        segundos = time.perf_counter() - relogio
+        cpu = time.thread_time() - cpu
+        _encerrar_amostragem(medicao)
+        medicao.update({
+            'inicio': inicio,
+            'segundos': segundos,
+            'cpu_segundos': cpu,
+            'linhas_por_segundo': medicao['linhas'] / segundos if medicao['linhas'] and segundos > 0 else None,
+        })
+        if perfil is not None:
+            _encerrar_perfil(perfil, etapa)
+        if alocacoes is not None:
+            _gravar_alocacoes(alocacoes, etapa)
+        with _trava:
+            _medicoes.append(medicao)
+
+
+def medicoes():
+    with _trava:
+        tabela = pd.DataFrame(_medicoes, columns=[
+            'etapa', 'inicio', 'segundos', 'cpu_segundos', 'rss_inicio_mb', 'rss_fim_mb', 'pico_rss_mb',
+            'acrescimo_pico_mb', 'linhas', 'linhas_por_segundo'
+        ])
+    return tabela.astype({'linhas': 'Int64', 'linhas_por_segundo': 'float64'})
+
+
+def limpar():
+    with _trava:
+        _medicoes.clear()
+
+
+# Grava o trace em JSON (lista de medições) ou CSV, conforme a extensão
+def salvar_trace(caminho=CAMINHO_TRACE):
+    tabela = medicoes()
+    if caminho.endswith('.csv'):
+        tabela.to_csv(caminho, index=False)
+    else:
+        with open(caminho, 'w') as f:
+            json.dump(json.loads(tabela.to_json(orient='records')), f, indent=2, ensure_ascii=False)
+    return caminho
+
+
+def adicionar_argumentos(parser):
+    grupo = parser.add_argument_group('instrumentação')
+    grupo.add_argument('--trace', default=None, help='Grava o trace das etapas (.json ou .csv)')
+    grupo.add_argument('--perfil-cpu', action='store_true', help='Grava um perfil cProfile por etapa')
+    grupo.add_argument('--perfil-memoria', action='store_true', help='Grava as maiores alocações por etapa')
+    grupo.add_argument('--diretorio-perfis', default=DIRETORIO_PERFIS)
+
+
+def configurar_por_argumentos(args):
+    configurar(args.perfil_cpu, args.perfil_memoria, args.diretorio_perfis)
+
+
+def finalizar_por_argumentos(args):
+    if args.trace:
+        print(f"Trace das etapas salvo em '{salvar_trace(args.trace)}'")
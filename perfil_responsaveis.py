@@ -0,0 +1,157 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from analise_exploratoria import mascara_inconsistencias
+from armazenamento import carregar
+from cubo_agregado import COLUNAS_SEVERIDADE
+from deteccao_duplicatas import COLUNAS_REGISTRO, marcar_duplicatas_exatas
+from deteccao_outliers import CAMINHO_METRICAS
+from esquema import aplicar_esquema
+from instrumentacao import adicionar_argumentos, configurar_por_argumentos, finalizar_por_argumentos, medir
+from simulacao_impacto_financeiro import SEVERIDADES_ANOMALIA
+
+CAMINHO_PERFIL = './perfil_responsaveis.parquet'
+
+# Perfil de cada responsável: movimentações, anomalias por severidade,
+# erros de sinal e duplicatas. As contagens são montadas como colunas de
+# medidas e somadas em uma única passada agrupada pelo código categórico do
+# responsável; a tabela resultante tem uma linha por responsável, com o
+# nome como categórica, e é indexada por ele. Consultas por nome e top-k
+# usam só essa tabela, sem voltar às movimentações.
+#
+# As contagens são aditivas, então o perfil pode ser atualizado com novos
+# lotes; as taxas são sempre recalculadas a partir delas.
+
+# Responsáveis com menos movimentações que isso ficam fora dos rankings por
+# taxa: com uma só linha a taxa é 0 ou 1. Nos dados de exemplo a maioria dos
+# responsáveis tem uma ou duas movimentações, então o corte é baixo
+MINIMO_MOVIMENTACOES = 2
+TOP_K = 10
+
+# Ranking padrão; registros sem severidade não têm taxa de anomalias e
+# caem na taxa de erros de sinal
+POR_PADRAO = 'taxa_anomalias'
+POR_REGISTROS = 'taxa_sinal_invertido'
+
+CONTAGENS = ['movimentacoes', 'anomalias', *COLUNAS_SEVERIDADE.values(), 'sinal_invertido', 'duplicatas']
+
+
+# Contagens por linha; a severidade só existe nas métricas de variação
+def _medidas(df):
+    medidas = pd.DataFrame({
+        'movimentacoes': np.ones(len(df), dtype='int32'),
+        'sinal_invertido': mascara_inconsistencias(df).to_numpy(),
+        # Duplicata é atribuída a quem registrou a repetição, não a primeira
+        # ocorrência; em atualizações, só conta repetições dentro do mesmo lote
+        'duplicatas': marcar_duplicatas_exatas(df, COLUNAS_REGISTRO).to_numpy(),
+    }, index=df.index)
+    if 'severidade' in df.columns:
+        medidas['anomalias'] = df['severidade'].isin(SEVERIDADES_ANOMALIA).to_numpy()
+        for nivel, coluna in COLUNAS_SEVERIDADE.items():
+            medidas[coluna] = (df['severidade'] == nivel).to_numpy()
+    return medidas
+
+
+def _taxas(tabela):
+    movimentacoes = tabela['movimentacoes'].to_numpy(dtype='float64')
+    for coluna in CONTAGENS[1:]:
+        if coluna in tabela.columns:
+            tabela[f"taxa_{coluna.removeprefix('n_')}"] = tabela[coluna].to_numpy() / movimentacoes
+    return tabela
+
+
+class PerfilResponsaveis:
+    """Contagens e taxas por responsável, indexadas pelo nome (categórica)."""
+
+    def __init__(self, tabela=None):
+        self.tabela = tabela
+
+    @classmethod
+    def carregar(cls, caminho=CAMINHO_PERFIL):
+        if not os.path.exists(caminho):
+            return cls()
+        tabela = aplicar_esquema(pd.read_parquet(caminho))
+        return cls(_taxas(tabela.set_index('responsavel')))
+
+    def salvar(self, caminho=CAMINHO_PERFIL):
+        contagens = self.tabela[[c for c in CONTAGENS if c in self.tabela.columns]]
+        contagens.reset_index().to_parquet(caminho, index=False)
+
+    # Incorpora um lote de movimentações (ou de métricas) ao perfil
+    def atualizar(self, df):
+        medidas = _medidas(df)
+        lote = medidas.groupby(df['responsavel'], observed=True, sort=False).sum()
+
+        if self.tabela is not None:
+            anteriores = self.tabela[[c for c in CONTAGENS if c in self.tabela.columns]]
+            lote = pd.concat([anteriores, lote]).fillna(0)
+            lote = lote.groupby(level='responsavel', observed=True, sort=False).sum()
+        lote = lote.reset_index()
+        lote['responsavel'] = lote['responsavel'].astype('category')
+        lote = lote[['responsavel'] + [c for c in CONTAGENS if c in lote.columns]]
+        lote = lote.astype({c: 'int32' for c in CONTAGENS if c in lote.columns})
+        self.tabela = _taxas(lote.set_index('responsavel'))
+        return self
+
+    def consultar(self, responsavel):
+        return self.tabela.loc[responsavel]
+
+    # Os k responsáveis com o maior valor de `por` (contagem ou taxa). Para
+    # taxas, só entram os que têm pelo menos `minimo` movimentações.
+    # Seleção parcial em O(n) com argpartition e ordenação só dos k escolhidos
+    def top(self, k=TOP_K, por=POR_PADRAO, minimo=MINIMO_MOVIMENTACOES):
+        candidatos = self.tabela
+        if por.startswith('taxa_'):
+            candidatos = candidatos[candidatos['movimentacoes'].to_numpy() >= minimo]
+        valores = candidatos[por].to_numpy(dtype='float64')
+        k = min(k, len(valores))
+        if k == 0:
+            return candidatos.iloc[:0]
+        escolhidos = np.argpartition(-valores, k - 1)[:k]
+        escolhidos = escolhidos[np.argsort(-valores[escolhidos], kind='stable')]
+        return candidatos.iloc[escolhidos]
+
+
+def construir_perfil(df):
+    return PerfilResponsaveis().atualizar(df)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Perfil de anomalias e erros por responsável')
+    parser.add_argument('--entrada', default=CAMINHO_METRICAS,
+                        help='Métricas de variação (ou registros, sem as contagens por severidade)')
+    parser.add_argument('--perfil', default=CAMINHO_PERFIL)
+    parser.add_argument('--atualizar', action='store_true', help='Soma a entrada ao perfil já gravado')
+    parser.add_argument('--top', type=int, default=TOP_K)
+    parser.add_argument('--por', default=None,
+                        help=f'Coluna usada no ranking (contagem ou taxa_*); padrão {POR_PADRAO}, '
+                             f'ou {POR_REGISTROS} em registros sem severidade')
+    parser.add_argument('--minimo', type=int, default=MINIMO_MOVIMENTACOES)
+    parser.add_argument('--responsavel', default=None, help='Mostra o perfil de um responsável')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    configurar_por_argumentos(args)
+
+    perfil = PerfilResponsaveis.carregar(args.perfil) if args.atualizar else PerfilResponsaveis()
+    with medir('carga') as m:
+        df = carregar(args.entrada)
+        m['linhas'] = len(df)
+    with medir('perfil', len(df)):
+        perfil.atualizar(df)
+    perfil.salvar(args.perfil)
+    print(f"{len(perfil.tabela)} responsáveis no perfil gravado em '{args.perfil}'")
+
+    if args.responsavel:
+        print(perfil.consultar(args.responsavel).to_string())
+    else:
+        disponiveis = list(perfil.tabela.columns)
+        if args.por is None:
+            args.por = POR_PADRAO if POR_PADRAO in disponiveis else POR_REGISTROS
+        elif args.por not in disponiveis:
+            parser.error(f"--por {args.por} não existe nesta entrada (use {', '.join(disponiveis)})")
+        print(f"\nTop {args.top} por {args.por} (mínimo de {args.minimo} movimentações nas taxas):")
+        print(perfil.top(args.top, args.por, args.minimo).to_string())
+    finalizar_por_argumentos(args)
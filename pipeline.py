@@ -0,0 +1,217 @@
+import argparse
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+import analise_exploratoria
+import deteccao_outliers
+import simulacao_impacto_financeiro
+from armazenamento import carregar, salvar
+from cache_artefatos import CacheArtefatos, hash_conteudo, versao_codigo
+from criar_apresentacao import gerar_apresentacao, resumir_resultados
+from instrumentacao import adicionar_argumentos, configurar_por_argumentos, finalizar_por_argumentos, medir
+from deteccao_duplicatas import marcar_duplicatas
+from deteccao_outliers import CAMINHO_DADOS, CAMINHO_METRICAS, calcular_metricas_variacao
+from renderizacao import renderizar_graficos
+
+# Executor único do projeto. As etapas formam um DAG:
+#
+#   dados -> metricas -> duplicatas -> impacto --\
+#        \-> eda ----------------------------------> apresentacao
+#
+# Etapas independentes (eda e impacto) rodam em paralelo, os dados passam
+# de uma etapa para outra em memória e cada etapa só é recalculada quando
+# suas entradas mudaram. As etapas linha a linha (metricas e duplicatas)
+# ficam no cache por unidade: alterar os registros de uma unidade só
+# recalcula a parte dela. Os agregados sobre todas as unidades (eda e
+# impacto) continuam sendo recalculados por inteiro.
+
+
+class Etapa:
+    """Uma etapa do pipeline.
+
+    `calcular` recebe os resultados das dependências (na ordem declarada)
+    e deve ser puro, pois seu resultado pode vir do cache. `publicar`,
+    opcional, grava os arquivos derivados do resultado e sempre é executado.
+    Etapas que só produzem efeitos colaterais usam `em_cache=False`.
+    `codigo` lista as funções cujo código entra na assinatura (padrão:
+    `calcular`); funções locais do pipeline devem apontar as que chamam.
+    Com `particao` (uma coluna, ex.: 'unidade'), a primeira entrada é
+    dividida pelos valores dessa coluna e cada parte é calculada e guardada
+    no cache separadamente; `calcular` deve devolver um DataFrame linha a
+    linha com a parte, sem depender das outras partes.
+    """
+
+    def __init__(self, nome, calcular, dependencias=(), publicar=None, parametros=None, em_cache=True,
+                 codigo=None, particao=None):
+        self.nome = nome
+        self.calcular = calcular
+        self.dependencias = list(dependencias)
+        self.publicar = publicar
+        self.parametros = parametros or {}
+        self.em_cache = em_cache
+        self.versao = versao_codigo(*(codigo or [calcular]))
+        self.particao = particao
+
+
+def _contar_linhas(*objetos):
+    for obj in objetos:
+        if isinstance(obj, pd.DataFrame):
+            return len(obj)
+    return None
+
+
+# Calcula a etapa parte por parte da primeira entrada. A chave de cada parte
+# é o hash do seu conteúdo (sem o índice, que muda quando outras unidades
+# ganham ou perdem linhas) com a assinatura `base` da etapa; a assinatura
+# da etapa passa a ser a das chaves das partes
+def _calcular_por_parte(etapa, entradas, base, cache):
+    dados, demais = entradas[0], entradas[1:]
+    partes = dados.groupby(etapa.particao, observed=True, dropna=False, sort=True).indices
+    resultados, chaves, reaproveitadas = [], [], 0
+    for posicoes in partes.values():
+        parte = dados.iloc[posicoes]
+        chave = f"{etapa.nome}-{hash_conteudo(base, parte)}"
+        resultado = cache.obter_objeto(chave)
+        if resultado is None:
+            resultado = etapa.calcular(parte, *demais)
+            cache.salvar_objeto(chave, resultado)
+        else:
+            resultado.index = parte.index
+            reaproveitadas += 1
+        resultados.append(resultado)
+        chaves.append(chave)
+
+    # Volta à ordem das linhas da entrada
+    ordem = np.argsort(np.concatenate(list(partes.values())), kind='stable')
+    resultado = pd.concat(resultados).iloc[ordem]
+    return resultado, f"{etapa.nome}-{hash_conteudo(chaves)}", reaproveitadas == len(partes)
+
+
+def _executar_etapa(etapa, entradas, assinatura, cache):
+    with medir(etapa.nome) as medicao:
+        usar_cache = cache is not None and assinatura and etapa.em_cache
+        if usar_cache and etapa.particao is not None and len(entradas[0]):
+            resultado, assinatura, reaproveitada = _calcular_por_parte(etapa, entradas, assinatura, cache)
+        else:
+            resultado = cache.obter_objeto(assinatura) if usar_cache else None
+            reaproveitada = resultado is not None
+            if not reaproveitada:
+                resultado = etapa.calcular(*entradas)
+                if usar_cache:
+                    cache.salvar_objeto(assinatura, resultado)
+        if etapa.publicar is not None:
+            etapa.publicar(resultado)
+        medicao['linhas'] = _contar_linhas(*entradas, resultado)
+    return resultado, assinatura, medicao['segundos'], reaproveitada
+
+
+def _ordem_valida(etapas):
+    nomes = set()
+    for etapa in etapas:
+        faltando = [d for d in etapa.dependencias if d not in nomes]
+        if faltando:
+            raise ValueError(f"Etapa '{etapa.nome}' depende de etapas não declaradas antes: {faltando}")
+        nomes.add(etapa.nome)
+
+
+# Executa as etapas respeitando as dependências. A assinatura de cada etapa é
+# o hash de seu nome, parâmetros, versão do código e das assinaturas das
+# dependências; a etapa raiz (sem dependências) é assinada pelo conteúdo do
+# seu resultado. Nas etapas particionadas, a primeira dependência entra pelo
+# conteúdo de cada parte, e não pela assinatura (ver _calcular_por_parte).
+# Devolve os resultados e uma tabela de tempos por etapa
+def executar_pipeline(etapas, cache=None, processos=4):
+    _ordem_valida(etapas)
+    pendentes = {e.nome: e for e in etapas}
+    resultados, assinaturas, tempos = {}, {}, []
+
+    with ThreadPoolExecutor(max_workers=processos) as executor:
+        em_execucao = {}
+        while pendentes or em_execucao:
+            for nome, etapa in list(pendentes.items()):
+                if all(d in resultados for d in etapa.dependencias):
+                    entradas = [resultados[d] for d in etapa.dependencias]
+                    assinatura = None
+                    if etapa.dependencias:
+                        assinadas = etapa.dependencias[1:] if etapa.particao else etapa.dependencias
+                        assinatura = f"{nome}-{hash_conteudo(nome, etapa.parametros, etapa.versao, [assinaturas[d] for d in assinadas])}"
+                    em_execucao[executor.submit(_executar_etapa, etapa, entradas, assinatura, cache)] = etapa
+                    del pendentes[nome]
+
+            concluidas, _ = wait(em_execucao, return_when=FIRST_COMPLETED)
+            for futuro in concluidas:
+                etapa = em_execucao.pop(futuro)
+                resultado, assinatura, duracao, reaproveitada = futuro.result()
+                resultados[etapa.nome] = resultado
+                assinaturas[etapa.nome] = assinatura or f"{etapa.nome}-{hash_conteudo(resultado, etapa.parametros)}"
+                tempos.append({'etapa': etapa.nome, 'segundos': duracao, 'cache': reaproveitada})
+                print(f"[{etapa.nome}] concluída em {duracao:.2f}s{' (cache)' if reaproveitada else ''}")
+
+    return resultados, pd.DataFrame(tempos)
+
+
+# O pyplot não é seguro entre threads: as publicações de gráficos são serializadas
+_trava_graficos = threading.Lock()
+
+
+def etapas_padrao(caminho_dados=CAMINHO_DADOS, caminho_metricas=CAMINHO_METRICAS, cache=None):
+    def publicar_metricas(metricas):
+        salvar(metricas, caminho_metricas)
+        with _trava_graficos:
+            renderizar_graficos(deteccao_outliers.especificacoes_graficos(metricas), cache=cache)
+
+    def publicar_eda(resumo):
+        analise_exploratoria.escrever_resultados(resumo)
+        with _trava_graficos:
+            renderizar_graficos(analise_exploratoria.especificacoes_graficos(resumo), cache=cache)
+
+    def publicar_impacto(impacto):
+        simulacao_impacto_financeiro.escrever_relatorio(impacto)
+        with _trava_graficos:
+            renderizar_graficos(simulacao_impacto_financeiro.especificacoes_graficos(impacto), cache=cache)
+
+    return [
+        Etapa('dados', lambda: carregar(caminho_dados)),
+        # Os grupos (material, unidade) e as duplicatas nunca cruzam unidades,
+        # então essas etapas podem ser calculadas unidade a unidade
+        Etapa('metricas', calcular_metricas_variacao, ['dados'], publicar=publicar_metricas, parametros={
+            'chaves': deteccao_outliers.CHAVES_GRUPO,
+            'limite_atencao': deteccao_outliers.LIMITE_ATENCAO,
+            'limite_alerta': deteccao_outliers.LIMITE_ALERTA,
+            'limite_critico': deteccao_outliers.LIMITE_CRITICO,
+            'fator_iqr': deteccao_outliers.FATOR_IQR,
+        }, particao='unidade'),
+        Etapa('eda', analise_exploratoria.resumir, ['dados'], publicar=publicar_eda),
+        Etapa('duplicatas', marcar_duplicatas, ['metricas'], particao='unidade'),
+        Etapa('impacto', simulacao_impacto_financeiro.calcular_impacto_financeiro, ['duplicatas'],
+              publicar=publicar_impacto, parametros={
+                  'precos': simulacao_impacto_financeiro.precos_materiais,
+                  'taxa_ausentes': simulacao_impacto_financeiro.TAXA_AUSENTES,
+                  'taxa_duplicacao': simulacao_impacto_financeiro.TAXA_DUPLICACAO,
+              }),
+        # Os números do texto vêm das métricas e do impacto já calculado
+        Etapa('apresentacao', lambda metricas, _, impacto: gerar_apresentacao(
+            resumo=resumir_resultados(metricas, impacto, por_unidade=False)[None]
+        ), ['metricas', 'eda', 'impacto'], em_cache=False),
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Executa o pipeline completo de detecção de anomalias')
+    parser.add_argument('--entrada', default=CAMINHO_DADOS)
+    parser.add_argument('--metricas', default=CAMINHO_METRICAS)
+    parser.add_argument('--processos', type=int, default=4, help='Etapas executadas em paralelo')
+    parser.add_argument('--sem-cache', action='store_true', help='Recalcula todas as etapas')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    configurar_por_argumentos(args)
+
+    cache = None if args.sem_cache else CacheArtefatos()
+    _, tempos = executar_pipeline(etapas_padrao(args.entrada, args.metricas, cache), cache, args.processos)
+
+    print("\nTempo por etapa:")
+    print(tempos.to_string(index=False))
+    finalizar_por_argumentos(args)
@@ -0,0 +1,165 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from armazenamento import carregar
+from cache_artefatos import hash_conteudo
+from deteccao_outliers import CAMINHO_DADOS
+from instrumentacao import adicionar_argumentos, configurar_por_argumentos, finalizar_por_argumentos, medir
+
+CAMINHO_PRECOS = './precos_materiais.csv'
+
+# Tabela de preços com vigência. Cada linha do histórico diz que, a partir
+# de `vigencia`, o material custa `preco` na unidade (unidade vazia = preço
+# de todas as unidades, como em um contrato corporativo). O histórico fica
+# ordenado por (material, unidade, vigência), com cada par ocupando uma
+# faixa contígua (como o índice de saldos de estoque.py); o preço de um
+# movimento é o da última vigência até a sua data (junção "as-of"), obtido
+# por busca binária na faixa do par. O preço específico da unidade tem
+# prioridade sobre o geral do material.
+#
+# As consultas são vetorizadas: as linhas são separadas por
+# (material, unidade) e cada grupo faz um único searchsorted. Para valorar
+# anos de histórico, o impacto usa os agregados por (material, unidade, dia)
+# (ver simulacao_impacto_financeiro.agregar_por_grupo e o cubo agregado),
+# que não dependem do preço: trocar a tabela só revalora esses agregados.
+
+COLUNAS_HISTORICO = ['material', 'unidade', 'vigencia', 'preco']
+INICIO_VIGENCIA = pd.Timestamp('2000-01-01')  # Vigência dos preços sem data
+
+
+# Histórico com um único preço por material, vigente desde INICIO_VIGENCIA
+def historico_de_dicionario(precos, vigencia=INICIO_VIGENCIA):
+    return pd.DataFrame({
+        'material': list(precos),
+        'unidade': [None] * len(precos),
+        'vigencia': [pd.Timestamp(vigencia)] * len(precos),
+        'preco': [float(p) for p in precos.values()],
+    })
+
+
+class TabelaPrecos:
+    """Histórico de preços por material e unidade, para consulta por data.
+
+    `faixas` guarda o início e o fim de cada (material, unidade) nos arrays
+    de vigências e preços; unidade None é o preço geral do material.
+    """
+
+    def __init__(self, historico):
+        historico = historico[COLUNAS_HISTORICO + [c for c in historico.columns if c not in COLUNAS_HISTORICO]]
+        historico = historico.assign(
+            material=historico['material'].astype(object),
+            unidade=historico['unidade'].astype(object).where(historico['unidade'].notna(), None),
+            vigencia=pd.to_datetime(historico['vigencia']).dt.normalize(),
+            preco=historico['preco'].astype('float64'),
+        )
+        # Ordenação estável: em vigências repetidas vale a última linha informada
+        chave_unidade = historico['unidade'].fillna('')
+        ordem = np.lexsort((historico['vigencia'].to_numpy(), chave_unidade.to_numpy(dtype=str),
+                            historico['material'].to_numpy(dtype=str)))
+        self.historico = historico.iloc[ordem].reset_index(drop=True)
+        self.vigencias = self.historico['vigencia'].to_numpy(dtype='datetime64[ns]')
+        self.valores = self.historico['preco'].to_numpy(dtype='float64')
+
+        materiais = self.historico['material'].to_numpy(dtype=object)
+        unidades = self.historico['unidade'].to_numpy(dtype=object)
+        novo = np.r_[True, (materiais[1:] != materiais[:-1]) | (unidades[1:] != unidades[:-1])]
+        inicios = np.flatnonzero(novo)
+        fins = np.r_[inicios[1:], len(novo)]
+        self.faixas = {(materiais[i], unidades[i]): (int(i), int(f)) for i, f in zip(inicios, fins)}
+
+    @classmethod
+    def de_dicionario(cls, precos, vigencia=INICIO_VIGENCIA):
+        return cls(historico_de_dicionario(precos, vigencia))
+
+    @classmethod
+    def carregar(cls, caminho=CAMINHO_PRECOS):
+        return cls(pd.read_csv(caminho, parse_dates=['vigencia'], dtype={'material': str, 'unidade': str}))
+
+    def salvar(self, caminho=CAMINHO_PRECOS):
+        self.historico.to_csv(caminho, index=False, date_format='%Y-%m-%d')
+
+    # O hash do histórico entra nas chaves do cache de artefatos
+    def __repr__(self):
+        return f'TabelaPrecos({hash_conteudo(self.historico)})'
+
+    # Posição do preço vigente em cada data dentro da faixa de `chave`; -1 se
+    # a data é anterior à primeira vigência ou se não há preço para a chave
+    def _posicoes(self, chave, datas):
+        if chave not in self.faixas:
+            return np.full(len(datas), -1)
+        inicio, fim = self.faixas[chave]
+        posicao = np.searchsorted(self.vigencias[inicio:fim], datas, side='right')
+        return np.where(posicao > 0, inicio + posicao - 1, -1)
+
+    # Preço vigente de cada linha (NaN se não houver). Datas nulas recebem o
+    # preço mais recente do material
+    def precos_em(self, materiais, unidades, datas):
+        datas = pd.to_datetime(pd.Series(datas)).to_numpy(dtype='datetime64[ns]')
+        datas = np.where(np.isnat(datas), np.datetime64('2262-01-01', 'ns'), datas)
+        chaves = pd.DataFrame({'material': np.asarray(materiais, dtype=object),
+                               'unidade': np.asarray(unidades, dtype=object)})
+        resultado = np.full(len(chaves), np.nan)
+
+        for (material, unidade), linhas in chaves.groupby(['material', 'unidade'], dropna=False,
+                                                          sort=False).indices.items():
+            if pd.isna(material):
+                continue
+            unidade = None if pd.isna(unidade) else unidade
+            posicao = self._posicoes((material, None), datas[linhas])
+            if unidade is not None:
+                especifica = self._posicoes((material, unidade), datas[linhas])
+                posicao = np.where(especifica >= 0, especifica, posicao)
+            resultado[linhas] = np.where(posicao >= 0, self.valores[posicao], np.nan)
+        return resultado
+
+    def preco(self, material, data, unidade=None):
+        return float(self.precos_em([material], [unidade], [data])[0])
+
+
+# Preço de cada linha com uma tabela de preços ou com um dicionário
+# {material: preço} (preço único, como em precos_materiais)
+def precos_por_linha(precos, materiais, unidades, datas):
+    if isinstance(precos, TabelaPrecos):
+        return precos.precos_em(materiais, unidades, datas)
+    return pd.Series(np.asarray(materiais, dtype=object)).map(precos).to_numpy(dtype='float64')
+
+
+# Valor de cada movimentação (|quantidade| x preço vigente na data)
+def valorar_movimentos(df, precos):
+    preco = precos_por_linha(precos, df['material'], df['unidade'], df['data'])
+    return (df['quantidade'].astype('float64').abs() * preco).rename('valor')
+
+
+if __name__ == '__main__':
+    # Importado aqui: simulacao_impacto_financeiro importa este módulo
+    from simulacao_impacto_financeiro import precos_materiais
+
+    parser = argparse.ArgumentParser(description='Valoração das movimentações com a tabela de preços vigente')
+    parser.add_argument('--entrada', default=CAMINHO_DADOS)
+    parser.add_argument('--precos', default=CAMINHO_PRECOS,
+                        help='Histórico (material, unidade, vigencia, preco); sem o arquivo, usa os preços fixos')
+    parser.add_argument('--exportar', action='store_true', help='Grava os preços fixos como histórico em --precos')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    configurar_por_argumentos(args)
+
+    if args.exportar:
+        TabelaPrecos.de_dicionario(precos_materiais).salvar(args.precos)
+        print(f"Histórico de preços gravado em '{args.precos}'")
+    tabela = TabelaPrecos.carregar(args.precos) if os.path.exists(args.precos) \
+        else TabelaPrecos.de_dicionario(precos_materiais)
+
+    with medir('carga') as m:
+        df = carregar(args.entrada, colunas=['data', 'unidade', 'material', 'quantidade'])
+        m['linhas'] = len(df)
+    with medir('valoracao', len(df)):
+        valor = valorar_movimentos(df, tabela)
+
+    mes = df['data'].dt.year * 100 + df['data'].dt.month
+    print("Valor movimentado por mês e material (R$):")
+    print(valor.groupby([mes.rename('mes'), df['material']], observed=True).sum().unstack().round(2))
+    print(f"\nTotal: R$ {valor.sum():.2f}")
+    finalizar_por_argumentos(args)
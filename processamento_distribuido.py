@@ -0,0 +1,352 @@
+import argparse
+import os
+import shutil
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Process
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from armazenamento import ler_em_blocos, salvar
+from deteccao_duplicatas import hash_linhas, marcar_duplicatas
+from deteccao_outliers import CAMINHO_DADOS, CAMINHO_METRICAS, calcular_metricas_variacao
+from esquema import aplicar_esquema, tipar_quantidade
+from instrumentacao import adicionar_argumentos, configurar_por_argumentos, finalizar_por_argumentos, medir
+from simulacao_impacto_financeiro import agregar_por_grupo, consolidar_impacto, escrever_relatorio
+
+# Processamento particionado (sharding) da detecção e do impacto financeiro.
+# As estatísticas de cada (material, unidade) só dependem das linhas do
+# próprio grupo, assim como as duplicatas (que têm unidade e material na
+# chave). Particionando o histórico por unidade, ou por hash de
+# unidade+material, cada partição pode ser processada de forma independente
+# e os resultados parciais são unidos sem aproximação: métricas por linha
+# são concatenadas e reordenadas pela posição original; os agregados de
+# impacto são somas por grupo.
+#
+# Etapas:
+#   1. particionar: lê a entrada em blocos e grava uma partição Parquet por shard
+#   2. processar:   cada partição é processada por um processo, de duas formas:
+#        pool  ProcessPoolExecutor local
+#        fila  trabalhadores que disputam as partições em um diretório de
+#              fila; outros nós com acesso ao diretório (NFS etc.) podem
+#              participar com `--trabalhador DIRETORIO`. Cada reserva tem
+#              um prazo (o mtime do arquivo reservado, renovado enquanto o
+#              trabalhador processa); reservas não renovadas voltam à fila,
+#              então um trabalhador que morre não trava o coordenador. Os
+#              relógios dos nós devem estar sincronizados
+#   3. consolidar:  une as métricas e os agregados e gera o relatório
+#
+# A etapa 1 e a gravação das métricas em 3 são sequenciais; o ganho com o
+# número de processos vem da etapa 2, que concentra o custo.
+
+DIRETORIO_TRABALHO = './processamento_distribuido'
+MODOS_PARTICAO = ['unidade', 'hash']
+NUMERO_SHARDS = 16  # Partições no modo 'hash'
+TAMANHO_BLOCO = 1_000_000
+INTERVALO_ESPERA = 1.0  # Segundos entre verificações do coordenador no modo fila
+DURACAO_RESERVA = 300.0  # Segundos sem renovação até a reserva de uma partição expirar
+PRAZO_FILA = 6 * 3600.0  # Prazo total do coordenador no modo fila
+
+COLUNA_ORDEM = '_ordem'  # Posição original da linha, para reordenar ao consolidar
+CHAVES_SHARD = ['unidade', 'material']
+
+# Subdiretórios da fila
+PENDENTES = 'pendentes'
+EM_ANDAMENTO = 'em_andamento'
+CONCLUIDOS = 'concluidos'
+RESULTADOS = 'resultados'
+
+
+# Identificador da partição de cada linha. No modo 'unidade' cada unidade
+# ganha um número na ordem em que aparece (`ids` é compartilhado entre os
+# blocos); linhas sem unidade ficam em uma partição própria
+def atribuir_shards(df, modo='unidade', n_shards=NUMERO_SHARDS, ids=None):
+    if modo == 'hash':
+        return hash_linhas(df, CHAVES_SHARD) % n_shards
+
+    ids = {} if ids is None else ids
+    unidades = df['unidade'].astype(object).where(df['unidade'].notna(), None)
+    for unidade in unidades.unique():
+        ids.setdefault(unidade, len(ids))
+    return unidades.map(ids).to_numpy()
+
+
+# Esquema fixo das partições: blocos diferentes podem ter dicionários e
+# tipos de quantidade diferentes, então tudo é gravado como texto/float e o
+# esquema canônico é reaplicado na leitura
+def _tabela_particao(df):
+    colunas = {}
+    for col in df.columns:
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype) or serie.dtype == object:
+            colunas[col] = pa.array(serie.astype(object).where(serie.notna(), None), type=pa.string())
+        elif col == 'quantidade':
+            colunas[col] = pa.array(serie.astype('float64'), type=pa.float64())
+        else:
+            colunas[col] = pa.array(serie)
+    return pa.table(colunas)
+
+
+def _nome_shard(shard):
+    return f'shard_{shard:04d}.parquet'
+
+
+def _preparar_diretorio(diretorio):
+    shutil.rmtree(diretorio, ignore_errors=True)
+    for sub in (PENDENTES, EM_ANDAMENTO, CONCLUIDOS, RESULTADOS):
+        os.makedirs(os.path.join(diretorio, sub))
+
+
+# Lê a entrada em blocos e grava cada partição em pendentes/. Devolve o
+# número de linhas lidas
+def particionar(caminho, diretorio=DIRETORIO_TRABALHO, modo='unidade', n_shards=NUMERO_SHARDS,
+                tamanho_bloco=TAMANHO_BLOCO):
+    _preparar_diretorio(diretorio)
+    escritores = {}
+    ids = {}
+    total = 0
+    try:
+        for bloco in ler_em_blocos(caminho, tamanho_bloco):
+            bloco = bloco.reset_index(drop=True)
+            bloco[COLUNA_ORDEM] = pd.RangeIndex(total, total + len(bloco), dtype='int64')
+            total += len(bloco)
+
+            shards = atribuir_shards(bloco, modo, n_shards, ids)
+            for shard, linhas in bloco.groupby(shards, sort=False):
+                tabela = _tabela_particao(linhas)
+                if shard not in escritores:
+                    destino = os.path.join(diretorio, PENDENTES, _nome_shard(int(shard)))
+                    escritores[shard] = pq.ParquetWriter(destino, tabela.schema)
+                escritores[shard].write_table(tabela.cast(escritores[shard].schema))
+    finally:
+        for escritor in escritores.values():
+            escritor.close()
+    return total
+
+
+def _gravar_atomico(gravar, destino):
+    temporario = f'{destino}.tmp{os.getpid()}'
+    gravar(temporario)
+    os.replace(temporario, destino)
+
+
+# Detecção, duplicatas e agregados de impacto de uma partição. As métricas
+# vão para resultados/<nome>.metricas.parquet e os agregados por
+# (material, unidade) para resultados/<nome>.grupos.pkl
+def processar_shard(caminho, diretorio_resultados, nome=None):
+    df = aplicar_esquema(pq.read_table(caminho).to_pandas())
+    metricas = calcular_metricas_variacao(df)
+    grupos = agregar_por_grupo(marcar_duplicatas(metricas))
+
+    nome = (nome or os.path.basename(caminho)).removesuffix('.parquet')
+    base = os.path.join(diretorio_resultados, nome)
+    _gravar_atomico(lambda destino: metricas.to_parquet(destino, index=False), f'{base}.metricas.parquet')
+    _gravar_atomico(lambda destino: grupos.to_pickle(destino), f'{base}.grupos.pkl')
+    return len(df)
+
+
+# Partições pendentes, as maiores primeiro, para equilibrar a carga
+def _pendentes(diretorio):
+    pasta = os.path.join(diretorio, PENDENTES)
+    tamanhos = {}
+    for nome in os.listdir(pasta):
+        try:
+            tamanhos[nome] = os.path.getsize(os.path.join(pasta, nome))
+        except FileNotFoundError:
+            pass  # Reservada por outro trabalhador entre a listagem e a consulta
+    return sorted((n for n in tamanhos if n.endswith('.parquet')), key=tamanhos.get, reverse=True)
+
+
+def processar_com_pool(diretorio=DIRETORIO_TRABALHO, processos=None):
+    nomes = _pendentes(diretorio)
+    resultados = os.path.join(diretorio, RESULTADOS)
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        futuros = [executor.submit(processar_shard, os.path.join(diretorio, PENDENTES, n), resultados)
+                   for n in nomes]
+        linhas = sum(f.result() for f in futuros)
+    for nome in nomes:
+        os.replace(os.path.join(diretorio, PENDENTES, nome), os.path.join(diretorio, CONCLUIDOS, nome))
+    return linhas
+
+
+# Renova a reserva (mtime do arquivo) até `parar`, enquanto a partição é processada
+def _renovar_reserva(reservado, parar, intervalo):
+    while not parar.wait(intervalo):
+        try:
+            os.utime(reservado)
+        except FileNotFoundError:
+            return  # A reserva expirou e a partição voltou à fila
+
+
+# Devolve à fila as reservas não renovadas há mais de `duracao_reserva`
+# segundos (trabalhador morto ou travado). Devolve os nomes das partições
+def recuperar_reservas_expiradas(diretorio=DIRETORIO_TRABALHO, duracao_reserva=DURACAO_RESERVA):
+    pasta = os.path.join(diretorio, EM_ANDAMENTO)
+    limite = time.time() - duracao_reserva
+    devolvidas = []
+    for reserva in os.listdir(pasta):
+        nome = reserva[:reserva.index('.parquet.') + len('.parquet')]
+        try:
+            if os.path.getmtime(os.path.join(pasta, reserva)) >= limite:
+                continue
+            os.rename(os.path.join(pasta, reserva), os.path.join(diretorio, PENDENTES, nome))
+        except FileNotFoundError:
+            continue  # Concluída ou recuperada por outro processo
+        devolvidas.append(nome)
+    return devolvidas
+
+
+# Laço de um trabalhador da fila: reserva uma partição movendo-a para
+# em_andamento/ (a renomeação é atômica, então só um trabalhador consegue),
+# processa renovando a reserva e move para concluidos/. Termina quando não
+# há mais pendentes. Se a reserva expirou no meio do caminho, o resultado
+# gravado é o mesmo que outro trabalhador produziria
+def trabalhador(diretorio=DIRETORIO_TRABALHO, duracao_reserva=DURACAO_RESERVA):
+    identificador = f'{socket.gethostname()}-{os.getpid()}'
+    resultados = os.path.join(diretorio, RESULTADOS)
+    processadas = 0
+    while nomes := _pendentes(diretorio):
+        for nome in nomes:
+            reservado = os.path.join(diretorio, EM_ANDAMENTO, f'{nome}.{identificador}')
+            try:
+                os.rename(os.path.join(diretorio, PENDENTES, nome), reservado)
+                os.utime(reservado)  # Início da reserva
+            except FileNotFoundError:
+                continue  # Outro trabalhador reservou antes
+
+            parar = threading.Event()
+            renovacao = threading.Thread(target=_renovar_reserva, args=(reservado, parar, duracao_reserva / 4),
+                                         daemon=True)
+            renovacao.start()
+            try:
+                processar_shard(reservado, resultados, nome)
+            except FileNotFoundError:
+                if os.path.exists(reservado):
+                    raise
+                break  # Reserva expirada antes da leitura: a partição está de volta à fila
+            finally:
+                parar.set()
+                renovacao.join()
+
+            try:
+                os.replace(reservado, os.path.join(diretorio, CONCLUIDOS, nome))
+            except FileNotFoundError:
+                # Expirou e voltou à fila: conclui se ainda ninguém a reservou
+                try:
+                    os.replace(os.path.join(diretorio, PENDENTES, nome), os.path.join(diretorio, CONCLUIDOS, nome))
+                except FileNotFoundError:
+                    pass
+            processadas += 1
+            break
+    return processadas
+
+
+# Inicia `processos` trabalhadores locais e espera até todas as partições
+# estarem concluídas, inclusive as reservadas por trabalhadores de outros nós.
+# Reservas expiradas voltam à fila e são processadas pelo próprio
+# coordenador; depois de `prazo` segundos, desiste com TimeoutError
+def processar_com_fila(diretorio=DIRETORIO_TRABALHO, processos=None, duracao_reserva=DURACAO_RESERVA,
+                       prazo=PRAZO_FILA):
+    limite = time.monotonic() + prazo
+    reservadas = os.listdir(os.path.join(diretorio, EM_ANDAMENTO))
+    nomes = set(_pendentes(diretorio)) | {r[:r.index('.parquet.') + len('.parquet')] for r in reservadas}
+    locais = [Process(target=trabalhador, args=(diretorio, duracao_reserva))
+              for _ in range(processos or os.cpu_count())]
+    for p in locais:
+        p.start()
+    for p in locais:
+        p.join(max(0.0, limite - time.monotonic()))
+        if p.is_alive():
+            for q in locais:
+                q.terminate()
+            raise TimeoutError(f'Trabalhadores locais não terminaram em {prazo:.0f}s')
+        if p.exitcode != 0:
+            raise RuntimeError(f'Trabalhador {p.pid} terminou com código {p.exitcode}')
+
+    concluidos = os.path.join(diretorio, CONCLUIDOS)
+    while faltando := nomes - set(os.listdir(concluidos)):
+        if time.monotonic() > limite:
+            raise TimeoutError(f'{len(faltando)} partições não concluídas em {prazo:.0f}s: {sorted(faltando)}')
+        devolvidas = recuperar_reservas_expiradas(diretorio, duracao_reserva)
+        if devolvidas:
+            print(f"Reservas expiradas devolvidas à fila: {', '.join(devolvidas)}")
+        if _pendentes(diretorio):
+            trabalhador(diretorio, duracao_reserva)
+        else:
+            time.sleep(INTERVALO_ESPERA)
+
+
+# Une os resultados das partições: métricas na ordem original das linhas
+# e agregados de impacto somados por (material, unidade)
+def consolidar(diretorio=DIRETORIO_TRABALHO):
+    pasta = os.path.join(diretorio, RESULTADOS)
+    nomes = sorted(n.removesuffix('.grupos.pkl') for n in os.listdir(pasta) if n.endswith('.grupos.pkl'))
+
+    metricas = pd.concat([pd.read_parquet(os.path.join(pasta, f'{n}.metricas.parquet')) for n in nomes],
+                         ignore_index=True)
+    metricas = metricas.sort_values(COLUNA_ORDEM, kind='stable').drop(columns=COLUNA_ORDEM)
+    metricas = aplicar_esquema(metricas.reset_index(drop=True))
+    # Cada partição decidiu o tipo da quantidade só com as suas linhas
+    metricas['quantidade'] = tipar_quantidade(metricas['quantidade'])
+
+    grupos = pd.concat([pd.read_pickle(os.path.join(pasta, f'{n}.grupos.pkl')) for n in nomes])
+    aditivas = grupos.columns.drop('qtd_media')
+    # Os grupos não se repetem entre partições; a soma só une os índices
+    grupos = aplicar_esquema(grupos[aditivas].reset_index())
+    grupos = grupos.groupby(['material', 'unidade'], observed=True, sort=True).sum()
+    grupos['qtd_media'] = grupos['qtd_total'] / grupos['n_registros']
+    return metricas, grupos
+
+
+def executar(entrada=CAMINHO_DADOS, diretorio=DIRETORIO_TRABALHO, modo='unidade', n_shards=NUMERO_SHARDS,
+             execucao='pool', processos=None, duracao_reserva=DURACAO_RESERVA, prazo=PRAZO_FILA):
+    with medir('particionamento') as m:
+        m['linhas'] = particionar(entrada, diretorio, modo, n_shards)
+    with medir('processamento', m['linhas']):
+        if execucao == 'fila':
+            processar_com_fila(diretorio, processos, duracao_reserva, prazo)
+        else:
+            processar_com_pool(diretorio, processos)
+    with medir('consolidacao', m['linhas']):
+        return consolidar(diretorio)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Detecção e impacto financeiro particionados por unidade')
+    parser.add_argument('--entrada', default=CAMINHO_DADOS)
+    parser.add_argument('--saida', default=CAMINHO_METRICAS)
+    parser.add_argument('--diretorio', default=DIRETORIO_TRABALHO, help='Diretório das partições e da fila')
+    parser.add_argument('--particao', choices=MODOS_PARTICAO, default='unidade',
+                        help="Por unidade ou por hash de unidade+material")
+    parser.add_argument('--shards', type=int, default=NUMERO_SHARDS, help="Número de partições no modo 'hash'")
+    parser.add_argument('--execucao', choices=['pool', 'fila'], default='pool')
+    parser.add_argument('--processos', type=int, default=None, help='Processos locais (padrão: número de CPUs)')
+    parser.add_argument('--trabalhador', metavar='DIRETORIO',
+                        help='Só processa partições da fila em DIRETORIO (para rodar em outros nós)')
+    parser.add_argument('--reserva', type=float, default=DURACAO_RESERVA,
+                        help='Segundos sem renovação até a reserva de uma partição voltar à fila')
+    parser.add_argument('--prazo', type=float, default=PRAZO_FILA, help='Prazo total do modo fila, em segundos')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    if args.trabalhador:
+        print(f"{trabalhador(args.trabalhador, args.reserva)} partições processadas")
+        raise SystemExit
+
+    configurar_por_argumentos(args)
+    df_metrics, grupos = executar(args.entrada, args.diretorio, args.particao, args.shards,
+                                  args.execucao, args.processos, args.reserva, args.prazo)
+    with medir('gravacao', len(df_metrics)):
+        salvar(df_metrics, args.saida)
+    impacto = consolidar_impacto(grupos)
+    escrever_relatorio(impacto)
+
+    print(f"Outliers detectados por Z-score: {int(df_metrics['outlier_zscore'].sum())}")
+    print(f"Outliers detectados por IQR: {int(df_metrics['outlier_iqr'].sum())}")
+    print(f"Impacto financeiro total: R$ {impacto['impacto_financeiro_total']:,.2f}")
+    print(f"\nMétricas de variação salvas em '{args.saida}'")
+    finalizar_por_argumentos(args)
@@ -0,0 +1,202 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cache_artefatos import versao_codigo
+
+# Renderização dos gráficos PNG a partir de tabelas já agregadas.
+# Cada gráfico é descrito por uma especificação (dict) com o tipo, os dados
+# agregados, o caminho de saída e as opções de título/rótulos. As
+# especificações são renderizadas em um pool de processos com backend Agg;
+# cada processo reaproveita uma única figura, limpa entre um gráfico e outro.
+
+PROCESSOS_PADRAO = min(4, os.cpu_count() or 1)
+GRAFICOS_POR_PROCESSO = 50  # Processos são reciclados para limitar o pico de memória
+
+_figura = None
+
+
+def _configurar_matplotlib():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    plt.style.use('ggplot')
+    sns.set(style="whitegrid")
+    plt.rcParams['font.size'] = 12
+
+
+def _obter_figura(tamanho):
+    global _figura
+    import matplotlib.pyplot as plt
+
+    if _figura is None:
+        _figura = plt.figure()
+    _figura.clf()
+    _figura.set_size_inches(*tamanho)
+    return _figura
+
+
+def _rotulos(ax, opcoes):
+    ax.set_title(opcoes.get('titulo', ''))
+    ax.set_xlabel(opcoes.get('rotulo_x', ax.get_xlabel()))
+    ax.set_ylabel(opcoes.get('rotulo_y', ax.get_ylabel()))
+    if 'rotacao_x' in opcoes:
+        ax.tick_params(axis='x', rotation=opcoes['rotacao_x'])
+
+
+def _barras(ax, dados, opcoes):
+    import seaborn as sns
+
+    x, y = opcoes['x'], opcoes['y']
+    # Categorias sem uso deslocariam as barras quando x também é o hue
+    dados = dados.assign(**{x: dados[x].astype(str)})
+    if 'hue' in opcoes:
+        hue = opcoes['hue']
+        sns.barplot(x=x, y=y, data=dados.assign(**{hue: dados[hue].astype(str)}), hue=hue,
+                    hue_order=opcoes.get('ordem_hue'), palette=opcoes.get('paleta'), ax=ax)
+        ax.legend(title=opcoes.get('titulo_hue', hue))
+    elif 'paleta' in opcoes:
+        sns.barplot(x=x, y=y, data=dados, hue=x, palette=opcoes['paleta'], legend=False, ax=ax)
+    else:
+        sns.barplot(x=x, y=y, data=dados, ax=ax)
+
+
+def _caixas(ax, dados, opcoes):
+    ax.bxp(dados, showfliers=True)
+
+
+# Pontos (x, y); os marcados na coluna `destaque` ficam em vermelho
+def _dispersao(ax, dados, opcoes):
+    x, y = opcoes['x'], opcoes['y']
+    destaque = dados[opcoes['destaque']].to_numpy(dtype=bool) if 'destaque' in opcoes else np.zeros(len(dados), bool)
+    comuns = dados[~destaque]
+    ax.scatter(comuns[x], comuns[y], alpha=0.5, s=12)
+    ax.scatter(dados.loc[destaque, x], dados.loc[destaque, y], color='red', s=20)
+
+
+# Tabela (linhas x colunas) de valores anotados; células sem valor ficam em branco
+def _mapa_calor(ax, dados, opcoes):
+    import seaborn as sns
+
+    sns.heatmap(dados, annot=True, fmt=opcoes.get('formato', 'g'), cmap=opcoes.get('paleta', 'YlOrRd'), ax=ax)
+
+
+# Mensagem no lugar de um gráfico sem dados
+def _texto(ax, dados, opcoes):
+    ax.axis('off')
+    ax.text(0.5, 0.5, dados, ha='center', va='center', fontsize=14, transform=ax.transAxes)
+
+
+def _pizza(ax, dados, opcoes):
+    ax.pie(dados['valores'], explode=dados.get('explode'), labels=dados['rotulos'], colors=dados.get('cores'),
+           autopct='%1.1f%%', startangle=90)
+    ax.axis('equal')
+
+
+def _tabela(ax, dados, opcoes):
+    ax.axis('off')
+    tabela = ax.table(cellText=dados.values, colLabels=dados.columns, loc='center', cellLoc='center')
+    tabela.auto_set_font_size(False)
+    tabela.set_fontsize(10)
+    tabela.scale(1, 1.5)
+    ax.set_title(opcoes.get('titulo', ''), pad=20)
+
+
+DESENHOS = {
+    'barras': _barras,
+    'caixas': _caixas,
+    'pizza': _pizza,
+    'tabela': _tabela,
+    'dispersao': _dispersao,
+    'mapa_calor': _mapa_calor,
+    'texto': _texto,
+}
+
+
+# Desenha uma especificação em disco e devolve o caminho gerado.
+# Especificações do tipo 'painel' contêm uma grade de subgráficos em 'paineis'
+def renderizar(especificacao):
+    fig = _obter_figura(especificacao.get('tamanho', (10, 6)))
+
+    if especificacao['tipo'] == 'painel':
+        linhas, colunas = especificacao['grade']
+        for posicao, painel in enumerate(especificacao['paineis']):
+            ax = fig.add_subplot(linhas, colunas, posicao + 1)
+            DESENHOS[painel['tipo']](ax, painel['dados'], painel.get('opcoes', {}))
+            if painel['tipo'] not in ('tabela', 'texto'):
+                _rotulos(ax, painel.get('opcoes', {}))
+    else:
+        ax = fig.add_subplot(1, 1, 1)
+        opcoes = especificacao.get('opcoes', {})
+        DESENHOS[especificacao['tipo']](ax, especificacao['dados'], opcoes)
+        _rotulos(ax, opcoes)
+
+    if especificacao.get('ajustar', True):
+        fig.tight_layout()
+    fig.savefig(especificacao['caminho'])
+    fig.clf()
+    return especificacao['caminho']
+
+
+# Renderiza as especificações e devolve os caminhos gerados. Com um
+# CacheArtefatos, gráficos cujos dados, opções e código de desenho não
+# mudaram são copiados do cache em vez de redesenhados
+def renderizar_graficos(especificacoes, processos=PROCESSOS_PADRAO, cache=None):
+    especificacoes = list(especificacoes)
+    pendentes = especificacoes
+    if cache is not None:
+        versao = versao_codigo(renderizar)
+        chaves = [cache.chave('grafico', versao, {k: v for k, v in e.items() if k != 'caminho'})
+                  for e in especificacoes]
+        pendentes = [e for e, chave in zip(especificacoes, chaves) if not cache.obter_arquivo(chave, e['caminho'])]
+
+    if processos <= 1 or len(pendentes) <= 1:
+        _configurar_matplotlib()
+        for e in pendentes:
+            renderizar(e)
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(processos, len(pendentes)),
+            initializer=_configurar_matplotlib,
+            max_tasks_per_child=GRAFICOS_POR_PROCESSO
+        ) as executor:
+            list(executor.map(renderizar, pendentes))
+
+    if cache is not None:
+        for e, chave in zip(especificacoes, chaves):
+            if any(e is p for p in pendentes):
+                cache.salvar_arquivo(chave, e['caminho'])
+    return [e['caminho'] for e in especificacoes]
+
+
+# Estatísticas de boxplot (formato de Axes.bxp) por grupo, calculadas uma vez
+# sobre os dados brutos; os outliers exibidos são limitados a uma amostra
+def estatisticas_caixa(df, coluna_grupo, coluna_valor, max_outliers=200):
+    estatisticas = []
+    for grupo, valores in df.groupby(coluna_grupo, observed=True)[coluna_valor]:
+        valores = valores.dropna().to_numpy(dtype='float64')
+        q1, mediana, q3 = np.percentile(valores, [25, 50, 75])
+        estatisticas.append(caixa_de_quartis(grupo, q1, mediana, q3, valores.min(), valores.max(),
+                                             valores, max_outliers))
+    return estatisticas
+
+
+def caixa_de_quartis(rotulo, q1, mediana, q3, minimo, maximo, amostra=None, max_outliers=200):
+    iqr = q3 - q1
+    bigode_inferior = max(minimo, q1 - 1.5 * iqr)
+    bigode_superior = min(maximo, q3 + 1.5 * iqr)
+    outliers = np.empty(0)
+    if amostra is not None:
+        outliers = amostra[(amostra < bigode_inferior) | (amostra > bigode_superior)][:max_outliers]
+    return {
+        'label': rotulo, 'med': mediana, 'q1': q1, 'q3': q3,
+        'whislo': bigode_inferior, 'whishi': bigode_superior, 'fliers': outliers,
+    }
+
+
+def tabela_contagem(contagens, coluna):
+    return pd.DataFrame({coluna: [str(c) for c in contagens.index], 'count': contagens.to_numpy()})
@@ -0,0 +1,249 @@
+import argparse
+import asyncio
+import io
+import json
+import signal
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from analise_exploratoria import mascara_inconsistencias
+from deteccao_duplicatas import COLUNAS_REGISTRO
+from esquema import TIPOS_CSV, aplicar_esquema
+from estatisticas_incrementais import CAMINHO_ESTATISTICAS, EstatisticasPorGrupo
+
+# Serviço de alertas em tempo real. Recebe movimentações uma por linha (CSV
+# sem cabeçalho, na ordem de COLUNAS_REGISTRO, ou JSON) pela entrada padrão,
+# por um arquivo acompanhado como `tail -f` ou por um socket TCP local.
+#
+# As linhas lidas vão para uma fila limitada: quando a pontuação não
+# acompanha a entrada, os leitores param de ler (e o TCP segura o remetente),
+# em vez de acumular memória. O consumidor agrupa as linhas em micro-lotes
+# (até TAMANHO_LOTE linhas ou ESPERA_LOTE segundos) e os processa de uma vez
+# com as mesmas regras do lote: inconsistências de sinal, falta de
+# responsável e Z-score/IQR contra as estatísticas do (material, unidade),
+# que são atualizadas a cada lote. Só Alerta/Crítico e inconsistências são
+# emitidos, como linhas JSON. Linhas com data ou quantidade ilegíveis viram
+# eventos 'invalido' (com os valores como chegaram) e não são pontuadas.
+
+TAMANHO_LEITURA = 64 * 1024  # Bytes lidos de uma vez da origem
+TAMANHO_FILA = 64  # Blocos de linhas aguardando processamento antes de segurar os leitores
+TAMANHO_LOTE = 5_000
+ESPERA_LOTE = 0.005  # Segundos de espera máxima para completar um lote
+INTERVALO_TAIL = 0.1  # Segundos entre tentativas de leitura do arquivo acompanhado
+INTERVALO_PERSISTENCIA = 60  # Segundos entre gravações do estado
+
+SEVERIDADES_ALERTA = ['Alerta', 'Crítico']
+COLUNAS_EVENTO = ['data', 'unidade', 'material', 'tipo', 'quantidade', 'responsavel',
+                  'media_grupo', 'z_score', 'severidade']
+
+_FIM = None  # Marca de fim da entrada na fila
+
+
+# Lê blocos de bytes de `ler_bloco` (corrotina que devolve b'' no fim) e
+# coloca na fila as linhas completas de cada bloco, como uma lista. A fila
+# é de blocos e não de linhas para que o custo por linha fique fora do
+# laço de eventos
+async def _ler_blocos(ler_bloco, fila):
+    pendente = b''
+    while bloco := await ler_bloco():
+        *linhas, pendente = (pendente + bloco).split(b'\n')
+        if linhas:
+            await fila.put([linha.decode().rstrip('\r') for linha in linhas])
+    if pendente:
+        await fila.put([pendente.decode().rstrip('\r')])
+
+
+async def ler_stdin(fila):
+    # A leitura bloqueante roda em uma thread: funciona com pipes e com arquivos redirecionados
+    await _ler_blocos(lambda: asyncio.to_thread(sys.stdin.buffer.read1, TAMANHO_LEITURA), fila)
+    await fila.put(_FIM)
+
+
+# Acompanha o arquivo como `tail -f`; por padrão começa do fim.
+# Uma linha ainda sendo escrita fica pendente até chegar o '\n'
+async def ler_arquivo(caminho, fila, desde_inicio=False):
+    with open(caminho, 'rb') as f:
+        if not desde_inicio:
+            f.seek(0, io.SEEK_END)
+
+        async def ler_bloco():
+            while not (bloco := f.read(TAMANHO_LEITURA)):
+                await asyncio.sleep(INTERVALO_TAIL)
+            return bloco
+
+        await _ler_blocos(ler_bloco, fila)
+
+
+async def servir_tcp(fila, host, porta):
+    async def atender(leitor, escritor):
+        try:
+            await _ler_blocos(lambda: leitor.read(TAMANHO_LEITURA), fila)
+        finally:
+            escritor.close()
+
+    servidor = await asyncio.start_server(atender, host, porta)
+    async with servidor:
+        await servidor.serve_forever()
+
+
+# Preenchido e não só espaços
+def _preenchido(serie):
+    return serie.notna() & (serie.astype(str).str.strip() != '')
+
+
+# Registros legíveis do lote e, à parte, as linhas com data ou quantidade
+# preenchidas mas ilegíveis. Data e quantidade são lidas como texto e só
+# então convertidas, para uma linha ruim não derrubar o lote
+def interpretar_lote(linhas, formato='csv'):
+    if formato == 'json':
+        registros = []
+        for linha in linhas:
+            try:
+                registros.append(json.loads(linha))
+            except ValueError:
+                pass
+        df = pd.DataFrame.from_records(registros, columns=COLUNAS_REGISTRO)
+    else:
+        df = pd.read_csv(io.StringIO('\n'.join(linhas)), names=COLUNAS_REGISTRO, header=None,
+                         dtype={**TIPOS_CSV, 'data': str, 'quantidade': str}, on_bad_lines='skip')
+    data = pd.to_datetime(df['data'], errors='coerce')
+    quantidade = pd.to_numeric(df['quantidade'], errors='coerce')
+    invalido = (data.isna() & _preenchido(df['data'])) | (quantidade.isna() & _preenchido(df['quantidade']))
+
+    invalidos = df[invalido]
+    df = df[~invalido].assign(data=data[~invalido], quantidade=quantidade[~invalido])
+    return aplicar_esquema(df), invalidos
+
+
+# Eventos do lote: anomalias Alerta/Crítico e inconsistências de cadastro.
+# O lote é pontuado contra o estado anterior e depois incorporado a ele
+def avaliar_lote(df, estado):
+    metricas = estado.pontuar_e_atualizar(df)
+
+    sinal = mascara_inconsistencias(df).to_numpy()
+    sem_responsavel = df['responsavel'].isna().to_numpy()
+    anomalia = metricas['severidade'].isin(SEVERIDADES_ALERTA).to_numpy()
+
+    motivo = np.select([anomalia, sinal, sem_responsavel], ['anomalia', 'sinal_invertido', 'sem_responsavel'], '')
+    emitir = motivo != ''
+    eventos = metricas.loc[emitir, COLUNAS_EVENTO]
+    eventos.insert(0, 'evento', motivo[emitir])
+    return eventos
+
+
+# Interpretação e pontuação de um lote de linhas; devolve os eventos
+# (inclusive os de linhas inválidas) e o número de registros lidos
+def processar_lote(linhas, estado, formato='csv'):
+    df, invalidos = interpretar_lote(linhas, formato)
+    eventos = avaliar_lote(df, estado)
+    if len(invalidos) > 0:
+        invalidos = invalidos[COLUNAS_REGISTRO].astype(object)
+        invalidos.insert(0, 'evento', 'invalido')
+        eventos = pd.concat([eventos.astype(object), invalidos], ignore_index=True)
+    return eventos, len(df) + len(invalidos)
+
+
+# Espera o primeiro bloco e junta os que chegarem em seguida, até
+# TAMANHO_LOTE linhas ou ESPERA_LOTE segundos
+async def _proximo_lote(fila):
+    blocos = [await fila.get()]
+    linhas = len(blocos[0] or [])
+    prazo = time.monotonic() + ESPERA_LOTE
+    while linhas < TAMANHO_LOTE and blocos[-1] is not _FIM:
+        if fila.empty():
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                blocos.append(await asyncio.wait_for(fila.get(), restante))
+            except asyncio.TimeoutError:
+                break
+        else:
+            blocos.append(fila.get_nowait())
+        linhas += len(blocos[-1] or [])
+    return blocos
+
+
+async def consumir(fila, estado, saida, formato='csv', caminho_estatisticas=None):
+    processados = 0
+    ultima_persistencia = time.monotonic()
+    fim = False
+    while not fim:
+        blocos = await _proximo_lote(fila)
+        fim = blocos[-1] is _FIM
+        linhas = [linha for bloco in blocos if bloco is not _FIM for linha in bloco if linha]
+        if not linhas:
+            continue
+
+        # A interpretação e a pontuação rodam fora do laço de eventos, para os
+        # leitores continuarem enchendo a fila
+        eventos, registros = await asyncio.to_thread(processar_lote, linhas, estado, formato)
+        if len(eventos) > 0:
+            saida.write(eventos.to_json(orient='records', lines=True, date_format='iso', force_ascii=False))
+            saida.flush()
+        processados += registros
+
+        if caminho_estatisticas and time.monotonic() - ultima_persistencia > INTERVALO_PERSISTENCIA:
+            estado.salvar(caminho_estatisticas)
+            ultima_persistencia = time.monotonic()
+    return processados
+
+
+async def executar(args):
+    fila = asyncio.Queue(maxsize=TAMANHO_FILA)
+    estado = EstatisticasPorGrupo.carregar(args.estatisticas)
+    saida = open(args.saida, 'a') if args.saida else sys.stdout
+
+    if args.porta is not None:
+        leitor = asyncio.create_task(servir_tcp(fila, args.host, args.porta))
+    elif args.arquivo:
+        leitor = asyncio.create_task(ler_arquivo(args.arquivo, fila, args.desde_inicio))
+    else:
+        leitor = asyncio.create_task(ler_stdin(fila))
+
+    # SIGTERM para a leitura e deixa o consumidor esvaziar a fila antes de sair
+    def encerrar():
+        leitor.cancel()
+        asyncio.ensure_future(fila.put(_FIM))
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, encerrar)
+
+    inicio = time.perf_counter()
+    consumidor = asyncio.create_task(consumir(fila, estado, saida, args.formato, args.estatisticas))
+    try:
+        # Uma falha na origem (porta em uso, arquivo inexistente) encerra o serviço
+        await asyncio.wait({leitor, consumidor}, return_when=asyncio.FIRST_COMPLETED)
+        if leitor.done() and not leitor.cancelled() and leitor.exception() is not None:
+            leitor.result()
+        processados = await consumidor
+    finally:
+        leitor.cancel()
+        consumidor.cancel()
+        estado.salvar(args.estatisticas)
+        if saida is not sys.stdout:
+            saida.close()
+
+    duracao = time.perf_counter() - inicio
+    print(f"{processados} registros processados em {duracao:.2f}s "
+          f"({processados / max(duracao, 1e-9):.0f} registros/s)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serviço de alertas em tempo real sobre as movimentações')
+    origem = parser.add_mutually_exclusive_group()
+    origem.add_argument('--arquivo', help='Acompanha o arquivo (tail -f) em vez de ler a entrada padrão')
+    origem.add_argument('--porta', type=int, help='Recebe as movimentações por TCP nesta porta')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--desde-inicio', action='store_true',
+                        help='Com --arquivo, processa também o conteúdo já existente')
+    parser.add_argument('--formato', choices=['csv', 'json'], default='csv')
+    parser.add_argument('--estatisticas', default=CAMINHO_ESTATISTICAS)
+    parser.add_argument('--saida', default=None, help='Arquivo onde os eventos são anexados (padrão: saída padrão)')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(executar(args))
+    except KeyboardInterrupt:
+        pass
@@ -1,17 +1,17 @@
+import argparse
+
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import matplotlib.gridspec as gridspec
 
-# Configurações de visualização
-plt.style.use('ggplot')
-sns.set(style="whitegrid")
-plt.rcParams['figure.figsize'] = (12, 8)
-plt.rcParams['font.size'] = 12
+from armazenamento import carregar
+from cache_artefatos import CacheArtefatos
+from deteccao_duplicatas import COLUNAS_REGISTRO, marcar_duplicatas
+from instrumentacao import adicionar_argumentos, configurar_por_argumentos, finalizar_por_argumentos, medir
+from precos import TabelaPrecos, precos_por_linha
+from renderizacao import renderizar_graficos
 
-# Carregar os dados de métricas
-df_metrics = pd.read_csv('./metricas_variacao.csv')
-df_metrics['data'] = pd.to_datetime(df_metrics['data'])
+CAMINHO_METRICAS = './metricas_variacao.csv'
+CAMINHO_RELATORIO = './projeto_anomalias_consumo_2/impacto_financeiro.txt'
 
 # Definir preços fictícios para cada material (adaptados para materiais hospitalares)
 precos_materiais = {
@@ -22,197 +22,290 @@ precos_materiais = {
     'Gaze': 3.5           # R$ por pacote
 }
 
-# Adicionar coluna de valor financeiro
-df_metrics['valor_unitario'] = df_metrics['material'].map(precos_materiais)
-df_metrics['valor_total'] = df_metrics['quantidade'].abs() * df_metrics['valor_unitario']
-
-# Calcular impacto financeiro das anomalias
-# Consideramos que anomalias podem representar:
-# 1. Registros incorretos (quantidade errada)
-# 2. Registros ausentes (material não registrado)
-# 3. Registros duplicados
-
-# Filtrar registros anômalos (severidade Alerta ou Crítico)
-anomalias = df_metrics[df_metrics['severidade'].isin(['Alerta', 'Crítico'])]
-
-# Calcular o impacto financeiro por tipo de anomalia
-# 1. Impacto por registro incorreto: diferença entre valor registrado e valor esperado
-anomalias['impacto_registro_incorreto'] = anomalias['valor_total'] * (anomalias['z_score'] - 1) / anomalias['z_score']
-
-# 2. Impacto por possível registro ausente: estimativa baseada na média de consumo
-impacto_ausente = {}
-for material in df_metrics['material'].unique():
-    for unidade in df_metrics['unidade'].unique():
-        subset = df_metrics[(df_metrics['material'] == material) & (df_metrics['unidade'] == unidade)]
-        if len(subset) > 0:
-            # Estimar número de registros ausentes com base em padrões temporais
-            # Simplificação: assumimos que 10% dos registros anômalos indicam registros ausentes
-            n_ausentes = len(subset[subset['severidade'].isin(['Alerta', 'Crítico'])]) * 0.1
-            valor_medio = subset['valor_total'].mean()
-            impacto_ausente[(material, unidade)] = n_ausentes * valor_medio
-
-# 3. Impacto por possível registro duplicado: estimativa baseada em registros muito próximos
-# Simplificação: assumimos que 5% dos registros anômalos são duplicações
-anomalias['impacto_duplicacao'] = anomalias['valor_total'] * 0.05
-
-# Consolidar impacto financeiro total
-impacto_total_incorreto = anomalias['impacto_registro_incorreto'].sum()
-impacto_total_ausente = sum(impacto_ausente.values())
-impacto_total_duplicacao = anomalias['impacto_duplicacao'].sum()
-impacto_financeiro_total = impacto_total_incorreto + impacto_total_ausente + impacto_total_duplicacao
-
-# Criar dataframe com resumo do impacto financeiro
-impacto_resumo = pd.DataFrame({
-    'Tipo de Impacto': ['Registros Incorretos', 'Registros Ausentes', 'Registros Duplicados', 'Total'],
-    'Valor (R$)': [
-        impacto_total_incorreto, 
-        impacto_total_ausente, 
-        impacto_total_duplicacao,
-        impacto_financeiro_total
+# Registros anômalos são os de severidade Alerta ou Crítico
+SEVERIDADES_ANOMALIA = ['Alerta', 'Crítico']
+
+# Simplificações do modelo de impacto:
+# assumimos que 10% dos registros anômalos indicam registros ausentes
+# e que 5% dos registros anômalos são duplicações
+TAXA_AUSENTES = 0.1
+TAXA_DUPLICACAO = 0.05
+
+# Estimativa de custos indiretos (R$)
+CUSTOS_INDIRETOS = {
+    'Custo de mão de obra para correção de registros': 3500.00,
+    'Custo de atrasos em procedimentos devido a falta de materiais': 12000.00,
+    'Custo de compras emergenciais com preços premium': 6500.00,
+}
+
+
+# Medidas de impacto de cada registro. Todas são aditivas: somadas por
+# qualquer agrupamento (grupo, dia, unidade...) dão os agregados do modelo
+def medidas_impacto(df_metrics):
+    quantidade = df_metrics['quantidade'].astype('float64').abs()
+    anomalia = df_metrics['severidade'].isin(SEVERIDADES_ANOMALIA).to_numpy()
+    z_score = df_metrics['z_score'].astype('float64').to_numpy()
+
+    # Registro incorreto: diferença entre valor registrado e valor esperado
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fator_incorreto = np.where(anomalia, (z_score - 1) / z_score, 0.0)
+
+    medidas = pd.DataFrame({
+        'n_registros': quantidade.notna(),
+        'n_anomalias': anomalia,
+        'qtd_total': quantidade,
+        'qtd_anomalias': quantidade.where(anomalia, 0.0),
+        'qtd_incorreta': quantidade * fator_incorreto,
+    }, index=df_metrics.index)
+    # Duplicatas confirmadas (ver deteccao_duplicatas.py) substituem a estimativa de 5%
+    if 'duplicata' in df_metrics.columns:
+        medidas['qtd_duplicada'] = quantidade.where(df_metrics['duplicata'].to_numpy(dtype=bool), 0.0)
+    return medidas
+
+
+# Agregados de quantidade por (material, unidade), em uma única passada agrupada.
+# O impacto de cada tipo de falha é linear no preço do material, então
+# esses agregados bastam para valorar qualquer tabela de preços. Com
+# `por_dia`, os agregados ficam por (material, unidade, dia), para valorar
+# com preços que mudam ao longo do tempo (ver precos.py)
+def agregar_por_grupo(df_metrics, por_dia=False):
+    colunas = medidas_impacto(df_metrics)
+    colunas.insert(0, 'material', df_metrics['material'])
+    colunas.insert(1, 'unidade', df_metrics['unidade'])
+    if por_dia:
+        colunas.insert(2, 'dia', df_metrics['data'].dt.normalize())
+        # Registros sem data continuam no total (dia nulo); sem grupo, não
+        colunas = colunas[colunas['material'].notna() & colunas['unidade'].notna()]
+        grupos = colunas.groupby(['material', 'unidade', 'dia'], observed=True, dropna=False, sort=True).sum()
+    else:
+        grupos = colunas.groupby(['material', 'unidade'], observed=True, sort=True).sum()
+    grupos['qtd_media'] = media_por_grupo(grupos)
+    grupos['n_anomalias'] = grupos['n_anomalias'].astype('int64')
+    return grupos
+
+
+# Quantidade média por registro de cada (material, unidade), repetida em
+# cada dia quando os agregados são diários
+def media_por_grupo(grupos):
+    if 'dia' not in grupos.index.names:
+        return grupos['qtd_total'] / grupos['n_registros']
+    por_grupo = grupos.groupby(level=['material', 'unidade'], observed=True)
+    return por_grupo['qtd_total'].transform('sum') / por_grupo['n_registros'].transform('sum')
+
+
+# Impacto financeiro por (material, unidade), a partir dos agregados de quantidade.
+# `precos` é um dicionário {material: preço} ou uma TabelaPrecos; esta
+# exige agregados por dia, valorados cada um pelo preço vigente no dia
+def valorar_grupos(grupos, precos=precos_materiais, taxa_ausentes=TAXA_AUSENTES,
+                   taxa_duplicacao=TAXA_DUPLICACAO):
+    indice = grupos.index
+    por_dia = 'dia' in indice.names
+    if isinstance(precos, TabelaPrecos) and not por_dia:
+        raise ValueError("Preços com vigência exigem agregados por dia (agregar_por_grupo(..., por_dia=True))")
+    preco = precos_por_linha(precos, indice.get_level_values('material'), indice.get_level_values('unidade'),
+                             indice.get_level_values('dia') if por_dia else None)
+
+    impacto = pd.DataFrame(index=grupos.index)
+    impacto['n_anomalias'] = grupos['n_anomalias']
+    impacto['valor_total'] = grupos['qtd_total'] * preco
+    impacto['impacto_registro_incorreto'] = grupos['qtd_incorreta'] * preco
+    # Registros ausentes: estimativa baseada na média de consumo do grupo
+    impacto['impacto_ausente'] = grupos['n_anomalias'] * taxa_ausentes * grupos['qtd_media'] * preco
+    # Registros duplicados: valor das duplicatas confirmadas, quando detectadas;
+    # caso contrário, fração do valor dos registros anômalos
+    if 'qtd_duplicada' in grupos.columns:
+        impacto['impacto_duplicacao'] = grupos['qtd_duplicada'] * preco
+    else:
+        impacto['impacto_duplicacao'] = grupos['qtd_anomalias'] * taxa_duplicacao * preco
+    if por_dia:
+        impacto = impacto.groupby(level=['material', 'unidade'], observed=True, sort=True).sum()
+    return impacto
+
+
+def calcular_impacto_financeiro(df_metrics, precos=precos_materiais, taxa_ausentes=TAXA_AUSENTES,
+                                taxa_duplicacao=TAXA_DUPLICACAO):
+    grupos = agregar_por_grupo(df_metrics, por_dia=isinstance(precos, TabelaPrecos))
+    return consolidar_impacto(grupos, precos, taxa_ausentes, taxa_duplicacao)
+
+
+# Tabelas do relatório a partir dos agregados por (material, unidade),
+# venham eles dos registros ou do cubo agregado (ver cubo_agregado.py)
+def consolidar_impacto(grupos, precos=precos_materiais, taxa_ausentes=TAXA_AUSENTES,
+                       taxa_duplicacao=TAXA_DUPLICACAO):
+    por_grupo = valorar_grupos(grupos, precos, taxa_ausentes, taxa_duplicacao)
+
+    # Consolidar impacto financeiro total
+    impacto_total_incorreto = por_grupo['impacto_registro_incorreto'].sum()
+    impacto_total_ausente = por_grupo['impacto_ausente'].sum()
+    impacto_total_duplicacao = por_grupo['impacto_duplicacao'].sum()
+    impacto_financeiro_total = impacto_total_incorreto + impacto_total_ausente + impacto_total_duplicacao
+
+    # Criar dataframe com resumo do impacto financeiro
+    impacto_resumo = pd.DataFrame({
+        'Tipo de Impacto': ['Registros Incorretos', 'Registros Ausentes', 'Registros Duplicados', 'Total'],
+        'Valor (R$)': [
+            impacto_total_incorreto,
+            impacto_total_ausente,
+            impacto_total_duplicacao,
+            impacto_financeiro_total
+        ]
+    })
+
+    # Impacto por material e unidade (apenas grupos com anomalias)
+    com_anomalias = por_grupo[por_grupo['n_anomalias'] > 0]
+    impacto_por_material = com_anomalias.groupby(level='material', observed=True)['impacto_registro_incorreto'].sum().reset_index()
+    impacto_por_material.columns = ['Material', 'Impacto Financeiro (R$)']
+
+    impacto_por_unidade = com_anomalias.groupby(level='unidade', observed=True)['impacto_registro_incorreto'].sum().reset_index()
+    impacto_por_unidade.columns = ['Unidade', 'Impacto Financeiro (R$)']
+
+    # Percentual do impacto em relação ao valor total movimentado
+    valor_total_movimentado = por_grupo['valor_total'].sum()
+
+    return {
+        'por_grupo': por_grupo,
+        'resumo': impacto_resumo,
+        'por_material': impacto_por_material,
+        'por_unidade': impacto_por_unidade,
+        'valor_total_movimentado': valor_total_movimentado,
+        'impacto_financeiro_total': impacto_financeiro_total,
+        'percentual_impacto': (impacto_financeiro_total / valor_total_movimentado) * 100,
+    }
+
+
+def escrever_relatorio(impacto, caminho=CAMINHO_RELATORIO):
+    valor_total_movimentado = impacto['valor_total_movimentado']
+    impacto_financeiro_total = impacto['impacto_financeiro_total']
+
+    with open(caminho, 'w') as f:
+        f.write("SIMULAÇÃO DO IMPACTO FINANCEIRO DAS FALHAS DE REGISTRO - NOVO DATASET\n")
+        f.write("==============================================================\n\n")
+
+        f.write("1. RESUMO DO IMPACTO FINANCEIRO\n")
+        f.write(f"Valor total movimentado: R$ {valor_total_movimentado:.2f}\n")
+        f.write(f"Impacto financeiro total estimado: R$ {impacto_financeiro_total:.2f}\n")
+        f.write(f"Percentual do impacto: {impacto['percentual_impacto']:.2f}%\n\n")
+
+        f.write("2. DETALHAMENTO POR TIPO DE FALHA\n")
+        for idx, row in impacto['resumo'].iterrows():
+            f.write(f"{row['Tipo de Impacto']}: R$ {row['Valor (R$)']:.2f}\n")
+
+        f.write("\n3. IMPACTO POR MATERIAL\n")
+        for idx, row in impacto['por_material'].iterrows():
+            f.write(f"{row['Material']}: R$ {row['Impacto Financeiro (R$)']:.2f}\n")
+
+        f.write("\n4. IMPACTO POR UNIDADE\n")
+        for idx, row in impacto['por_unidade'].iterrows():
+            f.write(f"{row['Unidade']}: R$ {row['Impacto Financeiro (R$)']:.2f}\n")
+
+        f.write("\n5. ANÁLISE DE EFICIÊNCIA DO ESTOQUE\n")
+        f.write("5.1 Impacto na Gestão de Estoque\n")
+        f.write("  - Custos adicionais de armazenamento devido a registros incorretos\n")
+        f.write("  - Custos de oportunidade por capital imobilizado\n")
+        f.write("  - Custos de reposição emergencial devido a falhas de registro\n\n")
+
+        f.write("5.2 Estimativa de Custos Indiretos\n")
+        for descricao, custo in CUSTOS_INDIRETOS.items():
+            valor = f"{custo:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.')
+            f.write(f"  - {descricao}: R$ {valor}\n")
+        f.write("\n")
+
+        f.write("5.3 Impacto Total (Direto + Indireto)\n")
+        impacto_total_com_indiretos = impacto_financeiro_total + sum(CUSTOS_INDIRETOS.values())
+        f.write(f"  - Impacto financeiro total (incluindo custos indiretos): R$ {impacto_total_com_indiretos:.2f}\n")
+        f.write(f"  - Percentual do impacto total: {(impacto_total_com_indiretos / valor_total_movimentado) * 100:.2f}%\n")
+
+
+# Especificações dos gráficos, montadas a partir das tabelas de impacto já agregadas
+def especificacoes_graficos(impacto, diretorio='./projeto_anomalias_consumo_2'):
+    impacto_resumo = impacto['resumo']
+    impacto_financeiro_total = impacto['impacto_financeiro_total']
+    valor_total_movimentado = impacto['valor_total_movimentado']
+
+    por_tipo = {'tipo': 'barras', 'dados': impacto_resumo[:-1],
+                'opcoes': {'x': 'Tipo de Impacto', 'y': 'Valor (R$)', 'paleta': 'YlOrRd',
+                           'rotulo_x': 'Tipo de Falha', 'rotulo_y': 'Valor (R$)'}}
+    por_material = {'tipo': 'barras', 'dados': impacto['por_material'],
+                    'opcoes': {'x': 'Material', 'y': 'Impacto Financeiro (R$)', 'paleta': 'YlOrRd',
+                               'rotulo_x': 'Material', 'rotulo_y': 'Valor (R$)'}}
+    por_unidade = {'tipo': 'barras', 'dados': impacto['por_unidade'],
+                   'opcoes': {'x': 'Unidade', 'y': 'Impacto Financeiro (R$)', 'paleta': 'YlOrRd',
+                              'rotulo_x': 'Unidade', 'rotulo_y': 'Valor (R$)'}}
+
+    def com_opcoes(base, **opcoes):
+        return {**base, 'opcoes': {**base['opcoes'], **opcoes}}
+
+    resumo_arredondado = impacto_resumo.copy()
+    resumo_arredondado['Valor (R$)'] = resumo_arredondado['Valor (R$)'].round(2)
+
+    return [
+        # 1. Gráfico de barras do impacto financeiro por tipo de falha
+        {**com_opcoes(por_tipo, titulo='Impacto Financeiro por Tipo de Falha', rotacao_x=0),
+         'caminho': f'{diretorio}/impacto_por_tipo_falha.png', 'tamanho': (10, 6)},
+        # 2. Gráfico de barras do impacto financeiro por material
+        {**com_opcoes(por_material, titulo='Impacto Financeiro por Material', rotacao_x=45),
+         'caminho': f'{diretorio}/impacto_por_material.png', 'tamanho': (10, 6)},
+        # 3. Gráfico de barras do impacto financeiro por unidade
+        {**com_opcoes(por_unidade, titulo='Impacto Financeiro por Unidade'),
+         'caminho': f'{diretorio}/impacto_por_unidade.png', 'tamanho': (10, 6)},
+        # 4. Gráfico de pizza do percentual de impacto
+        {'tipo': 'pizza', 'caminho': f'{diretorio}/percentual_impacto.png', 'tamanho': (10, 6),
+         'dados': {'valores': [impacto_financeiro_total, valor_total_movimentado - impacto_financeiro_total],
+                   'rotulos': ['Impacto Financeiro', 'Valor Normal'],
+                   'cores': ['#ff9999', '#66b3ff'], 'explode': (0.1, 0)},
+         'opcoes': {'titulo': 'Percentual do Impacto Financeiro em Relação ao Valor Total'}},
+        # 5. Dashboard de impacto financeiro
+        {'tipo': 'painel', 'grade': (2, 2), 'caminho': f'{diretorio}/dashboard_impacto_financeiro.png',
+         'tamanho': (15, 12),
+         'paineis': [
+             com_opcoes(por_tipo, titulo='Impacto por Tipo de Falha', rotacao_x=45),
+             com_opcoes(por_material, titulo='Impacto por Material', rotacao_x=45),
+             com_opcoes(por_unidade, titulo='Impacto por Unidade'),
+             {'tipo': 'tabela', 'dados': resumo_arredondado, 'opcoes': {'titulo': 'Resumo do Impacto Financeiro'}},
+         ]},
     ]
-})
-
-# Calcular impacto por material e unidade
-impacto_por_material = anomalias.groupby('material')['impacto_registro_incorreto'].sum().reset_index()
-impacto_por_material.columns = ['Material', 'Impacto Financeiro (R$)']
-
-impacto_por_unidade = anomalias.groupby('unidade')['impacto_registro_incorreto'].sum().reset_index()
-impacto_por_unidade.columns = ['Unidade', 'Impacto Financeiro (R$)']
-
-# Calcular percentual do impacto em relação ao valor total movimentado
-valor_total_movimentado = df_metrics['valor_total'].sum()
-percentual_impacto = (impacto_financeiro_total / valor_total_movimentado) * 100
-
-# Salvar resultados em arquivo
-with open('./projeto_anomalias_consumo_2/impacto_financeiro.txt', 'w') as f:
-    f.write("SIMULAÇÃO DO IMPACTO FINANCEIRO DAS FALHAS DE REGISTRO - NOVO DATASET\n")
-    f.write("==============================================================\n\n")
-    
-    f.write("1. RESUMO DO IMPACTO FINANCEIRO\n")
-    f.write(f"Valor total movimentado: R$ {valor_total_movimentado:.2f}\n")
-    f.write(f"Impacto financeiro total estimado: R$ {impacto_financeiro_total:.2f}\n")
-    f.write(f"Percentual do impacto: {percentual_impacto:.2f}%\n\n")
-    
-    f.write("2. DETALHAMENTO POR TIPO DE FALHA\n")
-    for idx, row in impacto_resumo.iterrows():
-        f.write(f"{row['Tipo de Impacto']}: R$ {row['Valor (R$)']:.2f}\n")
-    
-    f.write("\n3. IMPACTO POR MATERIAL\n")
-    for idx, row in impacto_por_material.iterrows():
-        f.write(f"{row['Material']}: R$ {row['Impacto Financeiro (R$)']:.2f}\n")
-    
-    f.write("\n4. IMPACTO POR UNIDADE\n")
-    for idx, row in impacto_por_unidade.iterrows():
-        f.write(f"{row['Unidade']}: R$ {row['Impacto Financeiro (R$)']:.2f}\n")
-    
-    f.write("\n5. ANÁLISE DE EFICIÊNCIA DO ESTOQUE\n")
-    f.write("5.1 Impacto na Gestão de Estoque\n")
-    f.write("  - Custos adicionais de armazenamento devido a registros incorretos\n")
-    f.write("  - Custos de oportunidade por capital imobilizado\n")
-    f.write("  - Custos de reposição emergencial devido a falhas de registro\n\n")
-    
-    f.write("5.2 Estimativa de Custos Indiretos\n")
-    f.write("  - Custo de mão de obra para correção de registros: R$ 3.500,00\n")
-    f.write("  - Custo de atrasos em procedimentos devido a falta de materiais: R$ 12.000,00\n")
-    f.write("  - Custo de compras emergenciais com preços premium: R$ 6.500,00\n\n")
-    
-    f.write("5.3 Impacto Total (Direto + Indireto)\n")
-    impacto_total_com_indiretos = impacto_financeiro_total + 22000.00
-    f.write(f"  - Impacto financeiro total (incluindo custos indiretos): R$ {impacto_total_com_indiretos:.2f}\n")
-    f.write(f"  - Percentual do impacto total: {(impacto_total_com_indiretos / valor_total_movimentado) * 100:.2f}%\n")
-
-# Criar visualizações
-# 1. Gráfico de barras do impacto financeiro por tipo de falha
-plt.figure(figsize=(10, 6))
-sns.barplot(x='Tipo de Impacto', y='Valor (R$)', data=impacto_resumo[:-1], palette='YlOrRd')
-plt.title('Impacto Financeiro por Tipo de Falha')
-plt.xlabel('Tipo de Falha')
-plt.ylabel('Valor (R$)')
-plt.xticks(rotation=0)
-plt.tight_layout()
-plt.savefig('./projeto_anomalias_consumo_2/impacto_por_tipo_falha.png')
-
-# 2. Gráfico de barras do impacto financeiro por material
-plt.figure(figsize=(10, 6))
-sns.barplot(x='Material', y='Impacto Financeiro (R$)', data=impacto_por_material, palette='YlOrRd')
-plt.title('Impacto Financeiro por Material')
-plt.xlabel('Material')
-plt.ylabel('Valor (R$)')
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.savefig('./projeto_anomalias_consumo_2/impacto_por_material.png')
-
-# 3. Gráfico de barras do impacto financeiro por unidade
-plt.figure(figsize=(10, 6))
-sns.barplot(x='Unidade', y='Impacto Financeiro (R$)', data=impacto_por_unidade, palette='YlOrRd')
-plt.title('Impacto Financeiro por Unidade')
-plt.xlabel('Unidade')
-plt.ylabel('Valor (R$)')
-plt.tight_layout()
-plt.savefig('./projeto_anomalias_consumo_2/impacto_por_unidade.png')
-
-# 4. Gráfico de pizza do percentual de impacto
-plt.figure(figsize=(10, 6))
-labels = ['Impacto Financeiro', 'Valor Normal']
-sizes = [impacto_financeiro_total, valor_total_movimentado - impacto_financeiro_total]
-colors = ['#ff9999', '#66b3ff']
-explode = (0.1, 0)
-plt.pie(sizes, explode=explode, labels=labels, colors=colors, autopct='%1.1f%%', startangle=90)
-plt.axis('equal')
-plt.title('Percentual do Impacto Financeiro em Relação ao Valor Total')
-plt.tight_layout()
-plt.savefig('./projeto_anomalias_consumo_2/percentual_impacto.png')
-
-# 5. Dashboard de impacto financeiro
-fig = plt.figure(figsize=(15, 12))
-gs = gridspec.GridSpec(2, 2, figure=fig)
-
-# Gráfico 1: Impacto por tipo de falha
-ax1 = fig.add_subplot(gs[0, 0])
-sns.barplot(x='Tipo de Impacto', y='Valor (R$)', data=impacto_resumo[:-1], palette='YlOrRd', ax=ax1)
-ax1.set_title('Impacto por Tipo de Falha')
-ax1.set_xlabel('Tipo de Falha')
-ax1.set_ylabel('Valor (R$)')
-ax1.tick_params(axis='x', rotation=45)
-
-# Gráfico 2: Impacto por material
-ax2 = fig.add_subplot(gs[0, 1])
-sns.barplot(x='Material', y='Impacto Financeiro (R$)', data=impacto_por_material, palette='YlOrRd', ax=ax2)
-ax2.set_title('Impacto por Material')
-ax2.set_xlabel('Material')
-ax2.set_ylabel('Valor (R$)')
-ax2.tick_params(axis='x', rotation=45)
-
-# Gráfico 3: Impacto por unidade
-ax3 = fig.add_subplot(gs[1, 0])
-sns.barplot(x='Unidade', y='Impacto Financeiro (R$)', data=impacto_por_unidade, palette='YlOrRd', ax=ax3)
-ax3.set_title('Impacto por Unidade')
-ax3.set_xlabel('Unidade')
-ax3.set_ylabel('Valor (R$)')
-
-# Gráfico 4: Tabela de resumo
-ax4 = fig.add_subplot(gs[1, 1])
-ax4.axis('off')
-impacto_resumo['Valor (R$)'] = impacto_resumo['Valor (R$)'].round(2)
-table = ax4.table(
-    cellText=impacto_resumo.values,
-    colLabels=impacto_resumo.columns,
-    loc='center',
-    cellLoc='center'
-)
-table.auto_set_font_size(False)
-table.set_fontsize(10)
-table.scale(1, 1.5)
-ax4.set_title('Resumo do Impacto Financeiro', pad=20)
-
-plt.tight_layout()
-plt.savefig('./projeto_anomalias_consumo_2/dashboard_impacto_financeiro.png')
-
-print("Simulação do impacto financeiro concluída com sucesso!")
-print("Arquivos gerados:")
-print("- impacto_financeiro.txt: Relatório detalhado do impacto financeiro")
-print("- impacto_por_tipo_falha.png: Gráfico do impacto por tipo de falha")
-print("- impacto_por_material.png: Gráfico do impacto por material")
-print("- impacto_por_unidade.png: Gráfico do impacto por unidade")
-print("- percentual_impacto.png: Gráfico do percentual de impacto")
-print("- dashboard_impacto_financeiro.png: Dashboard com resumo do impacto financeiro")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulação do impacto financeiro das falhas de registro')
+    parser.add_argument('--entrada', default=CAMINHO_METRICAS)
+    parser.add_argument('--estimar-duplicatas', action='store_true',
+                        help='Usa a estimativa de 5%% dos anômalos em vez das duplicatas detectadas')
+    parser.add_argument('--precos', default=None,
+                        help='Histórico de preços com vigência (ver precos.py); padrão: preços fixos por material')
+    parser.add_argument('--sem-cache', action='store_true', help='Recalcula tudo, ignorando o cache de artefatos')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    configurar_por_argumentos(args)
+    cache = None if args.sem_cache else CacheArtefatos()
+    precos = TabelaPrecos.carregar(args.precos) if args.precos else precos_materiais
+
+    # Carregar os dados de métricas
+    with medir('carga') as m:
+        df_metrics = carregar(args.entrada)
+        m['linhas'] = len(df_metrics)
+    if not args.estimar_duplicatas and set(COLUNAS_REGISTRO) <= set(df_metrics.columns):
+        with medir('duplicatas', len(df_metrics)):
+            df_metrics = marcar_duplicatas(df_metrics)
+        print(f"Duplicatas confirmadas: {int(df_metrics['duplicata'].sum())}")
+
+    with medir('impacto', len(df_metrics)):
+        if cache is not None:
+            # A chave inclui a tabela de preços e as taxas, não só os dados
+            impacto = cache.memoizar('impacto', calcular_impacto_financeiro, df_metrics, precos,
+                                     TAXA_AUSENTES, TAXA_DUPLICACAO)
+        else:
+            impacto = calcular_impacto_financeiro(df_metrics, precos)
+    escrever_relatorio(impacto)
+    with medir('renderizacao'):
+        renderizar_graficos(especificacoes_graficos(impacto), cache=cache)
+
+    print("Simulação do impacto financeiro concluída com sucesso!")
+    print("Arquivos gerados:")
+    print("- impacto_financeiro.txt: Relatório detalhado do impacto financeiro")
+    print("- impacto_por_tipo_falha.png: Gráfico do impacto por tipo de falha")
+    print("- impacto_por_material.png: Gráfico do impacto por material")
+    print("- impacto_por_unidade.png: Gráfico do impacto por unidade")
+    print("- percentual_impacto.png: Gráfico do percentual de impacto")
+    print("- dashboard_impacto_financeiro.png: Dashboard com resumo do impacto financeiro")
+    finalizar_por_argumentos(args)
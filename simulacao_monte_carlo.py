@@ -0,0 +1,195 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from armazenamento import carregar
+from deteccao_duplicatas import COLUNAS_REGISTRO, marcar_duplicatas
+from precos import TabelaPrecos, precos_por_linha
+from simulacao_impacto_financeiro import (
+    CAMINHO_METRICAS, CUSTOS_INDIRETOS, TAXA_AUSENTES, TAXA_DUPLICACAO,
+    agregar_por_grupo, precos_materiais
+)
+
+# Simulação de Monte Carlo do impacto financeiro: em vez de uma estimativa
+# pontual, as taxas de ausência/duplicação, os preços e os custos indiretos
+# são sorteados de distribuições, e o resultado é reportado como faixas de
+# percentis por material e por unidade.
+
+CAMINHO_RELATORIO = './projeto_anomalias_consumo_2/impacto_monte_carlo.txt'
+
+N_ENSAIOS = 10_000
+TAMANHO_LOTE = 1_000  # Ensaios vetorizados por tarefa do pool
+PERCENTIS = [5, 50, 95]
+
+# Concentração das distribuições Beta das taxas (média = taxa do modelo pontual)
+CONCENTRACAO_TAXAS = 100
+# Desvio padrão do log do preço (preço mediano = preço da tabela)
+VARIACAO_PRECO = 0.15
+# Custos indiretos: distribuição triangular entre 50% e 150% do valor estimado
+FAIXA_CUSTOS_INDIRETOS = (0.5, 1.5)
+
+
+# Quantidades do modelo valoradas pelos preços da tabela, por (material,
+# unidade). `precos` é um dicionário {material: preço} ou uma TabelaPrecos;
+# esta exige agregados por dia, cada um valorado pelo preço vigente no dia
+def valorar_quantidades(grupos, precos):
+    indice = grupos.index
+    por_dia = 'dia' in indice.names
+    if isinstance(precos, TabelaPrecos) and not por_dia:
+        raise ValueError("Preços com vigência exigem agregados por dia (agregar_por_grupo(..., por_dia=True))")
+    preco = precos_por_linha(precos, indice.get_level_values('material'), indice.get_level_values('unidade'),
+                             indice.get_level_values('dia') if por_dia else None)
+
+    valores = pd.DataFrame({
+        'incorreto': grupos['qtd_incorreta'].to_numpy() * preco,
+        'ausente': (grupos['n_anomalias'] * grupos['qtd_media']).fillna(0).to_numpy() * preco,
+        'anomalias': grupos['qtd_anomalias'].to_numpy() * preco,
+    }, index=indice)
+    if 'qtd_duplicada' in grupos.columns:
+        valores['duplicado'] = grupos['qtd_duplicada'].to_numpy() * preco
+    if por_dia:
+        valores = valores.groupby(level=['material', 'unidade'], observed=True, sort=True).sum()
+    return valores
+
+
+# Executa um lote de ensaios de uma vez. Com V = valores da tabela de preços
+# por grupo, cada ensaio t calcula I[t, g] = variação_preço[t, material(g)] *
+# (V_incorreto[g] + taxa_ausentes[t] * V_ausente[g] + taxa_duplicacao[t] * V_anomalias[g]),
+# ou com o valor duplicado confirmado no lugar do último termo
+def simular_lote(grupos, precos, n_ensaios, semente):
+    rng = np.random.default_rng(semente)
+
+    valores = valorar_quantidades(grupos, precos)
+    materiais = valores.index.get_level_values('material')
+    unidades = valores.index.get_level_values('unidade')
+    lista_materiais = sorted(set(materiais))
+    lista_unidades = sorted(set(unidades))
+    cod_material = pd.Index(lista_materiais).get_indexer(materiais)
+    cod_unidade = pd.Index(lista_unidades).get_indexer(unidades)
+
+    taxa_ausentes = rng.beta(TAXA_AUSENTES * CONCENTRACAO_TAXAS, (1 - TAXA_AUSENTES) * CONCENTRACAO_TAXAS, n_ensaios)
+    taxa_duplicacao = rng.beta(TAXA_DUPLICACAO * CONCENTRACAO_TAXAS, (1 - TAXA_DUPLICACAO) * CONCENTRACAO_TAXAS, n_ensaios)
+    variacao_preco = rng.lognormal(0.0, VARIACAO_PRECO, (n_ensaios, len(lista_materiais)))
+
+    valor_incorreto = valores['incorreto'].to_numpy()
+    valor_ausente = valores['ausente'].to_numpy()
+    valor_anomalias = valores['anomalias'].to_numpy()
+
+    # Duplicatas confirmadas entram como valor fixo; sem elas, a taxa é sorteada
+    if 'duplicado' in valores.columns:
+        duplicacao = np.broadcast_to(valores['duplicado'].to_numpy()[None, :], (n_ensaios, len(valores)))
+    else:
+        duplicacao = taxa_duplicacao[:, None] * valor_anomalias[None, :]
+
+    valor = (
+        valor_incorreto[None, :]
+        + taxa_ausentes[:, None] * valor_ausente[None, :]
+        + duplicacao
+    )
+    impacto = np.nan_to_num(variacao_preco[:, cod_material] * valor)
+
+    # Soma por material e por unidade via matrizes indicadoras (grupos x categorias)
+    por_material = impacto @ np.eye(len(lista_materiais))[cod_material]
+    por_unidade = impacto @ np.eye(len(lista_unidades))[cod_unidade]
+
+    baixo, alto = FAIXA_CUSTOS_INDIRETOS
+    indiretos = sum(
+        rng.triangular(custo * baixo, custo, custo * alto, n_ensaios)
+        for custo in CUSTOS_INDIRETOS.values()
+    )
+
+    return {
+        'materiais': lista_materiais,
+        'unidades': lista_unidades,
+        'por_material': por_material,
+        'por_unidade': por_unidade,
+        'direto': impacto.sum(axis=1),
+        'total': impacto.sum(axis=1) + indiretos,
+    }
+
+
+def faixas_percentis(amostras, nomes, percentis=PERCENTIS):
+    faixas = pd.DataFrame(
+        np.percentile(amostras, percentis, axis=0).T,
+        index=nomes,
+        columns=[f'p{p}' for p in percentis]
+    )
+    faixas['media'] = amostras.mean(axis=0)
+    return faixas
+
+
+def simular_impacto(df_metrics, n_ensaios=N_ENSAIOS, tamanho_lote=TAMANHO_LOTE, processos=None,
+                    seed=42, precos=precos_materiais):
+    grupos = agregar_por_grupo(df_metrics, por_dia=isinstance(precos, TabelaPrecos))
+
+    # Um gerador independente por lote, derivado da seed: o resultado não
+    # depende do número de processos
+    n_lotes = -(-n_ensaios // tamanho_lote)
+    sementes = np.random.SeedSequence(seed).spawn(n_lotes)
+    tamanhos = [min(tamanho_lote, n_ensaios - i * tamanho_lote) for i in range(n_lotes)]
+
+    with ProcessPoolExecutor(max_workers=processos or os.cpu_count()) as executor:
+        lotes = list(executor.map(
+            simular_lote,
+            [grupos] * n_lotes, [precos] * n_lotes, tamanhos, sementes
+        ))
+
+    materiais, unidades = lotes[0]['materiais'], lotes[0]['unidades']
+    totais = np.column_stack([
+        np.concatenate([lote['direto'] for lote in lotes]),
+        np.concatenate([lote['total'] for lote in lotes]),
+    ])
+    return {
+        'n_ensaios': n_ensaios,
+        'por_material': faixas_percentis(np.vstack([lote['por_material'] for lote in lotes]), materiais),
+        'por_unidade': faixas_percentis(np.vstack([lote['por_unidade'] for lote in lotes]), unidades),
+        'total': faixas_percentis(totais, ['Impacto direto', 'Impacto total (com indiretos)']),
+    }
+
+
+def escrever_relatorio(resultado, caminho=CAMINHO_RELATORIO):
+    def escrever_faixas(f, faixas):
+        for nome, linha in faixas.iterrows():
+            f.write(f"{nome}: R$ {linha['p50']:.2f} (P5 R$ {linha['p5']:.2f} - P95 R$ {linha['p95']:.2f})\n")
+
+    with open(caminho, 'w') as f:
+        f.write("SIMULAÇÃO DE MONTE CARLO DO IMPACTO FINANCEIRO\n")
+        f.write("==============================================\n\n")
+        f.write(f"Ensaios: {resultado['n_ensaios']}\n")
+        f.write("Valores: mediana (faixa de 90%)\n\n")
+
+        f.write("1. IMPACTO TOTAL\n")
+        escrever_faixas(f, resultado['total'])
+
+        f.write("\n2. IMPACTO POR MATERIAL\n")
+        escrever_faixas(f, resultado['por_material'])
+
+        f.write("\n3. IMPACTO POR UNIDADE\n")
+        escrever_faixas(f, resultado['por_unidade'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulação de Monte Carlo do impacto financeiro')
+    parser.add_argument('--entrada', default=CAMINHO_METRICAS)
+    parser.add_argument('--ensaios', type=int, default=N_ENSAIOS)
+    parser.add_argument('--tamanho-lote', type=int, default=TAMANHO_LOTE)
+    parser.add_argument('--processos', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--precos', default=None,
+                        help='Histórico de preços com vigência (ver precos.py); padrão: preços fixos por material')
+    args = parser.parse_args()
+
+    precos = TabelaPrecos.carregar(args.precos) if args.precos else precos_materiais
+    df_metrics = carregar(args.entrada)
+    if set(COLUNAS_REGISTRO) <= set(df_metrics.columns):
+        df_metrics = marcar_duplicatas(df_metrics)
+    resultado = simular_impacto(df_metrics, args.ensaios, args.tamanho_lote, args.processos, args.seed, precos)
+    escrever_relatorio(resultado)
+
+    print(resultado['total'])
+    print(resultado['por_material'])
+    print(resultado['por_unidade'])
+    print(f"\nRelatório salvo em '{CAMINHO_RELATORIO}'")
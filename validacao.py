@@ -0,0 +1,253 @@
+import argparse
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from armazenamento import eh_parquet, ler_em_blocos, salvar
+from deteccao_outliers import CAMINHO_DADOS
+from esquema import MATERIAIS_CADASTRADOS, TIPOS_CSV, TIPOS_OPERACAO, UNIDADES_CADASTRADAS, aplicar_esquema
+from instrumentacao import adicionar_argumentos, configurar_por_argumentos, finalizar_por_argumentos, medir
+
+CAMINHO_QUARENTENA = './quarentena.csv'
+TAMANHO_BLOCO = 1_000_000
+
+# Motor de validação da qualidade dos registros. As regras são declaradas
+# como dicionários (como as especificações de gráficos de renderizacao.py)
+# e compiladas uma vez em funções vetorizadas. Cada bloco do arquivo é
+# avaliado em uma única passada: as colunas usadas são extraídas uma vez
+# como arrays NumPy (códigos das categóricas, quantidade em float) e cada
+# regra liga o seu bit em uma máscara de violações por linha, no próprio
+# array (sem criar uma nova máscara por regra). As linhas com algum bit
+# ligado vão para o arquivo de quarentena.
+#
+# A leitura é tolerante: data e quantidade chegam do CSV como texto e são
+# convertidas com errors='coerce'. Valores ilegíveis viram nulos e caem em
+# data_ausente / quantidade_nula, em vez de abortar a leitura; a quarentena
+# guarda o texto original.
+#
+# Tipos de regra:
+#   nulo        a coluna é nula
+#   categorias  o valor não está entre os permitidos (nulo também viola)
+#   sinal       o sinal da quantidade contraria o esperado para o tipo
+#   limite      |quantidade| acima do limite do material (ou outra coluna)
+#   data_maxima data posterior à data de referência (padrão: hoje)
+
+# Sinal esperado da quantidade em cada tipo de operação
+SINAIS_POR_TIPO = {'entrada': 1, 'saida': -1}
+
+# Maior |quantidade| aceita em uma movimentação de cada material,
+# conforme a recomendação de limites por material da apresentação
+LIMITES_QUANTIDADE = {
+    'Seringa': 1000,
+    'Gaze': 1000,
+    'Tubo': 600,
+    'Medicamentos': 600,
+    'Esparadrapo': 800,
+}
+
+REGRAS = [
+    {'nome': 'sinal_inconsistente', 'tipo': 'sinal', 'coluna': 'quantidade', 'por': 'tipo',
+     'sinais': SINAIS_POR_TIPO, 'descricao': 'Sinal da quantidade incompatível com o tipo de operação'},
+    {'nome': 'quantidade_nula', 'tipo': 'nulo', 'coluna': 'quantidade',
+     'descricao': 'Quantidade ausente'},
+    {'nome': 'sem_responsavel', 'tipo': 'nulo', 'coluna': 'responsavel',
+     'descricao': 'Registro sem responsável'},
+    {'nome': 'data_ausente', 'tipo': 'nulo', 'coluna': 'data',
+     'descricao': 'Data ausente ou inválida'},
+    {'nome': 'data_futura', 'tipo': 'data_maxima', 'coluna': 'data',
+     'descricao': 'Data posterior à data da validação'},
+    {'nome': 'unidade_invalida', 'tipo': 'categorias', 'coluna': 'unidade', 'permitidas': UNIDADES_CADASTRADAS,
+     'descricao': 'Unidade fora do cadastro'},
+    {'nome': 'material_invalido', 'tipo': 'categorias', 'coluna': 'material', 'permitidas': MATERIAIS_CADASTRADOS,
+     'descricao': 'Material fora do cadastro'},
+    {'nome': 'tipo_invalido', 'tipo': 'categorias', 'coluna': 'tipo', 'permitidas': TIPOS_OPERACAO,
+     'descricao': 'Tipo de operação desconhecido'},
+    {'nome': 'quantidade_acima_limite', 'tipo': 'limite', 'coluna': 'quantidade', 'por': 'material',
+     'limites': LIMITES_QUANTIDADE, 'descricao': 'Quantidade acima do limite do material'},
+]
+
+TIPO_MASCARA = np.uint32  # Um bit por regra
+
+
+# Arrays de um bloco usados pelas regras. Categóricas viram (códigos,
+# categorias), com -1 nos nulos; a quantidade vira float64 com NaN
+def _extrair(df, colunas):
+    arrays = {}
+    for col in colunas:
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            arrays[col] = (serie.cat.codes.to_numpy(), serie.cat.categories)
+        elif col == 'data':
+            arrays[col] = serie.to_numpy(dtype='datetime64[ns]')
+        elif col == 'quantidade':
+            arrays[col] = serie.to_numpy(dtype='float64', na_value=np.nan)
+        else:
+            arrays[col] = serie.isna().to_numpy()
+    return arrays
+
+
+# Tabela de consulta indexada pelo código da categoria; a última posição
+# atende o código -1 (nulo)
+def _tabela_por_categoria(valores, padrao_nulo, dtype):
+    return np.append(np.asarray(valores, dtype=dtype), np.asarray(padrao_nulo, dtype=dtype))
+
+
+def _compilar_regra(regra, data_referencia):
+    tipo, coluna = regra['tipo'], regra['coluna']
+
+    if tipo == 'nulo':
+        def avaliar(arrays):
+            valores = arrays[coluna]
+            if isinstance(valores, tuple):
+                return valores[0] == -1
+            if valores.dtype.kind == 'M':
+                return np.isnat(valores)
+            if valores.dtype.kind == 'f':
+                return np.isnan(valores)
+            return valores  # Demais colunas já chegam como máscara de nulos
+        return [coluna], avaliar
+
+    if tipo == 'categorias':
+        permitidas = list(regra['permitidas'])
+
+        def avaliar(arrays):
+            codigos, categorias = arrays[coluna]
+            invalida = _tabela_por_categoria(~categorias.isin(permitidas), True, bool)
+            return invalida[codigos]
+        return [coluna], avaliar
+
+    if tipo == 'sinal':
+        por, sinais = regra['por'], regra['sinais']
+
+        def avaliar(arrays):
+            codigos, categorias = arrays[por]
+            esperado = _tabela_por_categoria([sinais.get(c, 0) for c in categorias], 0, 'float64')
+            # Quantidade nula, tipo nulo ou desconhecido (sinal 0) nunca violam
+            return np.multiply(esperado[codigos], arrays[coluna]) < 0
+        return [coluna, por], avaliar
+
+    if tipo == 'limite':
+        por, limites = regra['por'], regra['limites']
+
+        def avaliar(arrays):
+            codigos, categorias = arrays[por]
+            limite = _tabela_por_categoria([limites.get(c, np.inf) for c in categorias], np.inf, 'float64')
+            return np.abs(arrays[coluna]) > limite[codigos]
+        return [coluna, por], avaliar
+
+    if tipo == 'data_maxima':
+        maxima = np.datetime64(regra.get('maxima', data_referencia), 'ns')
+
+        def avaliar(arrays):
+            return arrays[coluna] > maxima  # NaT nunca é maior
+        return [coluna], avaliar
+
+    raise ValueError(f"Tipo de regra desconhecido: {tipo}")
+
+
+class Validador:
+    """Regras compiladas, prontas para avaliar blocos de registros.
+
+    O bit i da máscara de violações corresponde a `regras[i]`.
+    """
+
+    def __init__(self, regras=REGRAS, data_referencia=None):
+        if len(regras) > np.iinfo(TIPO_MASCARA).bits:
+            raise ValueError(f"No máximo {np.iinfo(TIPO_MASCARA).bits} regras")
+        data_referencia = data_referencia or date.today()
+        self.regras = list(regras)
+        self.colunas = []
+        self.avaliadores = []
+        for regra in self.regras:
+            colunas, avaliar = _compilar_regra(regra, data_referencia)
+            self.colunas += [c for c in colunas if c not in self.colunas]
+            self.avaliadores.append(avaliar)
+
+    # Máscara de violações de cada linha do bloco
+    def avaliar(self, df):
+        arrays = _extrair(df, self.colunas)
+        mascara = np.zeros(len(df), dtype=TIPO_MASCARA)
+        for bit, avaliar in enumerate(self.avaliadores):
+            np.bitwise_or(mascara, TIPO_MASCARA(1 << bit), out=mascara, where=avaliar(arrays))
+        return mascara
+
+    # Violações por regra em um conjunto de máscaras
+    def contar(self, mascara):
+        return np.array([np.count_nonzero(mascara & TIPO_MASCARA(1 << bit)) for bit in range(len(self.regras))])
+
+    # Nomes das regras violadas, separados por '|', para cada máscara
+    def descrever(self, mascara):
+        unicas, inverso = np.unique(mascara, return_inverse=True)
+        nomes = np.array([
+            '|'.join(r['nome'] for bit, r in enumerate(self.regras) if int(m) >> bit & 1) for m in unicas
+        ], dtype=object)
+        return nomes[inverso]
+
+
+# Blocos (tipados, como chegaram) do arquivo. No Parquet os tipos já foram
+# garantidos na gravação e os dois são o mesmo bloco
+def _ler_blocos_tolerante(caminho, tamanho_bloco):
+    if eh_parquet(caminho):
+        for bloco in ler_em_blocos(caminho, tamanho_bloco):
+            yield bloco, bloco
+        return
+    texto = {**TIPOS_CSV, 'data': str, 'quantidade': str}
+    for bruto in pd.read_csv(caminho, dtype=texto, chunksize=tamanho_bloco):
+        bloco = bruto.assign(data=pd.to_datetime(bruto['data'], format='ISO8601', errors='coerce'),
+                             quantidade=pd.to_numeric(bruto['quantidade'], errors='coerce'))
+        yield aplicar_esquema(bloco), bruto
+
+
+# Valida o arquivo bloco a bloco. As linhas com violações são anexadas à
+# quarentena (com a máscara e os nomes das regras); as válidas, se pedido,
+# a `caminho_validos`. Devolve o total de linhas e a contagem por regra
+def validar(caminho, caminho_quarentena=CAMINHO_QUARENTENA, caminho_validos=None, regras=REGRAS,
+            data_referencia=None, tamanho_bloco=TAMANHO_BLOCO):
+    validador = Validador(regras, data_referencia)
+    total = 0
+    violacoes = np.zeros(len(validador.regras), dtype='int64')
+    primeiro = True
+
+    for bloco, bruto in _ler_blocos_tolerante(caminho, tamanho_bloco):
+        mascara = validador.avaliar(bloco)
+        total += len(bloco)
+        violacoes += validador.contar(mascara)
+
+        invalida = mascara != 0
+        quarentena = bruto[invalida].assign(violacoes=mascara[invalida],
+                                            regras=validador.descrever(mascara[invalida]))
+        quarentena.to_csv(caminho_quarentena, mode='w' if primeiro else 'a', header=primeiro, index=False)
+        if caminho_validos:
+            salvar(bloco[~invalida], caminho_validos, anexar=not primeiro)
+        primeiro = False
+
+    relatorio = pd.DataFrame({
+        'regra': [r['nome'] for r in validador.regras],
+        'descricao': [r['descricao'] for r in validador.regras],
+        'violacoes': violacoes,
+    })
+    return total, relatorio
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Validação da qualidade dos registros de consumo')
+    parser.add_argument('--entrada', default=CAMINHO_DADOS)
+    parser.add_argument('--quarentena', default=CAMINHO_QUARENTENA, help='CSV com as linhas que violam alguma regra')
+    parser.add_argument('--validos', default=None, help='Grava também as linhas sem violações (CSV ou Parquet)')
+    parser.add_argument('--data-referencia', type=date.fromisoformat, default=None,
+                        help='Datas posteriores a esta (AAAA-MM-DD) são futuras; padrão: hoje')
+    parser.add_argument('--tamanho-bloco', type=int, default=TAMANHO_BLOCO)
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    configurar_por_argumentos(args)
+
+    with medir('validacao') as m:
+        total, relatorio = validar(args.entrada, args.quarentena, args.validos, REGRAS, args.data_referencia,
+                                   args.tamanho_bloco)
+        m['linhas'] = total
+
+    print(f"Registros validados: {total}")
+    print(relatorio.to_string(index=False))
+    print(f"\nLinhas com violações gravadas em '{args.quarentena}'")
+    finalizar_por_argumentos(args)